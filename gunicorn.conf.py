@@ -0,0 +1,20 @@
+"""gunicorn settings (picked up automatically from the working directory).
+
+With ``preload_app`` the project is imported and warmed up once in the master
+(``p2p.startup.warm_up``) and every worker is a ``fork()`` of it, so a worker
+added by the autoscaler is ready in milliseconds and shares the loaded code
+and read-only state with its siblings copy-on-write.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    # runs in the master after the app is loaded and before any worker is forked
+    if server.cfg.preload_app:
+        from p2p.startup import warm_up
+
+        warm_up()
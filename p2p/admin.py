@@ -1,5 +1,6 @@
-from django.contrib import admin
-from . import models
+from django.contrib import admin, messages
+from . import jobs, models
+from .pagination import EstimatedCountPaginator
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
@@ -22,22 +23,157 @@ class UserAdmin(DjangoUserAdmin):
 admin.site.register(User, UserAdmin)
 
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows.
+
+    Planner-estimated counts instead of COUNT(*), no second unfiltered count
+    and no per-choice filter counts.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+
 @admin.register(models.PurchaseRequest)
-class PurchaseRequestAdmin(admin.ModelAdmin):
+class PurchaseRequestAdmin(LargeTableAdmin):
     list_display = ('id', 'title', 'status', 'created_by', 'amount', 'created_at')
     list_filter = ('status',)
+    list_select_related = ('created_by',)
+    search_fields = ('=id', 'title')
+    ordering = ('-id',)
+    autocomplete_fields = ('created_by',)
+    actions = ('approve_selected', 'reject_selected')
+
+    def _enqueue(self, request, queryset, kind, verb):
+        ids = list(queryset.filter(status=models.PurchaseRequest.STATUS_PENDING).values_list('pk', flat=True))
+        if not ids:
+            self.message_user(request, 'No pending requests selected.', messages.WARNING)
+            return
+        job = jobs.enqueue(kind, ids, request.user)
+        self.message_user(request, f'Queued job #{job.pk} to {verb} {len(ids)} request(s) in the background.')
+
+    @admin.action(description='Approve selected pending requests (background)')
+    def approve_selected(self, request, queryset):
+        self._enqueue(request, queryset, models.BackgroundJob.KIND_APPROVE_REQUESTS, 'approve')
+
+    @admin.action(description='Reject selected pending requests (background)')
+    def reject_selected(self, request, queryset):
+        self._enqueue(request, queryset, models.BackgroundJob.KIND_REJECT_REQUESTS, 'reject')
 
 
 @admin.register(models.Approval)
-class ApprovalAdmin(admin.ModelAdmin):
+class ApprovalAdmin(LargeTableAdmin):
     list_display = ('id', 'purchase_request', 'approver', 'action', 'level', 'created_at')
+    list_select_related = ('purchase_request', 'approver')
+    autocomplete_fields = ('purchase_request', 'approver')
 
 
 @admin.register(models.PurchaseOrder)
-class PurchaseOrderAdmin(admin.ModelAdmin):
+class PurchaseOrderAdmin(LargeTableAdmin):
     list_display = ('po_number', 'purchase_request', 'vendor_name', 'total_amount', 'generated_at')
+    list_select_related = ('purchase_request',)
+    search_fields = ('=po_number', 'vendor_name')
+    ordering = ('-id',)
+    autocomplete_fields = ('purchase_request',)
+    actions = ('regenerate_pdf',)
+
+    @admin.action(description='Regenerate PO PDF (background)')
+    def regenerate_pdf(self, request, queryset):
+        ids = list(queryset.values_list('pk', flat=True))
+        job = jobs.enqueue(models.BackgroundJob.KIND_REGENERATE_PO_PDF, ids, request.user)
+        self.message_user(request, f'Queued job #{job.pk} to regenerate {len(ids)} PDF(s) in the background.')
 
 
 @admin.register(models.Receipt)
-class ReceiptAdmin(admin.ModelAdmin):
+class ReceiptAdmin(LargeTableAdmin):
     list_display = ('id', 'purchase_request', 'uploaded_by', 'validation_result', 'created_at')
+    list_select_related = ('purchase_request', 'uploaded_by')
+    autocomplete_fields = ('purchase_request', 'uploaded_by')
+
+
+@admin.register(models.BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'processed', 'failed', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    list_select_related = ('requested_by',)
+    readonly_fields = ('kind', 'object_ids', 'params', 'requested_by', 'processed', 'failed', 'errors', 'started_at', 'finished_at')
+
+
+@admin.register(models.OutboxEvent)
+class OutboxEventAdmin(LargeTableAdmin):
+    list_display = ('id', 'event_type', 'recipient', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status',)
+
+
+@admin.register(models.ProfileCapture)
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'method', 'route', 'status_code', 'user_role', 'duration_ms', 'trigger')
+    list_select_related = ('user',)
+    list_filter = ('trigger',)
+
+
+@admin.register(models.SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('origin', 'short_sql', 'calls', 'total_ms', 'mean_ms', 'max_ms', 'last_seen')
+    list_filter = ('origin',)
+    search_fields = ('sql', 'origin', 'fingerprint')
+    ordering = ('-total_ms',)
+    readonly_fields = [f.name for f in models.SlowQuery._meta.fields]
+
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(models.ArchivedPurchaseRequest)
+class ArchivedPurchaseRequestAdmin(LargeTableAdmin):
+    list_display = ('id', 'status', 'created_by', 'amount', 'created_at', 'archived_at')
+    list_select_related = ('created_by',)
+    exclude = ('payload',)
+    readonly_fields = ('id', 'status', 'created_by', 'amount', 'created_at', 'archived_at')
+
+
+@admin.register(models.AuditEvent)
+class AuditEventAdmin(LargeTableAdmin):
+    list_display = ('id', 'subject_type', 'subject_id', 'action', 'actor', 'created_at')
+    list_select_related = ('actor',)
+    list_filter = ('subject_type', 'action')
+    search_fields = ('=subject_id',)
+    ordering = ('-id',)
+    readonly_fields = [f.name for f in models.AuditEvent._meta.fields]
+
+    # append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.Upload)
+class UploadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'filename', 'owner', 'status', 'offset', 'size', 'created_at', 'expires_at')
+    list_select_related = ('owner',)
+    list_filter = ('status',)
+    exclude = ('block_digests',)
+    readonly_fields = [f.name for f in models.Upload._meta.fields if f.name != 'block_digests']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(models.Preview)
+class PreviewAdmin(admin.ModelAdmin):
+    list_display = ('source', 'status', 'pages', 'content_hash', 'rendered_at')
+    list_filter = ('status',)
+    search_fields = ('source', '=content_hash')
+    readonly_fields = [f.name for f in models.Preview._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
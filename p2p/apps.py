@@ -11,3 +11,8 @@ class P2PConfig(AppConfig):
             import p2p.signals  # noqa: F401
         except Exception:
             pass
+
+        from django.db.backends.signals import connection_created
+        from .querylog import install
+
+        connection_created.connect(install, dispatch_uid='p2p.querylog.install')
@@ -0,0 +1,88 @@
+"""Move closed purchase requests out of the hot tables.
+
+APPROVED/REJECTED requests older than the retention window are copied, with
+their items, approvals, receipts and PO, into ``ArchivedPurchaseRequest`` as
+one compressed JSON document each, then deleted from the live tables in the
+same transaction. Uploaded files stay where they are; the archive keeps
+their storage names.
+"""
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from . import models, serializers
+
+CLOSED_STATUSES = (models.PurchaseRequest.STATUS_APPROVED, models.PurchaseRequest.STATUS_REJECTED)
+# stored fields only: preview URLs stop working once the live row is gone, and
+# likely duplicates are computed on create/update
+ARCHIVED_FIELDS = (
+    'id', 'title', 'description', 'amount', 'currency', 'status', 'current_level', 'required_approval_levels',
+    'created_by', 'items', 'proforma', 'created_at',
+)
+ARCHIVED_PO_FIELDS = ('id', 'po_number', 'vendor_name', 'items', 'total_amount', 'generated_at', 'po_document')
+
+
+def build_payload(pr):
+    data = dict(serializers.PurchaseRequestSerializer(pr, fields=ARCHIVED_FIELDS).data)
+    data['proforma'] = pr.proforma.name if pr.proforma else None
+    data['approvals'] = serializers.ApprovalSerializer(pr.approvals.all(), many=True).data
+    data['receipts'] = [
+        {
+            'id': r.pk,
+            'uploaded_by': r.uploaded_by_id,
+            'file': r.file.name,
+            'extracted_data': r.extracted_data,
+            'validation_result': r.validation_result,
+            'notes': r.notes,
+            'created_at': r.created_at,
+        }
+        for r in pr.receipts.all()
+    ]
+    po = getattr(pr, 'purchase_order', None)
+    if po is not None:
+        data['purchase_order'] = dict(serializers.PurchaseOrderSerializer(po, fields=ARCHIVED_PO_FIELDS).data)
+        data['purchase_order']['po_document'] = po.po_document.name if po.po_document else None
+    data['archived'] = True
+    return zlib.compress(json.dumps(data, cls=DjangoJSONEncoder).encode(), 6)
+
+
+def archive_batch(cutoff, batch_size=500):
+    """Archive up to ``batch_size`` closed requests created before ``cutoff``."""
+    with transaction.atomic():
+        prs = list(
+            models.PurchaseRequest.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status__in=CLOSED_STATUSES, created_at__lt=cutoff)
+            .select_related('created_by', 'purchase_order')
+            .prefetch_related('items', Prefetch('approvals', queryset=models.Approval.objects.select_related('approver')), 'receipts')
+            .order_by('id')[:batch_size]
+        )
+        if not prs:
+            return 0
+        models.ArchivedPurchaseRequest.objects.bulk_create([
+            models.ArchivedPurchaseRequest(
+                id=pr.pk, created_by_id=pr.created_by_id, status=pr.status,
+                amount=pr.amount, created_at=pr.created_at, payload=build_payload(pr),
+            )
+            for pr in prs
+        ])
+        models.PurchaseRequest.objects.filter(pk__in=[pr.pk for pr in prs]).delete()
+    return len(prs)
+
+
+def archive(retention_days=None, batch_size=500, max_batches=None):
+    retention_days = retention_days if retention_days is not None else settings.ARCHIVE_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        done = archive_batch(cutoff, batch_size)
+        if not done:
+            break
+        total += done
+        batches += 1
+    return total
@@ -0,0 +1,144 @@
+"""Async variants of the read and file-serving endpoints, for ASGI deployments.
+
+Enabled with ``ASYNC_VIEWS=1`` (see README, "ASGI deployment"). The viewsets
+subclass the synchronous ones in ``p2p.views``, so permissions, visibility
+rules (``get_queryset``), sparse fieldsets and serializer output are shared;
+only ``list``/``retrieve``, ``download`` and ``submit_receipt`` are
+coroutines. The remaining actions (create, approve, ...) still run as sync
+handlers in a worker thread.
+
+Lazy relation access from sync code would raise ``SynchronousOnlyOperation``
+here, so the caller's profile is loaded up front (``_aload_profile``) and all
+queries go through the async ORM API.
+"""
+import asyncio
+import mimetypes
+import os
+
+from adrf import viewsets as async_viewsets
+from adrf.decorators import api_view
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.decorators import action, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+
+from . import models, serializers, uploads, views
+from .throttling import concurrency_limited
+
+
+async def _aload_profile(user):
+    """Cache ``user.profile`` (or its absence) on the instance."""
+    if not user.is_authenticated:
+        return
+    descriptor = type(user).profile
+    if descriptor.is_cached(user):
+        return
+    profile = await models.UserProfile.objects.filter(user_id=user.pk).afirst()
+    descriptor.related.set_cached_value(user, profile)
+
+
+async def _aiter_file(path, chunk_size=FileResponse.block_size):
+    """Read ``path`` in chunks off the event loop."""
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+@extend_schema(responses=serializers.HealthSerializer, description='Public health check')
+@api_view(['GET'])
+@permission_classes([AllowAny])
+async def health_check(request):
+    """Simple health check for load balancers and uptime monitors."""
+    return Response({'status': 'ok', 'service': 'procure-to-pay'})
+
+
+@extend_schema(responses=serializers.UserSerializer)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def me(request):
+    """Return authenticated user info including role."""
+    await _aload_profile(request.user)
+    return Response(serializers.UserSerializer(request.user).data)
+
+
+class AsyncReadMixin:
+    """Async ``list``/``retrieve`` for a sparse-fieldset viewset."""
+
+    async def list(self, request, *args, **kwargs):
+        await _aload_profile(request.user)
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return await self.get_apaginated_response(self.get_serializer(page, many=True).data)
+        objects = [obj async for obj in queryset]
+        return Response(self.get_serializer(objects, many=True).data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        await _aload_profile(request.user)
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
+
+
+class PurchaseRequestViewSet(AsyncReadMixin, async_viewsets.GenericViewSet, views.PurchaseRequestViewSet):
+
+    async def retrieve(self, request, *args, **kwargs):
+        try:
+            return await super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archived = await views._archived_requests(request.user, kwargs.get('pk')).afirst()
+            if archived is None:
+                raise
+            return Response(archived.data)
+
+    @action(detail=True, methods=['post'], url_path='submit-receipt')
+    @concurrency_limited('cpu')
+    async def submit_receipt(self, request, pk=None):
+        await _aload_profile(request.user)
+        pr = await self.aget_object()
+        if pr.status != models.PurchaseRequest.STATUS_APPROVED:
+            return Response({'detail': 'Receipt can only be submitted for approved requests'}, status=status.HTTP_400_BAD_REQUEST)
+        # the ASGI handler has already spooled the body; parsing the multipart
+        # stream and copying the file into storage happen in a worker thread
+        file_obj = await sync_to_async(request.FILES.get)('receipt')
+        upload_id = request.data.get('upload')
+        if not file_obj and not upload_id:
+            return Response({'detail': 'No receipt file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        # the receipt and its audit event are written in one transaction
+        try:
+            receipt = await sync_to_async(views._create_receipt)(pr, request.user, file_obj, upload_id)
+        except uploads.UploadError as exc:
+            return Response({'detail': exc.detail}, status=exc.status)
+        return Response({'detail': 'Receipt submitted', 'receipt_id': receipt.pk}, status=status.HTTP_201_CREATED)
+
+
+class PurchaseOrderViewSet(AsyncReadMixin, async_viewsets.GenericViewSet, views.PurchaseOrderViewSet):
+
+    @action(detail=True, methods=['get'], url_path='download')
+    @concurrency_limited('cpu')
+    async def download(self, request, pk=None):
+        """Return the PO PDF; generate it if not present."""
+        await _aload_profile(request.user)
+        po = await self.aget_object()
+        if not po.po_document:
+            await sync_to_async(po.generate_pdf)()
+
+        fpath = po.po_document.path
+        filename = os.path.basename(fpath)
+        size = await asyncio.to_thread(os.path.getsize, fpath)
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        # an async iterator, so the ASGI handler streams the file instead of
+        # buffering a sync iterator into memory
+        response = StreamingHttpResponse(_aiter_file(fpath), content_type=content_type)
+        response['Content-Length'] = str(size)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
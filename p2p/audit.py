@@ -0,0 +1,65 @@
+"""Audit trail for purchase requests and role changes.
+
+``record`` is called inside the transaction that makes the change, like
+``outbox.enqueue``, so an event is stored if and only if the change commits.
+It is a single INSERT with no extra reads. Events carry only what changed:
+``{field: [old, new]}``, plus a few context keys (``level``, ``comment``,
+``receipt_id``). Replaced items are stored as the rows removed and added, or
+only as counts once either list is longer than ``ITEMS_DIFF_LIMIT``.
+"""
+from collections import Counter
+
+from django.db.models.fields.files import FieldFile
+
+from .models import AuditEvent
+
+ITEMS_DIFF_LIMIT = 50
+ITEM_FIELDS = ('description', 'quantity', 'unit_price')
+
+
+def _plain(value):
+    if isinstance(value, FieldFile):
+        return value.name or None
+    return value
+
+
+def snapshot(instance, fields):
+    return {field: _plain(getattr(instance, field)) for field in fields}
+
+
+def diff(old, new):
+    """``{field: [old, new]}`` for the fields whose value changed."""
+    return {field: [old.get(field), value] for field, value in new.items() if old.get(field) != value}
+
+
+def item_rows(queryset):
+    """``(rows, count)`` of the items in ``queryset``; rows only up to the diff limit."""
+    rows = list(queryset.order_by('pk').values_list(*ITEM_FIELDS)[:ITEMS_DIFF_LIMIT + 1])
+    if len(rows) > ITEMS_DIFF_LIMIT:
+        return [], queryset.count()
+    return rows, len(rows)
+
+
+def items_diff(old_rows, old_count, new_rows, new_count):
+    if old_count > ITEMS_DIFF_LIMIT or new_count > ITEMS_DIFF_LIMIT:
+        return {'count': [old_count, new_count]}
+    old, new = Counter(old_rows), Counter(new_rows)
+    changes = {}
+    removed, added = list((old - new).elements()), list((new - old).elements())
+    if removed:
+        changes['removed'] = removed
+    if added:
+        changes['added'] = added
+    return changes
+
+
+def record(subject_type, subject_id, action, actor=None, changes=None):
+    if actor is not None and not actor.is_authenticated:
+        actor = None
+    return AuditEvent.objects.create(
+        subject_type=subject_type, subject_id=subject_id, action=action, actor=actor, changes=changes or {}
+    )
+
+
+def record_request(pr, action, actor=None, changes=None):
+    return record(AuditEvent.SUBJECT_REQUEST, pr.pk, action, actor, changes)
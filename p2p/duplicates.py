@@ -0,0 +1,320 @@
+"""Near-duplicate purchase requests: MinHash fingerprints and an LSH index.
+
+A request is reduced to a set of features:
+- the words of its title;
+- the words of each item description;
+- each item as ``normalized description|quantity``;
+- its currency and amount, in ``AMOUNT_STEP`` (5%) logarithmic steps;
+- the content hash of its proforma, if it has one.
+
+The MinHash signature takes, for each of ``NUM_PERM`` hash functions, the
+minimum hash over the features. The fraction of equal slots in two
+signatures estimates the Jaccard similarity of their feature sets.
+
+The signature is cut into ``BANDS`` bands of ``ROWS`` slots. Each band is
+hashed into one ``FingerprintBand`` row, keyed by ``(band, hash)``. Two
+requests that share any band row are candidates. With 16 bands of 4 rows,
+requests with similarity 0.7 become candidates with probability 0.99, and
+requests with similarity 0.3 with probability 0.12. The proforma hash gets a
+band of its own, so the same proforma file always matches. Finding
+candidates costs one index scan per band, whatever the number of requests.
+Candidates are then checked against:
+- ``DUPLICATE_SIMILARITY``;
+- the currency;
+- ``DUPLICATE_AMOUNT_TOLERANCE`` on the amount.
+
+``index`` runs in the create/update transaction and returns the likely
+duplicates for the response. It does not read files there: a finalized
+upload brings its hash, and a proforma sent in the request body is added by
+``index_proforma`` once its preview task has hashed it, after the commit. ``manage.py find_duplicate_requests``
+fingerprints requests created before this existed and reports duplicate
+clusters. Archived requests leave the index with their live rows.
+"""
+import hashlib
+import math
+import random
+import re
+import struct
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import FingerprintBand, PurchaseRequest, RequestFingerprint
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+PROFORMA_BAND = BANDS
+AMOUNT_STEP = math.log(1.05)
+MAX_CANDIDATES = 200
+MAX_RESULTS = 5
+
+_MERSENNE = (1 << 61) - 1
+# fixed seed: signatures stored in the database must stay comparable
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+_SIGNATURE = struct.Struct(f'>{NUM_PERM}Q')
+_WORD = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    return _WORD.findall((text or '').lower())
+
+
+def features(title, currency, amount, items, proforma_hash=''):
+    """Feature set of a request; ``items`` yields ``(description, quantity, ...)`` rows."""
+    result = {'t:' + word for word in words(title)}
+    for description, quantity, *_ in items:
+        item_words = words(description)
+        result.update('d:' + word for word in item_words)
+        result.add(f'i:{" ".join(item_words)}|{quantity}')
+    step = round(math.log(amount) / AMOUNT_STEP) if amount and amount > 0 else 0
+    result.add(f'a:{currency}:{step}')
+    if proforma_hash:
+        result.add('p:' + proforma_hash)
+    return result
+
+
+def _base_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'big') % _MERSENNE
+
+
+def signature(feature_set):
+    """MinHash signature of a non-empty feature set, as ``NUM_PERM`` integers."""
+    bases = [_base_hash(feature) for feature in feature_set]
+    return [min((a * x + b) % _MERSENNE for x in bases) for a, b in _PERMUTATIONS]
+
+
+def pack(sig):
+    return _SIGNATURE.pack(*sig)
+
+
+def unpack(data):
+    return _SIGNATURE.unpack(bytes(data))
+
+
+def similarity(sig, other):
+    return sum(1 for x, y in zip(sig, other) if x == y) / NUM_PERM
+
+
+def _signed64(digest):
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def _band_hash(sig, band):
+    rows = struct.pack(f'>{ROWS}Q', *sig[band * ROWS:(band + 1) * ROWS])
+    return _signed64(hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest())
+
+
+def band_hashes(sig, proforma_hash=''):
+    """``[(band, hash)]`` of a signature: the LSH index keys of a request."""
+    keys = [(band, _band_hash(sig, band)) for band in range(BANDS)]
+    if proforma_hash:
+        keys.append((PROFORMA_BAND, _signed64(bytes.fromhex(proforma_hash))))
+    return keys
+
+
+def _key_filter(keys):
+    match = Q()
+    for band, value in keys:
+        match |= Q(band=band, hash=value)
+    return match
+
+
+def candidates(keys, exclude=None):
+    """Ids of indexed requests sharing an LSH key, most shared keys first."""
+    rows = FingerprintBand.objects.filter(_key_filter(keys))
+    if exclude is not None:
+        rows = rows.exclude(purchase_request=exclude)
+    return list(
+        rows.values('purchase_request').annotate(shared=Count('band')).order_by('-shared', '-purchase_request')
+        .values_list('purchase_request', flat=True)[:MAX_CANDIDATES]
+    )
+
+
+def is_close_amount(amount, other):
+    tolerance = settings.DUPLICATE_AMOUNT_TOLERANCE
+    return abs(amount - other) <= max(abs(amount), abs(other)) * Decimal(str(tolerance))
+
+
+def matches(pr, sig, proforma_hash, candidate_ids, visible=None):
+    """The candidates that are likely duplicates of ``pr``, most similar first;
+    only those in the ``visible`` requests queryset, if given."""
+    found = []
+    rows = RequestFingerprint.objects.filter(purchase_request__in=candidate_ids)
+    if visible is not None:
+        rows = rows.filter(purchase_request__in=visible.order_by().values('pk'))
+    rows = (
+        rows
+        .select_related('purchase_request').only(
+            'signature', 'proforma_hash', 'purchase_request__status', 'purchase_request__amount',
+            'purchase_request__currency', 'purchase_request__created_at',
+        )
+    )
+    for fingerprint in rows:
+        other = fingerprint.purchase_request
+        same_proforma = bool(proforma_hash) and fingerprint.proforma_hash == proforma_hash
+        score = similarity(sig, unpack(fingerprint.signature))
+        if not same_proforma and (
+            score < settings.DUPLICATE_SIMILARITY or other.currency != pr.currency or not is_close_amount(pr.amount, other.amount)
+        ):
+            continue
+        found.append({
+            'id': other.pk, 'status': other.status, 'amount': other.amount, 'currency': other.currency,
+            'created_at': other.created_at, 'similarity': round(score, 2), 'same_proforma': same_proforma,
+        })
+    found.sort(key=lambda row: (row['same_proforma'], row['similarity'], row['id']), reverse=True)
+    return found
+
+
+def index(pr, items, proforma_hash='', new=False, visible=None):
+    """Fingerprint ``pr``, replace its LSH keys and return its likely duplicates.
+
+    ``items`` yields the request's ``(description, quantity, unit_price)``
+    rows; ``new`` says ``pr`` was just created and has no keys to replace;
+    ``visible`` limits the duplicates returned to the requests the caller may
+    read. Call it inside the transaction that saves the request.
+    """
+    sig = signature(features(pr.title, pr.currency, pr.amount, items, proforma_hash))
+    keys = band_hashes(sig, proforma_hash)
+    if new:
+        RequestFingerprint.objects.create(purchase_request=pr, signature=pack(sig), proforma_hash=proforma_hash)
+    else:
+        RequestFingerprint.objects.update_or_create(
+            purchase_request=pr, defaults={'signature': pack(sig), 'proforma_hash': proforma_hash},
+        )
+        FingerprintBand.objects.filter(purchase_request=pr).delete()
+    FingerprintBand.objects.bulk_create([FingerprintBand(purchase_request=pr, band=band, hash=value) for band, value in keys])
+    return matches(pr, sig, proforma_hash, candidates(keys, exclude=pr.pk), visible)[:MAX_RESULTS]
+
+
+def find(pr, visible=None):
+    """Likely duplicates of an already indexed request (``[]`` if it is not
+    indexed), limited to the ``visible`` requests if given."""
+    fingerprint = RequestFingerprint.objects.filter(purchase_request=pr).first()
+    if fingerprint is None:
+        return []
+    sig = unpack(fingerprint.signature)
+    keys = band_hashes(sig, fingerprint.proforma_hash)
+    return matches(pr, sig, fingerprint.proforma_hash, candidates(keys, exclude=pr.pk), visible)[:MAX_RESULTS]
+
+
+def item_rows(pr):
+    """Stored items of ``pr``, streamed, as ``index`` takes them."""
+    return pr.items.order_by().values_list('description', 'quantity', 'unit_price').iterator(chunk_size=2000)
+
+
+def proforma_hash_of(pr, read=True):
+    """Content hash of ``pr``'s proforma: from its preview if recorded, else
+    read from storage (``''`` instead with ``read=False``)."""
+    from .models import Preview
+    from .uploads import content_hash
+
+    if not pr.proforma:
+        return ''
+    known = Preview.objects.filter(source=pr.proforma.name).exclude(content_hash='').values_list('content_hash', flat=True).first()
+    if known or not read:
+        return known or ''
+    try:
+        with pr.proforma.open('rb') as f:
+            return content_hash(f)
+    except OSError:
+        return ''
+
+
+def index_proforma(source, content_hash):
+    """Re-index the fingerprinted requests whose proforma is the stored file
+    ``source`` with its ``content_hash``; called by the preview task."""
+    if not source.startswith(PurchaseRequest._meta.get_field('proforma').upload_to):
+        # receipts, PO documents, and finalized uploads, which were indexed with their hash
+        return
+    ids = list(
+        RequestFingerprint.objects.filter(purchase_request__proforma=source).exclude(proforma_hash=content_hash)
+        .values_list('purchase_request', flat=True)
+    )
+    for pk in ids:
+        with transaction.atomic():
+            pr = PurchaseRequest.objects.select_for_update().filter(pk=pk, proforma=source).first()
+            if pr is not None:
+                index(pr, item_rows(pr), content_hash)
+
+
+def clusters(pair_batch=5000):
+    """Groups of indexed requests that are likely duplicates of each other.
+
+    Streams the LSH index in key order, checks the pairs within each bucket
+    and joins the confirmed ones (union-find). Returns lists of ids, largest
+    group first.
+    """
+    parent = {}
+
+    def root(pk):
+        while parent.setdefault(pk, pk) != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    pairs, bucket, members = set(), None, []
+
+    def close_bucket():
+        # a bucket holding thousands of requests (a template everyone copies) is cut to the first MAX_CANDIDATES
+        head = members[:MAX_CANDIDATES]
+        pairs.update((a, b) for i, a in enumerate(head) for b in head[i + 1:])
+
+    rows = FingerprintBand.objects.order_by('band', 'hash', 'purchase_request').values_list('band', 'hash', 'purchase_request')
+    for band, value, pk in rows.iterator(chunk_size=5000):
+        if (band, value) != bucket:
+            close_bucket()
+            bucket, members = (band, value), []
+            if len(pairs) >= pair_batch:
+                _join(pairs, root, parent)
+                pairs.clear()
+        members.append(pk)
+    close_bucket()
+    _join(pairs, root, parent)
+
+    groups = defaultdict(list)
+    for pk in parent:
+        groups[root(pk)].append(pk)
+    return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=lambda group: (-len(group), group[0]))
+
+
+def _join(pairs, root, parent):
+    pairs = [(a, b) for a, b in pairs if root(a) != root(b)]
+    ids = {pk for pair in pairs for pk in pair}
+    rows = {
+        fingerprint.purchase_request_id: fingerprint
+        for fingerprint in RequestFingerprint.objects.filter(purchase_request__in=ids).select_related('purchase_request')
+        .only('signature', 'proforma_hash', 'purchase_request__amount', 'purchase_request__currency')
+    }
+    for a, b in pairs:
+        if a not in rows or b not in rows or root(a) == root(b):
+            continue
+        first, second = rows[a], rows[b]
+        same_proforma = bool(first.proforma_hash) and first.proforma_hash == second.proforma_hash
+        pr, other = first.purchase_request, second.purchase_request
+        if same_proforma or (
+            similarity(unpack(first.signature), unpack(second.signature)) >= settings.DUPLICATE_SIMILARITY
+            and pr.currency == other.currency and is_close_amount(pr.amount, other.amount)
+        ):
+            parent[root(a)] = root(b)
+
+
+def fingerprint_missing(all_requests=False, batch_size=500):
+    """Index the requests that have no fingerprint (every request with ``all_requests``)."""
+    queryset = PurchaseRequest.objects.order_by('pk')
+    if not all_requests:
+        queryset = queryset.filter(fingerprint__isnull=True)
+    done, last = 0, 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return done
+        for pr in batch:
+            with transaction.atomic():
+                index(pr, item_rows(pr), proforma_hash_of(pr))
+        done += len(batch)
+        last = batch[-1].pk
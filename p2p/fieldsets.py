@@ -0,0 +1,118 @@
+"""Sparse fieldsets (`?fields=`) and expansions (`?expand=`) for read endpoints.
+
+The selected fields prune both the serializer output and the SQL: only the
+columns backing those fields are loaded, FK/one-to-one sources are joined
+with `select_related`, and to-many fields (e.g. PR items) are prefetched
+only when they are actually rendered.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from drf_spectacular.utils import OpenApiParameter
+
+
+FIELDSET_PARAMETERS = [
+    OpenApiParameter('fields', str, description='Comma-separated list of fields to return.'),
+    OpenApiParameter('expand', str, description='Comma-separated list of nested fields to include (e.g. `items`).'),
+]
+
+
+class SparseFieldsetSerializerMixin:
+    """Accepts a `fields` kwarg and drops every other field."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def _csv_param(request, name):
+    raw = request.query_params.get(name)
+    if raw is None:
+        return None
+    return [part.strip() for part in raw.split(',') if part.strip()]
+
+
+class SparseFieldsetMixin:
+    """ViewSet mixin; must come before the DRF viewset class in the bases.
+
+    `list` uses `summary_serializer_class` unless `fields`/`expand` is given.
+    Names in `expandable_fields` are left out of the summary and only rendered
+    when requested through `expand` (or listed explicitly in `fields`).
+    """
+
+    summary_serializer_class = None
+    expandable_fields = ()
+    sparse_actions = ('list', 'retrieve')
+
+    def _is_sparse_action(self):
+        return self.request is not None and getattr(self, 'action', None) in self.sparse_actions
+
+    def get_selected_fields(self):
+        if not self._is_sparse_action():
+            return None
+        requested = _csv_param(self.request, 'fields')
+        expand = [name for name in (_csv_param(self.request, 'expand') or []) if name in self.expandable_fields]
+        if requested is None and not expand:
+            return None
+        if requested is None:
+            if self.action == 'list' and self.summary_serializer_class is not None:
+                requested = list(self.summary_serializer_class.Meta.fields)
+            else:
+                requested = list(super().get_serializer_class().Meta.fields)
+        return set(requested) | set(expand)
+
+    def get_serializer_class(self):
+        if (
+            self._is_sparse_action()
+            and self.action == 'list'
+            and self.summary_serializer_class is not None
+            and self.get_selected_fields() is None
+        ):
+            return self.summary_serializer_class
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_selected_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self._is_sparse_action():
+            return queryset
+        return prune_queryset(queryset, self.get_serializer().fields)
+
+
+def prune_queryset(queryset, serializer_fields):
+    """Restrict `queryset` to the columns and relations `serializer_fields` read."""
+    opts = queryset.model._meta
+    only, related, prefetch = {opts.pk.name}, set(), set()
+    for field in serializer_fields.values():
+        if field.write_only:
+            continue
+        source = getattr(field, 'source', None) or ''
+        if source == '*':
+            return queryset
+        parts = source.split('.')
+        try:
+            model_field = opts.get_field(parts[0])
+        except FieldDoesNotExist:
+            # computed attribute; we cannot tell which columns it needs
+            return queryset
+        if model_field.many_to_many or model_field.one_to_many:
+            prefetch.add(parts[0])
+        elif model_field.is_relation and len(parts) > 1:
+            related.add(parts[0])
+            if model_field.concrete:
+                only.add(parts[0])
+            only.add('__'.join(parts[:2]))
+        else:
+            only.add(parts[0])
+    queryset = queryset.only(*only)
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
@@ -0,0 +1,176 @@
+"""Query-string filtering and ordering for list endpoints, limited to what an
+index can serve.
+
+A viewset declares ``filter_fields`` (query parameter -> ``(field path,
+lookup)``) and ``ordering_fields`` (names accepted by ``?ordering=``, with an
+optional ``-``). ``IndexedFilterBackend`` applies them on ``list`` only, after
+the viewset's ``get_queryset`` has applied its visibility rules.
+
+A combination is accepted only if one B-tree index on the table can serve it:
+the equality filters form a prefix of the index columns, and a range filter
+and/or the ordering is on the next column. Without ``?ordering=`` the
+ordering checked is the queryset's own (``order_by``, else ``Meta.ordering``).
+The indexes are read from the model (``Meta.indexes``, unique constraints,
+primary key and ``db_index``/foreign key columns), so adding an index enables
+the combinations it supports. Filters across a relation (``profile__role``) are
+checked against the related table's indexes.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+RANGE_LOOKUPS = ('gt', 'gte', 'lt', 'lte')
+ORDERING_PARAM = 'ordering'
+
+
+def model_indexes(model):
+    """Column tuples of the B-tree indexes on ``model``'s table, leading column first."""
+    opts = model._meta
+    indexes = [tuple(name.lstrip('-') for name in index.fields) for index in opts.indexes if index.fields]
+    indexes += [tuple(fields) for fields in opts.unique_together]
+    indexes += [
+        tuple(constraint.fields) for constraint in opts.constraints
+        if isinstance(constraint, models.UniqueConstraint) and constraint.fields and constraint.condition is None
+    ]
+    for field in opts.concrete_fields:
+        if field.primary_key or field.unique or field.db_index:
+            indexes.append((field.name,))
+    return indexes
+
+
+def index_supports(indexes, equal=(), range_column=None, order_column=None):
+    """Whether one of ``indexes`` serves equality on ``equal``, a range on
+    ``range_column`` and ordering by ``order_column``."""
+    equal = set(equal)
+    if range_column and order_column and range_column != order_column:
+        return False
+    following = range_column or order_column
+    for columns in indexes:
+        prefix, rest = columns[:len(equal)], columns[len(equal):]
+        if set(prefix) != equal:
+            continue
+        if following is None or (rest and rest[0] == following):
+            return True
+    return False
+
+
+def _related_model(model, relations):
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model
+
+
+def _resolve(model, path):
+    """(model, field) for a ``field`` or ``relation__field`` path."""
+    *relations, name = path.split('__')
+    model = _related_model(model, relations)
+    return model, model._meta.get_field(name)
+
+
+def _clean(field, raw):
+    value = field.clean(raw, None)
+    if isinstance(field, models.DateTimeField) and settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def effective_ordering(queryset):
+    """Leading ``order_by`` term ``queryset`` is sorted by without ``?ordering=``:
+    its own ``order_by``, else the model's ``Meta.ordering`` (``None`` if unordered)."""
+    query = queryset.query
+    terms = query.order_by or (query.default_ordering and queryset.model._meta.ordering) or ()
+    term = terms[0] if terms else None
+    if term is None or not isinstance(term, str):
+        return None
+    return queryset.model._meta.pk.name if term.lstrip('-') == 'pk' else term
+
+
+class IndexedFilterBackend(BaseFilterBackend):
+    """Filters and ordering declared on the view, restricted to indexed combinations."""
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, 'action', None) != 'list':
+            return queryset
+        filter_fields = getattr(view, 'filter_fields', {})
+        lookups, errors = {}, {}
+        for param, (path, lookup) in filter_fields.items():
+            raw = request.query_params.get(param)
+            if raw in (None, ''):
+                continue
+            field = _resolve(queryset.model, path)[1]
+            try:
+                lookups[param] = (path, lookup, _clean(field, raw))
+            except DjangoValidationError as exc:
+                errors[param] = exc.messages
+
+        ordering = request.query_params.get(ORDERING_PARAM) or None
+        if ordering and ordering.lstrip('-') not in getattr(view, 'ordering_fields', ()):
+            errors[ORDERING_PARAM] = [f'Allowed values: {", ".join(getattr(view, "ordering_fields", ())) or "none"}.']
+        if errors:
+            raise ValidationError(errors)
+
+        self.check_indexes(queryset.model, lookups.values(), ordering or effective_ordering(queryset))
+        queryset = queryset.filter(**{f'{path}__{lookup}': value for path, lookup, value in lookups.values()})
+        if ordering:
+            queryset = queryset.order_by(ordering)
+        return queryset
+
+    def check_indexes(self, model, lookups, ordering):
+        tables = {}
+        for path, lookup, _ in lookups:
+            *relations, column = path.split('__')
+            table = tables.setdefault('__'.join(relations), {'equal': set(), 'range': set(), 'paths': []})
+            table['range' if lookup in RANGE_LOOKUPS else 'equal'].add(column)
+            table['paths'].append(path)
+        order_column = ordering.lstrip('-') if ordering else None
+        if order_column and '' not in tables:
+            tables[''] = {'equal': set(), 'range': set(), 'paths': []}
+        for relation, table in tables.items():
+            table_model = _related_model(model, relation.split('__')) if relation else model
+            supported = len(table['range']) <= 1 and index_supports(
+                model_indexes(table_model),
+                table['equal'],
+                next(iter(table['range']), None),
+                order_column if not relation else None,
+            )
+            if not supported:
+                filtered = ', '.join(sorted(set(table['paths']))) or 'nothing'
+                detail = f'No index supports filtering on {filtered}'
+                if order_column and not relation:
+                    detail += f' ordered by {order_column}'
+                raise ValidationError({'detail': detail + '. Drop a filter or change the ordering.'})
+
+    def get_schema_operation_parameters(self, view):
+        if getattr(view, 'action', None) not in (None, 'list'):
+            return []
+        model = view.queryset.model
+        parameters = []
+        for param, (path, lookup) in getattr(view, 'filter_fields', {}).items():
+            field = _resolve(model, path)[1]
+            schema = {'type': 'string'}
+            if isinstance(field, models.DecimalField):
+                schema = {'type': 'string', 'format': 'decimal'}
+            elif isinstance(field, models.DateTimeField):
+                schema = {'type': 'string', 'format': 'date-time'}
+            if field.choices:
+                schema['enum'] = [value for value, _ in field.choices]
+            parameters.append({
+                'name': param,
+                'required': False,
+                'in': 'query',
+                'description': f'{path.replace("__", ".")} {lookup}',
+                'schema': schema,
+            })
+        ordering_fields = getattr(view, 'ordering_fields', ())
+        if ordering_fields:
+            parameters.append({
+                'name': ORDERING_PARAM,
+                'required': False,
+                'in': 'query',
+                'description': 'Sort by one of the listed fields; prefix with - for descending.',
+                'schema': {'type': 'string', 'enum': [name for field in ordering_fields for name in (field, f'-{field}')]},
+            })
+        return parameters
@@ -0,0 +1,316 @@
+"""Streaming parse and columnar validation of purchase request line items.
+
+A PR can carry tens of thousands of items, sent as a JSON list (JSON body),
+a JSON string (multipart field) or a JSON file part (multipart ``items``
+upload, spooled to disk by Django). ``iter_json_array`` decodes the array
+one element at a time from any of those, ``batches`` groups the elements, and
+``validate_batch`` checks each batch column by column (description,
+quantity, unit_price) with exact ``Decimal`` arithmetic, the same rules as
+``RequestItem``'s model fields. Nothing holds more than one batch of items,
+so memory stays flat in the payload size.
+"""
+import codecs
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from rest_framework.fields import DecimalField, IntegerField
+
+from . import models
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder(parse_float=Decimal)
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789+-.eE'
+
+_description = models.RequestItem._meta.get_field('description')
+_unit_price = models.RequestItem._meta.get_field('unit_price')
+MAX_QUANTITY = 2147483647
+
+MESSAGES = {
+    'required': 'This field is required.',
+    'blank': 'This field may not be blank.',
+    'not_a_dict': 'Invalid data. Expected a dictionary, but got {type}.',
+    'description_invalid': 'Not a valid string.',
+    'description_max_length': f'Ensure this field has no more than {_description.max_length} characters.',
+    'quantity_invalid': IntegerField.default_error_messages['invalid'],
+    'quantity_positive': 'quantity must be positive',
+    'quantity_max': f'Ensure this value is less than or equal to {MAX_QUANTITY}.',
+    'unit_price_invalid': 'unit_price must be a number',
+    'unit_price_negative': 'unit_price must be non-negative',
+    'max_digits': DecimalField.default_error_messages['max_digits'].format(max_digits=_unit_price.max_digits),
+    'max_decimal_places': DecimalField.default_error_messages['max_decimal_places'].format(max_decimal_places=_unit_price.decimal_places),
+    'max_whole_digits': DecimalField.default_error_messages['max_whole_digits'].format(
+        max_whole_digits=_unit_price.max_digits - _unit_price.decimal_places
+    ),
+}
+_PRICE_QUANTUM = Decimal(1).scaleb(-_unit_price.decimal_places)
+
+
+class ItemsParseError(ValueError):
+    pass
+
+
+def _chunks(source, chunk_size):
+    """Text chunks from a str, bytes or binary/text file-like object."""
+    if isinstance(source, bytes):
+        source = source.decode('utf-8')
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+        return
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_json_array(source, chunk_size=CHUNK_SIZE):
+    """Yield the elements of the JSON array in ``source`` one at a time.
+
+    Floats are decoded as ``Decimal``. Raises ItemsParseError on malformed
+    input (possibly after some elements have been yielded).
+    """
+    chunks = _chunks(source, chunk_size)
+    buf, pos, exhausted = '', 0, False
+
+    def fill():
+        nonlocal buf, pos, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            return False
+        # drop what has been consumed so the buffer stays about one chunk long
+        buf, pos = buf[pos:] + chunk, 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or not fill():
+                return
+
+    skip_ws()
+    if pos >= len(buf) or buf[pos] != '[':
+        raise ItemsParseError('items must be a JSON array')
+    pos += 1
+    skip_ws()
+    if pos < len(buf) and buf[pos] == ']':
+        return
+    while True:
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as exc:
+                if not exhausted and fill():
+                    continue
+                raise ItemsParseError(f'items is not valid JSON: {exc.msg}')
+            # a number cut at the chunk boundary also decodes ('1.' as 1, '12'
+            # of '125'); read on until something other than number characters follows
+            if not exhausted and not buf[end:].strip(_NUMBER_CHARS) and fill():
+                continue
+            break
+        pos = end
+        yield value
+        skip_ws()
+        if pos >= len(buf):
+            raise ItemsParseError('items is not valid JSON: unterminated array')
+        if buf[pos] == ']':
+            return
+        if buf[pos] != ',':
+            raise ItemsParseError("items is not valid JSON: expected ',' or ']'")
+        pos += 1
+        skip_ws()
+
+
+def batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _check_description(values, add):
+    clean = []
+    for i, value in enumerate(values):
+        if value is None:
+            add(i, 'description', MESSAGES['required'])
+        elif not isinstance(value, str):
+            add(i, 'description', MESSAGES['description_invalid'])
+        elif not value.strip():
+            add(i, 'description', MESSAGES['blank'])
+        elif len(value) > _description.max_length:
+            add(i, 'description', MESSAGES['description_max_length'])
+        clean.append(value.strip() if isinstance(value, str) else value)
+    return clean
+
+
+def _as_int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, int):
+        return value
+    number = Decimal(str(value).strip())
+    if not number.is_finite() or number != number.to_integral_value():
+        raise ValueError
+    if number.adjusted() > 18:
+        # '1e999999999' is integral too; don't materialise it
+        return MAX_QUANTITY + 1
+    return int(number)
+
+
+def _check_quantity(values, add):
+    clean = []
+    for i, value in enumerate(values):
+        try:
+            number = _as_int(value)
+        except (ValueError, TypeError, InvalidOperation):
+            add(i, 'quantity', MESSAGES['quantity_invalid'])
+            number = None
+        else:
+            if number <= 0:
+                add(i, 'quantity', MESSAGES['quantity_positive'])
+            elif number > MAX_QUANTITY:
+                add(i, 'quantity', MESSAGES['quantity_max'])
+        clean.append(number)
+    return clean
+
+
+def _as_decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise InvalidOperation
+    # str(float) is the shortest repr, e.g. 0.1 -> '0.1', not the binary expansion
+    return Decimal(str(value).strip())
+
+
+def _check_unit_price(values, add):
+    max_digits, places = _unit_price.max_digits, _unit_price.decimal_places
+    clean = []
+    for i, value in enumerate(values):
+        if value is None:
+            add(i, 'unit_price', MESSAGES['required'])
+            clean.append(None)
+            continue
+        try:
+            number = _as_decimal(value)
+        except (InvalidOperation, ValueError):
+            number = None
+        if number is None or not number.is_finite():
+            add(i, 'unit_price', MESSAGES['unit_price_invalid'])
+            clean.append(None)
+            continue
+        # same digit accounting as DRF's DecimalField
+        _, digits, exponent = number.as_tuple()
+        if exponent >= 0:
+            total, decimals = len(digits) + exponent, 0
+        elif -exponent > len(digits):
+            total = decimals = -exponent
+        else:
+            total, decimals = len(digits), -exponent
+        error = None
+        if number < 0:
+            error = 'unit_price_negative'
+        elif total > max_digits:
+            error = 'max_digits'
+        elif decimals > places:
+            error = 'max_decimal_places'
+        elif total - decimals > max_digits - places:
+            error = 'max_whole_digits'
+        if error:
+            add(i, 'unit_price', MESSAGES[error])
+            clean.append(None)
+        else:
+            clean.append(number.quantize(_PRICE_QUANTUM))
+    return clean
+
+
+def validate_batch(rows, offset=0, errors=None):
+    """Validate a batch of raw item dicts column by column.
+
+    Returns ``(clean, errors)``: ``clean`` holds ``(description, quantity,
+    unit_price)`` tuples for the rows without errors, ``errors`` maps the
+    absolute item index to ``{field: [message, ...]}``.
+    """
+    errors = {} if errors is None else errors
+
+    not_dicts = set()
+
+    def add(i, field, message):
+        if i in not_dicts:
+            return
+        errors.setdefault(offset + i, {}).setdefault(field, []).append(message)
+
+    descriptions, quantities, prices = [], [], []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            add(i, 'non_field_errors', MESSAGES['not_a_dict'].format(type=type(row).__name__))
+            not_dicts.add(i)
+            row = {}
+        descriptions.append(row.get('description'))
+        quantities.append(row.get('quantity', 1))
+        prices.append(row.get('unit_price'))
+
+    columns = (
+        _check_description(descriptions, add),
+        _check_quantity(quantities, add),
+        _check_unit_price(prices, add),
+    )
+    clean = [values for i, values in enumerate(zip(*columns)) if offset + i not in errors]
+    return clean, errors
+
+
+class ParsedItems:
+    """Validated items, re-read batch by batch from their source when saved."""
+
+    def __init__(self, source, batch_size=BATCH_SIZE):
+        self.source = source
+        self.batch_size = batch_size
+        self.count = 0
+
+    def _raw(self):
+        if isinstance(self.source, (list, tuple)):
+            return iter(self.source)
+        return iter_json_array(self.source)
+
+    def validate(self):
+        """Check every item; returns the errors keyed by item index."""
+        errors, self.count = {}, 0
+        for batch in batches(self._raw(), self.batch_size):
+            validate_batch(batch, self.count, errors)
+            self.count += len(batch)
+        return errors
+
+    def clean_batches(self):
+        offset = 0
+        for batch in batches(self._raw(), self.batch_size):
+            clean, _ = validate_batch(batch, offset)
+            offset += len(batch)
+            yield clean
+
+    def save_to(self, purchase_request):
+        """Insert the items batch by batch, yielding each batch's clean
+        ``(description, quantity, unit_price)`` rows once it is inserted, so
+        callers derive what else they need in the same pass. Exhaust it."""
+        for clean in self.clean_batches():
+            models.RequestItem.objects.bulk_create(
+                [
+                    models.RequestItem(purchase_request=purchase_request, description=description, quantity=quantity, unit_price=unit_price)
+                    for description, quantity, unit_price in clean
+                ]
+            )
+            yield clean
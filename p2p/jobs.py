@@ -0,0 +1,94 @@
+"""Background batches for bulk admin actions.
+
+Admin actions only insert a ``BackgroundJob``; ``manage.py run_jobs`` claims
+jobs with ``SKIP LOCKED`` and processes their ids in batches, one transaction
+per object, recording progress after every batch.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import models, workflow
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(kind, object_ids, user, **params):
+    return models.BackgroundJob.objects.create(
+        kind=kind, object_ids=[int(pk) for pk in object_ids], params=params, requested_by=user,
+    )
+
+
+def _approve(job, pk):
+    workflow.approve(pk, job.requested_by, job.params.get('comment', ''))
+
+
+def _reject(job, pk):
+    workflow.reject(pk, job.requested_by, job.params.get('reason') or 'Rejected in bulk by admin')
+
+
+def _regenerate_po_pdf(job, pk):
+    po = models.PurchaseOrder.objects.get(pk=pk)
+    if po.po_document:
+        po.po_document.delete(save=False)
+    po.generate_pdf()
+
+
+HANDLERS = {
+    models.BackgroundJob.KIND_APPROVE_REQUESTS: _approve,
+    models.BackgroundJob.KIND_REJECT_REQUESTS: _reject,
+    models.BackgroundJob.KIND_REGENERATE_PO_PDF: _regenerate_po_pdf,
+}
+
+
+def claim_next():
+    with transaction.atomic():
+        job = (
+            models.BackgroundJob.objects.select_for_update(skip_locked=True)
+            .filter(status=models.BackgroundJob.STATUS_PENDING)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = models.BackgroundJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def run(job, batch_size=None):
+    batch_size = batch_size or getattr(settings, 'BACKGROUND_JOB_BATCH_SIZE', 100)
+    handler = HANDLERS[job.kind]
+    ids = job.object_ids[job.processed + job.failed:]
+    for start in range(0, len(ids), batch_size):
+        for pk in ids[start:start + batch_size]:
+            try:
+                handler(job, pk)
+                job.processed += 1
+            except Exception as exc:
+                job.failed += 1
+                if len(job.errors) < 100:
+                    job.errors.append({'id': pk, 'error': str(getattr(exc, 'detail', exc))})
+        job.save(update_fields=['processed', 'failed', 'errors'])
+    job.status = models.BackgroundJob.STATUS_DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return job
+
+
+def run_next(batch_size=None):
+    job = claim_next()
+    if job is None:
+        return None
+    try:
+        return run(job, batch_size)
+    except Exception as exc:
+        logger.exception('background job %s failed', job.pk)
+        job.status = models.BackgroundJob.STATUS_FAILED
+        job.errors.append({'error': str(exc)})
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'errors', 'finished_at'])
+        return job
@@ -0,0 +1,291 @@
+"""Approval latency quantiles from mergeable sketches, and the pending-queue aging.
+
+Every decision made through ``workflow.approve``/``reject`` adds its latency
+to DDSketch-style histograms. Bin ``i`` counts the latencies in
+``(γ^(i-1), γ^i]`` seconds, where ``γ = (1 + α) / (1 - α)`` and ``α`` is
+``LATENCY_SKETCH_ACCURACY``. Any quantile read back is then within ``α`` of
+the true value, relative to it. A sketch covers one UTC day, metric,
+dimension, key and action, and is stored as one ``LatencyBin`` row per
+non-empty bin. Sketches merge by adding the counts of equal bins, so a report
+over any date range is a single ``SUM ... GROUP BY bin``.
+
+Metrics:
+
+- ``wait``: from the request reaching the decided level (its creation, or the
+  approval of the level below) to the decision. Kept per ``level``,
+  ``approver``, amount ``band`` and for ``all`` decisions.
+- ``total``: from creation to the final decision (the last approval, or a
+  rejection). Kept per amount ``band`` and for ``all``.
+
+Amount bands compare the raw amount, whatever the currency.
+
+Recording is one ``INSERT ... ON CONFLICT DO UPDATE`` that adds to the
+counts. It runs last in the decision's transaction, so the bin rows stay
+locked only briefly. ``manage.py rebuild_latency_sketches`` recomputes days
+from the approval history, including archived requests.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q, Sum, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Approval, ArchivedPurchaseRequest, LatencyBin, PurchaseRequest
+
+# shorter latencies are counted in the bin of this one
+MIN_SECONDS = 0.001
+QUANTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+# age of a pending request: (label, upper bound); the last bucket is open-ended
+AGING_BUCKETS = (
+    ('<1h', timedelta(hours=1)),
+    ('1-4h', timedelta(hours=4)),
+    ('4-24h', timedelta(days=1)),
+    ('1-3d', timedelta(days=3)),
+    ('3-7d', timedelta(days=7)),
+    ('7-30d', timedelta(days=30)),
+    ('>30d', None),
+)
+UPSERT_BATCH = 500
+# bins held in memory by ``rebuild`` before they are written
+REBUILD_FLUSH = 50000
+
+
+def log_gamma():
+    alpha = settings.LATENCY_SKETCH_ACCURACY
+    return math.log((1 + alpha) / (1 - alpha))
+
+
+def bin_index(seconds, lg):
+    return math.ceil(math.log(max(seconds, MIN_SECONDS)) / lg)
+
+
+def bin_value(index, lg):
+    """The value reported for bin ``index``: within α of anything in the bin."""
+    return 2 * math.exp(index * lg) / (math.exp(lg) + 1)
+
+
+def amount_band(amount):
+    """Label of the ``LATENCY_AMOUNT_BANDS`` band holding ``amount``."""
+    lower = None
+    for bound in (Decimal(b) for b in settings.LATENCY_AMOUNT_BANDS):
+        if amount < bound:
+            return f'<{bound}' if lower is None else f'{lower}-{bound}'
+        lower = bound
+    return f'>={lower}'
+
+
+def band_order(label):
+    """Sort key of a band label, by its lower bound."""
+    if label.startswith('<'):
+        return Decimal('-Infinity')
+    return Decimal(label.lstrip('>=').split('-')[0])
+
+
+def observations(decided_at, level, action, approver_id, amount, entered_at, created_at=None):
+    """Bins one decision adds to: ``Counter({(metric, dimension, key, action, day, bin): 1})``.
+
+    ``created_at`` is given for final decisions only; it adds the ``total`` metric.
+    """
+    lg = log_gamma()
+    day = decided_at.astimezone(dt_timezone.utc).date()
+    band = amount_band(amount)
+    keys = [(LatencyBin.DIMENSION_LEVEL, str(level)), (LatencyBin.DIMENSION_BAND, band), (LatencyBin.DIMENSION_ALL, '')]
+    if approver_id is not None:
+        keys.append((LatencyBin.DIMENSION_APPROVER, str(approver_id)))
+    wait = bin_index((decided_at - entered_at).total_seconds(), lg)
+    bins = Counter((LatencyBin.METRIC_WAIT, dimension, key, action, day, wait) for dimension, key in keys)
+    if created_at is not None:
+        total = bin_index((decided_at - created_at).total_seconds(), lg)
+        bins.update(
+            (LatencyBin.METRIC_TOTAL, dimension, key, action, day, total)
+            for dimension, key in ((LatencyBin.DIMENSION_BAND, band), (LatencyBin.DIMENSION_ALL, ''))
+        )
+    return bins
+
+
+def add(bins):
+    """Add ``{(metric, dimension, key, action, day, bin): count}`` to the stored sketches."""
+    quote = connection.ops.quote_name
+    table = quote(LatencyBin._meta.db_table)
+    columns = ', '.join(quote(name) for name in ('metric', 'dimension', 'key', 'action', 'day', 'bin', 'count'))
+    conflict = ', '.join(quote(name) for name in ('metric', 'dimension', 'day', 'key', 'action', 'bin'))
+    # sorted, so concurrent decisions lock shared bins in the same order
+    rows = sorted(bins.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH):
+            batch = rows[start:start + UPSERT_BATCH]
+            params = []
+            for (metric, dimension, key, action, day, index), count in batch:
+                params += [metric, dimension, key, action, connection.ops.adapt_datefield_value(day), index, count]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES '
+                + ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(batch))
+                + f' ON CONFLICT ({conflict}) DO UPDATE SET {quote("count")} = {table}.{quote("count")} + EXCLUDED.{quote("count")}',
+                params,
+            )
+
+
+def record(pr, approval, final):
+    """Add a decision to the sketches; call it last in the transaction that made it."""
+    entered_at = pr.created_at
+    if approval.level > 1:
+        # created_at bound: lets PostgreSQL skip the older approval partitions
+        entered_at = Approval.objects.filter(
+            purchase_request=pr, level=approval.level - 1, action=Approval.ACTION_APPROVED, created_at__gte=pr.created_at,
+        ).order_by('-created_at').values_list('created_at', flat=True).first() or entered_at
+    add(observations(
+        approval.created_at, approval.level, approval.action, approval.approver_id, pr.amount,
+        entered_at, pr.created_at if final else None,
+    ))
+
+
+def summarize(bins, lg=None):
+    """Count, mean, p50/p90/p99 and max in seconds, from ascending ``[(bin, count)]``."""
+    lg = lg or log_gamma()
+    total = sum(count for _, count in bins)
+    result = {'count': total, 'mean': round(sum(bin_value(index, lg) * count for index, count in bins) / total, 3)}
+    seen, targets = 0, list(QUANTILES)
+    for index, count in bins:
+        seen += count
+        # nearest rank: the first bin holding the ceil(q * n)-th value (rounded: 0.9 * 10 is 9.000000000000002)
+        while targets and seen >= math.ceil(round(targets[0][1] * total, 9)):
+            result[targets.pop(0)[0]] = round(bin_value(index, lg), 3)
+    result['max'] = round(bin_value(bins[-1][0], lg), 3)
+    return result
+
+
+def report(metric, dimension, since, until, action=None):
+    """Latency quantiles per key over the days ``since`` to ``until`` (inclusive)."""
+    rows = LatencyBin.objects.filter(metric=metric, dimension=dimension, day__range=(since, until))
+    if action:
+        rows = rows.filter(action=action)
+    merged = defaultdict(list)
+    for key, index, count in rows.values('key', 'bin').annotate(n=Sum('count')).order_by('key', 'bin').values_list('key', 'bin', 'n'):
+        merged[key].append((index, count))
+
+    lg = log_gamma()
+    labels = {}
+    if dimension == LatencyBin.DIMENSION_APPROVER:
+        labels = {
+            str(pk): username
+            for pk, username in get_user_model().objects.filter(pk__in=[int(key) for key in merged]).values_list('pk', 'username')
+        }
+    results = [{'key': key, 'label': labels.get(key, key), **summarize(bins, lg)} for key, bins in merged.items()]
+    if dimension == LatencyBin.DIMENSION_LEVEL:
+        results.sort(key=lambda row: int(row['key']))
+    elif dimension == LatencyBin.DIMENSION_BAND:
+        results.sort(key=lambda row: band_order(row['key']))
+    else:
+        results.sort(key=lambda row: row['label'])
+    return results
+
+
+def pending_aging(now=None):
+    """Histogram of the age of PENDING requests per current level, counted live.
+
+    Reads only the ``(status, current_level, created_at)`` approval-queue index.
+    """
+    now = now or timezone.now()
+    aggregates = {'count': Count('id'), 'oldest': Min('created_at')}
+    lower = None
+    for i, (label, upper) in enumerate(AGING_BUCKETS):
+        bucket = Q()
+        if lower is not None:
+            bucket &= Q(created_at__lte=now - lower)
+        if upper is not None:
+            bucket &= Q(created_at__gt=now - upper)
+        aggregates[f'bucket{i}'] = Count('id', filter=bucket)
+        lower = upper
+    rows = (
+        PurchaseRequest.objects.filter(status=PurchaseRequest.STATUS_PENDING)
+        .values('current_level').annotate(**aggregates).order_by('current_level')
+    )
+    return {
+        'as_of': now,
+        'buckets': [label for label, _ in AGING_BUCKETS],
+        'levels': [
+            {
+                'level': row['current_level'],
+                'count': row['count'],
+                'oldest': row['oldest'],
+                'histogram': {label: row[f'bucket{i}'] for i, (label, _) in enumerate(AGING_BUCKETS)},
+            }
+            for row in rows
+        ],
+    }
+
+
+def _live_decisions(start, end):
+    """Decisions in ``[start, end)`` from the live tables, as ``observations`` arguments."""
+    decided = Approval.objects.filter(created_at__lt=end)
+    if start is not None:
+        decided = decided.filter(created_at__gte=start)
+    # all approvals of those requests, so the level below is there even when decided before ``start``
+    rows = (
+        Approval.objects.filter(purchase_request__in=decided.values('purchase_request'))
+        .annotate(previous_at=Window(Lag('created_at'), partition_by=F('purchase_request'), order_by=F('level').asc()))
+        .values_list(
+            'created_at', 'level', 'action', 'approver_id', 'previous_at',
+            'purchase_request__amount', 'purchase_request__created_at', 'purchase_request__required_approval_levels',
+        )
+    )
+    for decided_at, level, action, approver_id, previous_at, amount, created_at, required in rows.iterator(chunk_size=2000):
+        if decided_at >= end or (start is not None and decided_at < start):
+            continue
+        final = action == Approval.ACTION_REJECTED or level >= required
+        yield decided_at, level, action, approver_id, amount, previous_at or created_at, created_at if final else None
+
+
+def _archived_decisions(start, end):
+    """Decisions in ``[start, end)`` of archived requests."""
+    user_ids = dict(get_user_model().objects.values_list('username', 'pk'))
+    for archived in ArchivedPurchaseRequest.objects.filter(created_at__lt=end).only('payload').iterator(chunk_size=200):
+        data = archived.data
+        created_at, amount = parse_datetime(data['created_at']), Decimal(data['amount'])
+        entered_at = created_at
+        for approval in sorted(data['approvals'], key=lambda row: row['level']):
+            decided_at = parse_datetime(approval['created_at'])
+            final = approval['action'] == Approval.ACTION_REJECTED or approval['level'] >= data['required_approval_levels']
+            if decided_at < end and (start is None or decided_at >= start):
+                yield (
+                    decided_at, approval['level'], approval['action'], user_ids.get(approval['approver']), amount,
+                    entered_at, created_at if final else None,
+                )
+            entered_at = decided_at
+
+
+def rebuild(since=None, until=None, include_archive=True):
+    """Recompute the sketches of the UTC days ``since`` to ``until`` from history.
+
+    Runs in one transaction. ``until`` defaults to yesterday: today's bins are
+    still being added to by live decisions. Returns the number of decisions.
+    """
+    until = until or timezone.now().astimezone(dt_timezone.utc).date() - timedelta(days=1)
+    start = datetime.combine(since, time.min, tzinfo=dt_timezone.utc) if since else None
+    end = datetime.combine(until + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+    sources = [_live_decisions(start, end)]
+    if include_archive:
+        sources.append(_archived_decisions(start, end))
+
+    decisions, bins = 0, Counter()
+    with transaction.atomic():
+        stale = LatencyBin.objects.filter(day__lte=until)
+        if since:
+            stale = stale.filter(day__gte=since)
+        stale.delete()
+        for source in sources:
+            for decision in source:
+                bins.update(observations(*decision))
+                decisions += 1
+                if len(bins) >= REBUILD_FLUSH:
+                    add(bins)
+                    bins.clear()
+        add(bins)
+    return decisions
@@ -0,0 +1,278 @@
+"""Workflow load generator for ``manage.py load_test``.
+
+Simulated users drive a running server over HTTP:
+
+- staff create purchase requests (a few items, some above the level-2
+  threshold so they need two approvals);
+- approvers poll ``pending-approvals`` and all pick from the head of the
+  same queue, so they race for the ``select_for_update`` row lock in
+  ``workflow.approve``/``reject`` and the loser gets a 409;
+- finance lists purchase orders and downloads their PDFs.
+
+Every call is timed per operation. While the run lasts, ``LockSampler`` polls
+``pg_stat_activity`` for backends waiting on a lock, which gives the total
+lock-wait time and the statements that waited.
+"""
+import asyncio
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection, connections
+
+from .querylog import normalize
+
+APPROVAL_COMMENTS = ('ok', 'approved', 'within budget')
+REJECT_REASONS = ('over budget', 'duplicate', 'missing quote')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    """Nearest rank, as ``latency.summarize``: the ceil(pct% * n)-th smallest value."""
+    values = sorted(values)
+    return values[max(0, math.ceil(round(len(values) * pct / 100, 9)) - 1)]
+
+
+SERVERS = {
+    'gunicorn-sync': lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', 'procure_to_pay.wsgi:application',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--worker-class', 'sync',
+    ],
+    'uvicorn-async': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', 'procure_to_pay.asgi:application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--no-access-log',
+    ],
+}
+
+
+@contextmanager
+def local_server(name, workers=1, timeout=30):
+    """Run one of ``SERVERS`` on a free local port; yields its base URL.
+
+    The server inherits the environment, including ``DJANGO_SETTINGS_MODULE``.
+    """
+    import httpx
+
+    port = free_port()
+    env = dict(os.environ, ASYNC_VIEWS='1' if name == 'uvicorn-async' else '0')
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'procure_to_pay.settings')
+    proc = subprocess.Popen(
+        SERVERS[name](port, workers), cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                httpx.get(base_url + '/api/health/', timeout=1)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline or proc.poll() is not None:
+                    raise CommandError(f'server at {base_url} did not start')
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def _shorten(sql, head=90, tail=70):
+    # keep the end too: that is where FOR UPDATE / ON CONFLICT show up
+    return sql if len(sql) <= head + tail else f'{sql[:head]} ... {sql[-tail:]}'
+
+
+class Stats:
+    """Latencies and status codes per operation."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, op, status, ms):
+        self.latencies[op].append(ms)
+        self.statuses[op][status] += 1
+
+    def summary(self, elapsed):
+        rows = {}
+        for op in sorted(self.latencies):
+            latencies, statuses = self.latencies[op], self.statuses[op]
+            count = len(latencies)
+            server_errors = sum(n for status, n in statuses.items() if status == 'error' or status >= 500)
+            rows[op] = {
+                'count': count,
+                'rps': round(count / elapsed, 1),
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p90_ms': round(percentile(latencies, 90), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'max_ms': round(max(latencies), 1),
+                'conflict_rate': round(statuses.get(409, 0) / count, 4),
+                'error_rate': round(server_errors / count, 4),
+                'statuses': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+            }
+        return rows
+
+
+class LockSampler(threading.Thread):
+    """Polls ``pg_stat_activity`` every ``interval`` seconds for lock waits.
+
+    Each backend seen waiting counts for one interval, so totals are
+    accurate to about ``interval`` per wait. Deadlocks come from the
+    ``pg_stat_database`` counter. Does nothing on other databases.
+    """
+
+    QUERY = (
+        "SELECT pid, query FROM pg_stat_activity "
+        "WHERE datname = current_database() AND wait_event_type = 'Lock' AND pid <> pg_backend_pid()"
+    )
+
+    def __init__(self, interval=0.02):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.enabled = connection.vendor == 'postgresql'
+        self.stop_event = threading.Event()
+        self.samples = 0
+        self.max_waiters = 0
+        self.waits = set()
+        self.by_statement = Counter()
+        self.deadlocks = 0
+
+    def _deadlocks(self, cursor):
+        cursor.execute('SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()')
+        return cursor.fetchone()[0]
+
+    def run(self):
+        if not self.enabled:
+            return
+        try:
+            with connection.cursor() as cursor:
+                deadlocks = self._deadlocks(cursor)
+                while not self.stop_event.wait(self.interval):
+                    cursor.execute(self.QUERY)
+                    rows = cursor.fetchall()
+                    self.samples += len(rows)
+                    self.max_waiters = max(self.max_waiters, len(rows))
+                    for pid, query in rows:
+                        # one wait = one (backend, statement) seen in consecutive polls
+                        self.waits.add((pid, query))
+                        self.by_statement[_shorten(normalize(query))] += 1
+                self.deadlocks = self._deadlocks(cursor) - deadlocks
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def summary(self):
+        if not self.enabled:
+            return None
+        return {
+            'lock_wait_s': round(self.samples * self.interval, 3),
+            'waits': len(self.waits),
+            'max_waiters': self.max_waiters,
+            'deadlocks': self.deadlocks,
+            'top_statements': [
+                {'statement': statement, 'wait_s': round(samples * self.interval, 3)}
+                for statement, samples in self.by_statement.most_common(5)
+            ],
+        }
+
+
+class Scenario:
+    """One load-test run: ``tokens`` maps each role to the bearer tokens of its users."""
+
+    def __init__(self, client, tokens, duration, think_ms=0, reject_rate=0.1, race_window=5, items=3,
+                 level2_threshold=Decimal('1000'), seed=None):
+        self.client = client
+        self.tokens = tokens
+        self.deadline = time.monotonic() + duration
+        self.think = think_ms / 1000
+        self.reject_rate = reject_rate
+        self.race_window = race_window
+        self.items = items
+        self.level2_threshold = level2_threshold
+        self.random = random.Random(seed)
+        self.stats = Stats()
+
+    async def call(self, op, token, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+            status = response.status_code
+        except Exception:
+            response, status = None, 'error'
+        self.stats.record(op, status, (time.perf_counter() - start) * 1000)
+        return response
+
+    def running(self):
+        return time.monotonic() < self.deadline
+
+    async def pause(self):
+        await asyncio.sleep(self.think)
+
+    async def staff(self, token):
+        n = 0
+        while self.running():
+            n += 1
+            # roughly a third of the requests need a level-2 approval as well
+            base = self.level2_threshold * 3 if self.random.random() < 0.33 else self.level2_threshold / 2
+            unit = (base / self.items).quantize(Decimal('0.01'))
+            body = {
+                'title': f'load test {n}',
+                'amount': str(unit * self.items),
+                'currency': 'USD',
+                'items': [{'description': f'item {i}', 'quantity': 1, 'unit_price': str(unit)} for i in range(self.items)],
+            }
+            await self.call('create', token, 'POST', '/api/requests/', json=body)
+            await self.pause()
+
+    async def approver(self, token, level):
+        while self.running():
+            response = await self.call('queue', token, 'GET', f'/api/requests/pending-approvals/?page_size={self.race_window}')
+            queue = response.json().get('results', []) if response is not None and response.status_code == 200 else []
+            if not queue:
+                await asyncio.sleep(max(self.think, 0.05))
+                continue
+            pr = self.random.choice(queue)
+            if self.random.random() < self.reject_rate:
+                body = {'reason': self.random.choice(REJECT_REASONS), 'level': level}
+                await self.call('reject', token, 'PATCH', f'/api/requests/{pr["id"]}/reject/', json=body)
+            else:
+                body = {'comment': self.random.choice(APPROVAL_COMMENTS), 'level': level}
+                await self.call('approve', token, 'PATCH', f'/api/requests/{pr["id"]}/approve/', json=body)
+            await self.pause()
+
+    async def finance(self, token):
+        while self.running():
+            response = await self.call('po_list', token, 'GET', '/api/purchase-orders/?page_size=20&ordering=-generated_at')
+            orders = response.json().get('results', []) if response is not None and response.status_code == 200 else []
+            if orders:
+                po = self.random.choice(orders)
+                await self.call('po_download', token, 'GET', f'/api/purchase-orders/{po["id"]}/download/')
+            else:
+                await asyncio.sleep(max(self.think, 0.05))
+            await self.pause()
+
+    async def run(self):
+        actors = [self.staff(token) for token in self.tokens['staff']]
+        for level, tokens in sorted(self.tokens['approvers'].items()):
+            actors += [self.approver(token, level) for token in tokens]
+        actors += [self.finance(token) for token in self.tokens['finance']]
+        started = time.perf_counter()
+        await asyncio.gather(*actors)
+        return time.perf_counter() - started
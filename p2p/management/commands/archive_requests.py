@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from p2p.archive import archive
+
+
+class Command(BaseCommand):
+    help = 'Move APPROVED/REJECTED purchase requests older than the retention window into the archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help=f'Retention window in days (default: ARCHIVE_RETENTION_DAYS={settings.ARCHIVE_RETENTION_DAYS}).')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=None)
+
+    def handle(self, *args, **options):
+        total = archive(options['days'], options['batch_size'], options['max_batches'])
+        self.stdout.write(f'archived {total} purchase request(s)')
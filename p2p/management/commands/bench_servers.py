@@ -0,0 +1,83 @@
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from p2p.loadtest import SERVERS, local_server, percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare one gunicorn sync worker against one uvicorn worker with ASYNC_VIEWS=1: '
+        'throughput and latency at a given client concurrency, per server process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', help='API path to request (repeatable). Default: a mix of read endpoints.')
+        parser.add_argument('--user', help='Username to authenticate as (default: first superuser).')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=1, help='Processes per server.')
+        parser.add_argument('--server', choices=sorted(SERVERS), action='append')
+
+    def handle(self, *args, **options):
+        try:
+            import httpx
+        except ImportError:
+            raise CommandError('bench_servers needs httpx (pip install httpx)')
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        User = get_user_model()
+        if options['user']:
+            user = User.objects.get(username=options['user'])
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('pk').first()
+            if user is None:
+                raise CommandError('No superuser; pass --user')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        paths = options['path'] or ['/api/health/', '/api/auth/me/', '/api/requests/', '/api/purchase-orders/']
+
+        self.stdout.write(
+            f'{options["requests"]} requests, concurrency {options["concurrency"]}, '
+            f'{options["workers"]} worker(s) per server, paths: {", ".join(paths)}'
+        )
+        for name in options['server'] or sorted(SERVERS):
+            with local_server(name, options['workers']) as base_url:
+                result = asyncio.run(self._run(httpx, base_url, headers, paths, options['requests'], options['concurrency']))
+            self._report(name, result)
+
+    async def _run(self, httpx, base_url, headers, paths, total, concurrency):
+        latencies, statuses = [], Counter()
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(paths[i % len(paths)])
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async def client_loop(client):
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, headers=headers)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError:
+                    statuses['error'] += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        return {'latencies': latencies, 'statuses': statuses, 'elapsed': elapsed}
+
+    def _report(self, name, result):
+        latencies = result['latencies']
+        self.stdout.write(
+            f'{name:14} {len(latencies) / result["elapsed"]:8.1f} req/s  '
+            f'p50={statistics.median(latencies):.1f}ms p90={percentile(latencies, 90):.1f}ms '
+            f'p99={percentile(latencies, 99):.1f}ms max={max(latencies):.1f}ms  '
+            + ' '.join(f'{status}:{count}' for status, count in sorted(result['statuses'].items(), key=str))
+        )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from p2p.outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+    help = 'Drain the notification outbox, sending one digest per recipient per batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            try:
+                handled = dispatch_batch(batch_size=batch_size)
+            except Exception as exc:
+                # e.g. database unavailable: events stay pending, try again later
+                self.stderr.write(f'dispatch failed: {exc}')
+                handled = 0
+                if options['once']:
+                    raise
+            if handled:
+                self.stdout.write(f'handled {handled} event(s)')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from p2p import duplicates, models
+
+
+class Command(BaseCommand):
+    help = (
+        'Fingerprint purchase requests that have no fingerprint yet, then report clusters of likely duplicates '
+        'found through the LSH index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refingerprint', action='store_true', help='Recompute every fingerprint (e.g. after changing the features).')
+        parser.add_argument('--fingerprint-only', action='store_true')
+        parser.add_argument('--json', dest='json_path', help='Also write the clusters to this file.')
+
+    def handle(self, *args, **options):
+        done = duplicates.fingerprint_missing(all_requests=options['refingerprint'])
+        self.stdout.write(f'fingerprinted {done} purchase request(s)')
+        if options['fingerprint_only']:
+            return
+        groups = duplicates.clusters()
+        requests = models.PurchaseRequest.objects.in_bulk([pk for group in groups for pk in group])
+        for group in groups:
+            self.stdout.write(', '.join(
+                f'#{pk} {requests[pk].status} {requests[pk].amount} {requests[pk].currency} "{requests[pk].title}"'
+                for pk in group if pk in requests
+            ))
+        self.stdout.write(f'{len(groups)} cluster(s), {sum(map(len, groups))} request(s)')
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(groups, f)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from p2p import models
+from p2p.loadtest import SERVERS, LockSampler, Scenario, local_server
+from p2p.provisioning import provision_users
+
+PREFIX = 'loadtest-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the approval workflow over HTTP: staff create PRs, approvers race on the same queue, '
+        'finance downloads POs. Reports throughput, latency percentiles, 409/5xx rates and '
+        'Postgres lock-wait time per operation.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server (default: start one locally).')
+        parser.add_argument('--server', choices=sorted(SERVERS), default='gunicorn-sync', help='Server to start when --url is not given.')
+        parser.add_argument('--workers', type=int, default=2, help='Processes for the started server.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run.')
+        parser.add_argument('--staff', type=int, default=4, help='Concurrent PR creators.')
+        parser.add_argument('--approvers', type=int, default=3, help='Concurrent approvers per approval level.')
+        parser.add_argument('--finance', type=int, default=2, help='Concurrent PO downloaders.')
+        parser.add_argument('--backlog', type=int, default=50, help='Pending PRs to seed before the run.')
+        parser.add_argument('--race-window', type=int, default=5, help='Approvers pick at random from the first N queued PRs.')
+        parser.add_argument('--reject-rate', type=float, default=0.1)
+        parser.add_argument('--items', type=int, default=3, help='Items per created PR.')
+        parser.add_argument('--think-ms', type=int, default=0, help='Pause between a user\'s calls.')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this file.')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the PRs created by load-test users afterwards.')
+
+    def handle(self, *args, **options):
+        try:
+            import httpx
+        except ImportError:
+            raise CommandError('load_test needs httpx (pip install httpx)')
+
+        tokens = self._tokens(options)
+        self._seed_backlog(options['backlog'])
+        concurrency = len(tokens['staff']) + sum(map(len, tokens['approvers'].values())) + len(tokens['finance'])
+        self.stdout.write(
+            f'{options["duration"]:.0f}s, {len(tokens["staff"])} staff, {options["approvers"]} approver(s) per level '
+            f'x {len(tokens["approvers"])} level(s), {len(tokens["finance"])} finance ({concurrency} concurrent users)'
+        )
+
+        sampler = LockSampler()
+        if not sampler.enabled:
+            self.stderr.write('Not on PostgreSQL: lock waits are not sampled.')
+        if options['url']:
+            result = self._run(httpx, options['url'].rstrip('/'), tokens, concurrency, sampler, options)
+        else:
+            with local_server(options['server'], options['workers']) as base_url:
+                result = self._run(httpx, base_url, tokens, concurrency, sampler, options)
+
+        self._report(result)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(result, f, indent=2)
+        if options['cleanup']:
+            deleted, _ = models.PurchaseRequest.objects.filter(created_by__username__startswith=PREFIX).delete()
+            self.stdout.write(f'\nDeleted {deleted} row(s) created by load-test users.')
+
+    def _tokens(self, options):
+        """Create the load-test users if needed; bearer tokens per role."""
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        levels = sorted(set(models.UserProfile.APPROVAL_LEVELS.values()))
+        role_for_level = {level: role for role, level in models.UserProfile.APPROVAL_LEVELS.items()}
+        rows = [{'username': f'{PREFIX}staff-{i}', 'role': models.UserProfile.ROLE_STAFF} for i in range(options['staff'])]
+        rows += [
+            {'username': f'{PREFIX}approver{level}-{i}', 'role': role_for_level[level]}
+            for level in levels for i in range(options['approvers'])
+        ]
+        rows += [{'username': f'{PREFIX}finance-{i}', 'role': models.UserProfile.ROLE_FINANCE} for i in range(options['finance'])]
+        provision_users(rows)
+
+        users = {user.username: user for user in get_user_model().objects.filter(username__in=[row['username'] for row in rows])}
+
+        def token(username):
+            return str(AccessToken.for_user(users[username]))
+
+        return {
+            'staff': [token(f'{PREFIX}staff-{i}') for i in range(options['staff'])],
+            'approvers': {level: [token(f'{PREFIX}approver{level}-{i}') for i in range(options['approvers'])] for level in levels},
+            'finance': [token(f'{PREFIX}finance-{i}') for i in range(options['finance'])],
+        }
+
+    def _seed_backlog(self, count):
+        """Pending PRs so the approvers race from the first second."""
+        if count <= 0:
+            return
+        creator = get_user_model().objects.filter(username__startswith=PREFIX).order_by('pk').first()
+        amounts = [Decimal('250.00'), Decimal(settings.APPROVAL_LEVEL_THRESHOLDS.get(2, '1000')) * 3]
+        models.PurchaseRequest.objects.bulk_create([
+            models.PurchaseRequest(
+                title=f'load test backlog {i}', amount=amounts[i % 2], created_by=creator,
+                required_approval_levels=models.required_approval_levels_for(amounts[i % 2]),
+            )
+            for i in range(count)
+        ])
+
+    def _run(self, httpx, base_url, tokens, concurrency, sampler, options):
+        async def main():
+            limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+                scenario = Scenario(
+                    client, tokens, options['duration'], think_ms=options['think_ms'], reject_rate=options['reject_rate'],
+                    race_window=options['race_window'], items=options['items'],
+                    level2_threshold=Decimal(settings.APPROVAL_LEVEL_THRESHOLDS.get(2, '1000')), seed=options['seed'],
+                )
+                elapsed = await scenario.run()
+            return scenario, elapsed
+
+        sampler.start()
+        try:
+            scenario, elapsed = asyncio.run(main())
+        finally:
+            sampler.stop()
+        operations = scenario.stats.summary(elapsed)
+        total = sum(row['count'] for row in operations.values())
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'concurrency': concurrency,
+            'total_rps': round(total / elapsed, 1),
+            'operations': operations,
+            'locks': sampler.summary(),
+        }
+
+    def _report(self, result):
+        self.stdout.write(
+            f'\n{"operation":12} {"count":>6} {"req/s":>7} {"p50":>7} {"p90":>7} {"p99":>7} {"max":>7} {"409":>6} {"5xx":>6}  statuses'
+        )
+        for op, row in result['operations'].items():
+            self.stdout.write(
+                f'{op:12} {row["count"]:6} {row["rps"]:7.1f} {row["p50_ms"]:7.1f} {row["p90_ms"]:7.1f} {row["p99_ms"]:7.1f} '
+                f'{row["max_ms"]:7.1f} {row["conflict_rate"]:6.1%} {row["error_rate"]:6.1%}  '
+                + ' '.join(f'{status}:{n}' for status, n in row['statuses'].items())
+            )
+        self.stdout.write(f'{"total":12} {"":6} {result["total_rps"]:7.1f} req/s over {result["elapsed_s"]}s (latencies in ms)')
+
+        locks = result['locks']
+        if locks is None:
+            return
+        self.stdout.write(
+            f'\nLock waits: {locks["lock_wait_s"]:.2f}s in total, {locks["waits"]} wait(s), '
+            f'at most {locks["max_waiters"]} backend(s) waiting at once, {locks["deadlocks"]} deadlock(s)'
+        )
+        for row in locks['top_statements']:
+            self.stdout.write(f'  {row["wait_s"]:7.2f}s  {row["statement"]}')
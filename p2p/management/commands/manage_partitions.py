@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from p2p.partitions import PARTITIONED_TABLES, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions for the partitioned tables (run daily from cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('partitioning requires PostgreSQL')
+        for table in PARTITIONED_TABLES:
+            with transaction.atomic(), connection.cursor() as cursor:
+                created = ensure_partitions(cursor, table, months_ahead=options['months_ahead'])
+            for name in created:
+                self.stdout.write(f'created {name}')
@@ -0,0 +1,51 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from p2p import models
+from p2p.provisioning import hash_pool, hash_workers, provision_users
+from p2p.serializers import BulkUserRowSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Create users in bulk from a CSV (header: username,email,first_name,last_name,role,password) '
+        'or JSON-lines file. Existing usernames are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--role', default=models.UserProfile.ROLE_STAFF, choices=[r[0] for r in models.UserProfile.ROLE_CHOICES],
+                            help='Role for rows without one.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per transaction.')
+        parser.add_argument('--workers', type=int, default=None, help='Hashing processes (default: PROVISIONING_HASH_WORKERS or one per CPU).')
+
+    def handle(self, *args, **options):
+        rows = self._read(options['path'])
+        serializer = BulkUserRowSerializer(data=rows, many=True)
+        if not serializer.is_valid():
+            errors = [f'line {i + 1}: {err}' for i, err in enumerate(serializer.errors) if err]
+            raise CommandError('invalid rows:\n' + '\n'.join(errors[:20]))
+        rows = serializer.validated_data
+
+        created = skipped = 0
+        started = time.monotonic()
+        with hash_pool(options['workers'] or hash_workers()) as pool:
+            for start in range(0, len(rows), options['batch_size']):
+                result = provision_users(rows[start:start + options['batch_size']], options['role'], executor=pool)
+                created += len(result['created'])
+                skipped += len(result['skipped'])
+                for username in result['skipped']:
+                    self.stderr.write(f'skipped existing user {username}')
+                self.stdout.write(f'{start + len(result["created"]) + len(result["skipped"])}/{len(rows)}')
+        self.stdout.write(f'created {created} user(s), skipped {skipped} in {time.monotonic() - started:.1f}s')
+
+    def _read(self, path):
+        with open(path, newline='') as f:
+            if path.endswith(('.jsonl', '.ndjson')):
+                return [json.loads(line) for line in f if line.strip()]
+            rows = list(csv.DictReader(f))
+        # empty CSV cells mean "not given"
+        return [{key: value for key, value in row.items() if value not in (None, '')} for row in rows]
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from p2p.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = f'Delete resumable uploads that were never attached, {settings.UPLOAD_EXPIRY_HOURS}h (UPLOAD_EXPIRY_HOURS) after creation.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'purged {purge_expired()} expired upload(s)')
@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from p2p.latency import rebuild
+
+
+def _day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'not a YYYY-MM-DD date: {value}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the approval latency sketches of past days from the approval history, archived requests '
+        'included (after changing LATENCY_SKETCH_ACCURACY or LATENCY_AMOUNT_BANDS, or to backfill).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=_day, help='First UTC day to rebuild (default: all history).')
+        parser.add_argument(
+            '--until', type=_day,
+            help='Last UTC day to rebuild (default: yesterday). Including today while decisions are made '
+                 'may count them twice and blocks them until the rebuild commits.',
+        )
+        parser.add_argument('--skip-archive', action='store_true', help='Leave out archived requests (faster; undercounts archived days).')
+
+    def handle(self, *args, **options):
+        decisions = rebuild(options['since'], options['until'], include_archive=not options['skip_archive'])
+        self.stdout.write(f'rebuilt the latency sketches from {decisions} decision(s)')
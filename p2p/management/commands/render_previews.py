@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from p2p import models, previews
+
+SOURCES = (
+    (models.PurchaseRequest, 'proforma'),
+    (models.Receipt, 'file'),
+    (models.PurchaseOrder, 'po_document'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the previews of stored proformas, receipts and PO documents that have none yet, '
+        'then evict the preview cache down to PREVIEW_CACHE_MAX_BYTES.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render files that already have a preview.')
+        parser.add_argument('--evict-only', action='store_true')
+
+    def handle(self, *args, **options):
+        if not options['evict_only']:
+            names = []
+            for model, field in SOURCES:
+                queryset = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                if not options['all']:
+                    queryset = queryset.exclude(**{f'{field}__in': models.Preview.objects.values('source')})
+                names += queryset.values_list(field, flat=True).distinct()
+            self.stdout.write(f'rendering {len(names)} file(s) with {settings.PREVIEW_WORKERS or "no"} worker process(es)')
+            if settings.PREVIEW_WORKERS > 0:
+                with previews.make_pool() as pool:
+                    list(pool.map(previews.render, names, chunksize=8))
+            else:
+                for name in names:
+                    previews.render(name)
+        self.stdout.write(f'evicted {previews.evict()} cached page(s)')
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from p2p.jobs import run_next
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (bulk admin actions).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when no job is queued.')
+        parser.add_argument('--once', action='store_true', help='Run what is queued now and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            job = run_next(options['batch_size'])
+            if job is not None:
+                self.stdout.write(f'job {job.pk} {job.kind}: {job.status} processed={job.processed} failed={job.failed}')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from p2p.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = 'Print the top-N slow query fingerprints recorded by the slow-query log.'
+
+    ORDERINGS = {
+        'total': '-total_ms',
+        'max': '-max_ms',
+        'calls': '-calls',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--order', choices=sorted(self.ORDERINGS), default='total')
+        parser.add_argument('--explain', action='store_true', help='Include the captured EXPLAIN plans.')
+        parser.add_argument('--reset', action='store_true', help='Delete all recorded slow queries and exit.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(f'deleted {deleted} row(s)')
+            return
+        rows = SlowQuery.objects.order_by(self.ORDERINGS[options['order']])[:options['top']]
+        for rank, row in enumerate(rows, 1):
+            self.stdout.write(
+                f'#{rank} {row.origin}  calls={row.calls} total={row.total_ms:.1f}ms '
+                f'mean={row.mean_ms:.1f}ms max={row.max_ms:.1f}ms  [{row.fingerprint[:12]}]'
+            )
+            self.stdout.write(f'    {row.sql}')
+            if options['explain'] and row.explain:
+                for line in row.explain.splitlines():
+                    self.stdout.write(f'      {line}')
@@ -0,0 +1,95 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+BENCHMARK_FILE = os.path.join(settings.BASE_DIR, 'docs', 'startup_benchmark.json')
+
+
+def _parse_importtime(stderr):
+    """Self time (ms) per top-level package from ``-X importtime`` output."""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(self_us) / 1000
+    return totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Time worker boot (settings, django.setup(), URL resolver, WSGI handler, first request) '
+        'in fresh interpreters and compare with docs/startup_benchmark.json.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--top', type=int, default=15, help='Show the N most expensive packages to import.')
+        parser.add_argument('--path', default='/api/health/', help='Path for the first request.')
+        parser.add_argument('--save', action='store_true', help='Record the result as the new baseline.')
+        parser.add_argument('--check', action='store_true', help='Fail if total boot time exceeds the baseline budget.')
+
+    def handle(self, *args, **options):
+        runs, imports = [], defaultdict(list)
+        for _ in range(options['runs']):
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-m', 'p2p.startup', options['path']],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+            )
+            if proc.returncode:
+                raise CommandError(proc.stderr[-2000:])
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            for package, ms in _parse_importtime(proc.stderr).items():
+                imports[package].append(ms)
+
+        phases = {name: statistics.median(run['phases'][name] for run in runs) for name in runs[0]['phases']}
+        total = round(statistics.median(run['total_ms'] for run in runs), 2)
+        for name, ms in phases.items():
+            self.stdout.write(f'{name:14} {ms:8.1f} ms')
+        self.stdout.write(f'{"total":14} {total:8.1f} ms  ({runs[0]["modules"]} modules, median of {len(runs)} runs)')
+
+        if options['top']:
+            self.stdout.write(f'\nTop {options["top"]} packages by import time:')
+            ranked = sorted(((statistics.median(v), k) for k, v in imports.items()), reverse=True)
+            for ms, package in ranked[:options['top']]:
+                self.stdout.write(f'  {package:30} {ms:7.1f} ms')
+
+        eager = runs[0]['eager_lazy_modules']
+        if eager:
+            self.stdout.write(self.style.WARNING(f'\nImported at boot but meant to be lazy: {", ".join(eager)}'))
+
+        result = {'phases': phases, 'total_ms': total, 'modules': runs[0]['modules']}
+        if options['save']:
+            baseline = self._load_baseline() or {}
+            result['budget_ms'] = baseline.get('budget_ms') or round(total * 1.5)
+            with open(BENCHMARK_FILE, 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f'\nSaved baseline to {os.path.relpath(BENCHMARK_FILE, settings.BASE_DIR)}')
+
+        if options['check']:
+            baseline = self._load_baseline()
+            if baseline is None:
+                raise CommandError('No baseline; run with --save first.')
+            failures = []
+            if total > baseline['budget_ms']:
+                failures.append(f'boot took {total:.1f} ms, budget is {baseline["budget_ms"]} ms')
+            if eager:
+                failures.append(f'lazy modules imported at boot: {", ".join(eager)}')
+            if failures:
+                raise CommandError('; '.join(failures))
+            self.stdout.write(self.style.SUCCESS(
+                f'\nWithin budget: {total:.1f} ms <= {baseline["budget_ms"]} ms (baseline {baseline["total_ms"]} ms)'
+            ))
+
+    def _load_baseline(self):
+        if not os.path.exists(BENCHMARK_FILE):
+            return None
+        with open(BENCHMARK_FILE) as f:
+            return json.load(f)
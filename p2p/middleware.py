@@ -0,0 +1,178 @@
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from . import models, profiling
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+re_accepts_br = re.compile(r'\bbr\b')
+
+
+class CompressionMiddleware:
+    """Brotli/gzip-compress response bodies above ``API_COMPRESSION_MIN_BYTES``.
+
+    Like Django's GZipMiddleware but with a configurable threshold and brotli
+    preferred when the client accepts it and the package is installed.
+    Streaming responses (e.g. PO PDF downloads) are left untouched.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'API_COMPRESSION_MIN_BYTES', 1024)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < self.min_bytes:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_br.search(accept):
+            encoding, compressed = 'br', brotli.compress(response.content, quality=4)
+        elif re_accepts_gzip.search(accept):
+            encoding, compressed = 'gzip', compress_string(response.content)
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
+
+
+def _query_recorder(queries):
+    def record_query(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            queries.append({'sql': sql, 'time_ms': round((time.perf_counter() - start) * 1000, 3)})
+    return record_query
+
+
+class SamplingProfilerMiddleware:
+    """Profile a sampled fraction of requests, or any request carrying a valid
+    ``X-Debug-Profile`` header issued to a staff user.
+
+    Raises MiddlewareNotUsed when ``PROFILER_ENABLED`` is off, so a disabled
+    profiler costs nothing per request. Under ASGI the sampler watches the
+    event loop thread, so async views show up with their coroutine frames.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        queries = []
+        record_query = _query_recorder(queries)
+        sampler = profiling.StackSampler().start()
+        try:
+            with connection.execute_wrapper(record_query):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        self.store(request, response, trigger, sampler, queries)
+        return response
+
+    async def __acall__(self, request):
+        # the staff lookup behind the header is the only database hit; skip it
+        # (and the thread hop) for the common case of no header
+        if profiling.header_user_id(request) is not None:
+            trigger = await sync_to_async(self.get_trigger)(request)
+        elif profiling.should_sample():
+            trigger = models.ProfileCapture.TRIGGER_SAMPLED
+        else:
+            trigger = None
+        if trigger is None:
+            return await self.get_response(request)
+
+        queries = []
+        record_query = _query_recorder(queries)
+        sampler = profiling.StackSampler().start()
+        try:
+            with connection.execute_wrapper(record_query):
+                response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        await sync_to_async(self.store)(request, response, trigger, sampler, queries)
+        return response
+
+    def get_trigger(self, request):
+        uid = profiling.header_user_id(request)
+        if uid is not None:
+            from django.contrib.auth import get_user_model
+
+            if get_user_model().objects.filter(pk=uid, is_staff=True, is_active=True).exists():
+                return models.ProfileCapture.TRIGGER_HEADER
+        if profiling.should_sample():
+            return models.ProfileCapture.TRIGGER_SAMPLED
+        return None
+
+    def store(self, request, response, trigger, sampler, queries):
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        if user is not None and not user.is_authenticated:
+            user = None
+        profile = getattr(user, 'profile', None) if user else None
+        models.ProfileCapture.objects.create(
+            trigger=trigger,
+            method=request.method,
+            path=request.path[:512],
+            route=(match.route if match else '')[:255],
+            view_name=(match.view_name if match else '')[:255],
+            status_code=response.status_code,
+            user=user,
+            user_role=profile.role if profile else '',
+            duration_ms=sampler.duration * 1000,
+            sample_count=sum(sampler.samples.values()),
+            queries=queries,
+            folded_stacks=sampler.folded(),
+        )
+        keep = getattr(settings, 'PROFILER_MAX_CAPTURES', 500)
+        stale = models.ProfileCapture.objects.order_by('-id').values_list('id', flat=True)[keep:keep + 1]
+        if stale:
+            models.ProfileCapture.objects.filter(id__lte=stale[0]).delete()
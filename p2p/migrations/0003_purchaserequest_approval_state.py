@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:06
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def required_approval_levels_for(amount):
+    # frozen copy of p2p.models.required_approval_levels_for as of this migration
+    thresholds = getattr(settings, 'APPROVAL_LEVEL_THRESHOLDS', {1: '0', 2: '0'})
+    levels = [level for level, minimum in thresholds.items() if Decimal(str(amount or 0)) >= Decimal(str(minimum))]
+    return max(levels + [1])
+
+
+def backfill_approval_state(apps, schema_editor):
+    PurchaseRequest = apps.get_model('p2p', 'PurchaseRequest')
+    batch = []
+    qs = PurchaseRequest.objects.annotate(last_level=Max('approvals__level')).only('amount', 'status')
+    for pr in qs.iterator(chunk_size=2000):
+        pr.required_approval_levels = required_approval_levels_for(pr.amount)
+        last = pr.last_level or 0
+        if pr.status == 'PENDING':
+            pr.current_level = last + 1
+        else:
+            pr.current_level = max(last, 1)
+        batch.append(pr)
+        if len(batch) >= 2000:
+            PurchaseRequest.objects.bulk_update(batch, ['required_approval_levels', 'current_level'])
+            batch = []
+    if batch:
+        PurchaseRequest.objects.bulk_update(batch, ['required_approval_levels', 'current_level'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p', '0002_outboxevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='current_level',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='required_approval_levels',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_approval_state, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='purchaserequest',
+            index=models.Index(fields=['status', 'current_level', 'created_at'], name='p2p_pr_approval_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from p2p.migrations._partitioning import convert_to_partitioned
+
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        convert_to_partitioned(
+            cursor, 'p2p_approval',
+            foreign_keys={'purchase_request_id': 'p2p_purchaserequest', 'approver_id': user_table},
+            indexes=[('purchase_request_id',), ('approver_id',)],
+        )
+        convert_to_partitioned(
+            cursor, 'p2p_receipt',
+            foreign_keys={'purchase_request_id': 'p2p_purchaserequest', 'uploaded_by_id': user_table},
+            indexes=[('purchase_request_id',), ('uploaded_by_id',)],
+        )
+
+
+class Migration(migrations.Migration):
+    """Monthly range partitions on created_at for Approval and Receipt (see p2p.partitions)."""
+
+    dependencies = [
+        ('p2p', '0007_archivedpurchaserequest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # the rebuilt tables keep the same columns, so Django's model state is unchanged
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
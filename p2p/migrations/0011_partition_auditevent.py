@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from p2p.migrations._partitioning import convert_to_partitioned
+
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        convert_to_partitioned(
+            cursor, 'p2p_auditevent',
+            foreign_keys={'actor_id': user_table},
+            indexes=[('subject_type', 'subject_id', 'id'), ('actor_id',)],
+        )
+        # keep the name Django's migration state knows
+        cursor.execute('ALTER INDEX p2p_auditevent_subject_type_subject_id_id_idx RENAME TO p2p_audit_subject_idx')
+
+
+class Migration(migrations.Migration):
+    """Monthly range partitions on created_at for AuditEvent (see p2p.partitions).
+
+    Separate from 0010 so the indexes and constraints Django defers to the end
+    of that migration exist before the table is rebuilt.
+    """
+
+    dependencies = [
+        ('p2p', '0010_auditevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_table, migrations.RunPython.noop),
+    ]
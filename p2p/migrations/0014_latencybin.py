@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p', '0013_preview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencyBin',
+            fields=[
+                ('pk', models.CompositePrimaryKey('metric', 'dimension', 'day', 'key', 'action', 'bin', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('metric', models.CharField(choices=[('wait', 'Wait at the decided level'), ('total', 'Creation to final decision')], max_length=8)),
+                ('dimension', models.CharField(choices=[('level', 'Approval level'), ('approver', 'Approver'), ('band', 'Amount band'), ('all', 'All decisions')], max_length=16)),
+                ('day', models.DateField()),
+                ('key', models.CharField(blank=True, max_length=64)),
+                ('action', models.CharField(max_length=20)),
+                ('bin', models.SmallIntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p', '0014_latencybin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestFingerprint',
+            fields=[
+                ('purchase_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='p2p.purchaserequest')),
+                ('signature', models.BinaryField()),
+                ('proforma_hash', models.CharField(blank=True, max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FingerprintBand',
+            fields=[
+                ('pk', models.CompositePrimaryKey('band', 'hash', 'purchase_request', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('band', models.PositiveSmallIntegerField()),
+                ('hash', models.BigIntegerField()),
+                ('purchase_request', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint_bands', to='p2p.purchaserequest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['purchase_request'], name='p2p_fpband_request_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,88 @@
+"""Frozen copy of the ``p2p.partitions`` helpers used by migrations 0008 and 0011.
+
+Migrations must keep doing what they did when they were written, so they do
+not import live app code; change ``p2p.partitions`` freely, not this module.
+The leading underscore keeps Django's migration loader from treating it as a
+migration.
+"""
+import datetime
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_y{month:%Y}m{month:%m}'
+
+
+def existing_partitions(cursor, table):
+    cursor.execute(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s',
+        [table],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_month_partition(cursor, table, month):
+    """Create the partition for ``month``; rows already sitting in the DEFAULT
+    partition for that range are moved into it before it is attached."""
+    name = partition_name(table, month)
+    if name in existing_partitions(cursor, table):
+        return False
+    start, end = month, add_months(month, 1)
+    cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {table}_default WHERE created_at >= %s AND created_at < %s RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved',
+        [start, end],
+    )
+    cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [start, end])
+    return True
+
+
+def ensure_partitions(cursor, table, months_ahead=3, since=None):
+    """Partitions from ``since`` (default: this month) up to ``months_ahead`` months out."""
+    today = month_start(datetime.date.today())
+    month = month_start(since) if since else today
+    created = []
+    while month <= add_months(today, months_ahead):
+        if ensure_month_partition(cursor, table, month):
+            created.append(partition_name(table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(cursor, table, foreign_keys, indexes, months_ahead=3):
+    """Rebuild ``table`` as a partitioned table, keeping data, ids and FKs.
+
+    ``foreign_keys`` maps column -> referenced table; ``indexes`` is a list of
+    column tuples to index on the partitioned parent.
+    """
+    legacy = f'{table}_legacy'
+    seq = f'{table}_part_id_seq'
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+    cursor.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)')
+    cursor.execute(f'CREATE SEQUENCE {seq} OWNED BY {table}.id')
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{seq}')")
+    cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)')
+    for column, target in foreign_keys.items():
+        cursor.execute(
+            f'ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {target} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+    for columns in indexes:
+        cursor.execute(f'CREATE INDEX {table}_{"_".join(columns)}_idx ON {table} ({", ".join(columns)})')
+    cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {legacy}')
+    cursor.execute(f'SELECT min(created_at) FROM {table}')
+    oldest = cursor.fetchone()[0]
+    ensure_partitions(cursor, table, months_ahead=months_ahead, since=oldest)
+    cursor.execute(f'SELECT setval(%s, COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)', [seq])
+    cursor.execute(f'DROP TABLE {legacy}')
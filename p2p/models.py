@@ -1,9 +1,15 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 import io
+import json
 import os
+import uuid
+import zlib
+from decimal import Decimal
 from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 User = get_user_model()
@@ -24,12 +30,50 @@ class UserProfile(models.Model):
         (ROLE_ADMIN, 'Admin'),
     ]
 
+    # approval level each approver role acts on
+    APPROVAL_LEVELS = {
+        ROLE_APPROVER_L1: 1,
+        ROLE_APPROVER_L2: 2,
+    }
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    role = models.CharField(max_length=32, choices=ROLE_CHOICES, default=ROLE_STAFF)
+    role = models.CharField(max_length=32, choices=ROLE_CHOICES, default=ROLE_STAFF, db_index=True)
 
     def __str__(self):
         return f"{self.user.username} ({self.role})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # snapshot for is_dirty() (signals.save_user_profile)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields}
+
+    def is_dirty(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return True
+        return any(getattr(self, name) != value for name, value in loaded.items())
+
+    @property
+    def approval_level(self):
+        return self.APPROVAL_LEVELS.get(self.role)
+
+
+def required_approval_levels_for(amount):
+    """Number of approval levels a request of `amount` needs.
+
+    `settings.APPROVAL_LEVEL_THRESHOLDS` maps each level to the minimum amount
+    that requires it; level 1 is always required.
+    """
+    thresholds = getattr(settings, 'APPROVAL_LEVEL_THRESHOLDS', {1: '0', 2: '0'})
+    levels = [level for level, minimum in thresholds.items() if Decimal(str(amount or 0)) >= Decimal(str(minimum))]
+    return max(levels + [1])
+
 
 
 class PurchaseRequest(models.Model):
@@ -48,14 +92,40 @@ class PurchaseRequest(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     currency = models.CharField(max_length=10, default='USD')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # level whose approver has to act next; kept in step with `Approval` rows by approve/reject
+    current_level = models.PositiveSmallIntegerField(default=1)
+    required_approval_levels = models.PositiveSmallIntegerField(default=1)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='requests')
     proforma = models.FileField(upload_to='proformas/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # "my pending approvals": status=PENDING AND current_level=N ORDER BY created_at
+            models.Index(fields=['status', 'current_level', 'created_at'], name='p2p_pr_approval_queue_idx'),
+            # list filters/ordering (p2p.filters); the default listing is by -created_at
+            models.Index(fields=['created_at'], name='p2p_pr_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='p2p_pr_status_created_idx'),
+            models.Index(fields=['status', 'currency', 'created_at'], name='p2p_pr_status_cur_created_idx'),
+            models.Index(fields=['currency', 'created_at'], name='p2p_pr_currency_created_idx'),
+            models.Index(fields=['amount'], name='p2p_pr_amount_idx'),
+            models.Index(fields=['status', 'amount'], name='p2p_pr_status_amount_idx'),
+        ]
+
     def __str__(self):
         return f"PR#{self.pk} {self.title} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        # amount may change while pending, so re-derive the required levels on full saves
+        if self.status == self.STATUS_PENDING and kwargs.get('update_fields') is None:
+            self.required_approval_levels = required_approval_levels_for(self.amount)
+        super().save(*args, **kwargs)
+
+    @property
+    def is_final_level(self):
+        return self.current_level >= self.required_approval_levels
+
 
 class RequestItem(models.Model):
     purchase_request = models.ForeignKey(PurchaseRequest, related_name='items', on_delete=models.CASCADE)
@@ -92,6 +162,14 @@ class PurchaseOrder(models.Model):
     generated_at = models.DateTimeField(auto_now_add=True)
     po_document = models.FileField(upload_to='purchase_orders/', null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # list filters/ordering (p2p.filters); the default listing is by -generated_at
+            models.Index(fields=['generated_at'], name='p2p_po_generated_idx'),
+            models.Index(fields=['vendor_name', 'generated_at'], name='p2p_po_vendor_generated_idx'),
+            models.Index(fields=['total_amount'], name='p2p_po_total_idx'),
+        ]
+
     def __str__(self):
         return f"PO {self.po_number} for PR#{self.purchase_request_id}"
 
@@ -167,6 +245,9 @@ class PurchaseOrder(models.Model):
         self.po_document.save(fname, content, save=True)
         buffer.close()
 
+        from .previews import schedule
+        schedule(self.po_document)
+
 
 class Receipt(models.Model):
     purchase_request = models.ForeignKey(PurchaseRequest, related_name='receipts', on_delete=models.CASCADE)
@@ -184,3 +265,317 @@ class Document(models.Model):
     file = models.FileField(upload_to='documents/')
     extracted_data = models.JSONField(default=dict, blank=True)
     processed_at = models.DateTimeField(null=True, blank=True)
+
+
+class OutboxEvent(models.Model):
+    """Notification written in the same transaction as the change it reports.
+
+    Rows are drained by the ``dispatch_outbox`` management command, so no
+    SMTP latency happens inside request transactions.
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_SENT = 'SENT'
+    STATUS_FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    EVENT_PR_APPROVED = 'purchase_request.approved'
+    EVENT_PR_REJECTED = 'purchase_request.rejected'
+
+    event_type = models.CharField(max_length=64)
+    recipient = models.EmailField()
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='p2p_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} -> {self.recipient} ({self.status})"
+
+
+class ProfileCapture(models.Model):
+    """A sampled request profile stored as folded stacks (flamegraph input)."""
+    TRIGGER_SAMPLED = 'sampled'
+    TRIGGER_HEADER = 'header'
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    trigger = models.CharField(max_length=16)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=512)
+    route = models.CharField(max_length=255, blank=True)
+    view_name = models.CharField(max_length=255, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    user_role = models.CharField(max_length=32, blank=True)
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField(default=0)
+    queries = models.JSONField(default=list, blank=True)
+    folded_stacks = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.method} {self.route or self.path} ({self.duration_ms:.0f}ms)"
+
+
+class SlowQuery(models.Model):
+    """Aggregate of slow queries per SQL fingerprint and originating view method."""
+    fingerprint = models.CharField(max_length=40)
+    origin = models.CharField(max_length=255)
+    sql = models.TextField()
+    calls = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+    explain = models.TextField(blank=True)
+    explained_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'slow queries'
+        constraints = [
+            models.UniqueConstraint(fields=['fingerprint', 'origin'], name='p2p_slowquery_fp_origin_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.origin}: {self.sql[:80]}"
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.calls if self.calls else 0
+
+
+class BackgroundJob(models.Model):
+    """Bulk operation queued from the admin and executed by `manage.py run_jobs`."""
+    KIND_APPROVE_REQUESTS = 'approve_requests'
+    KIND_REJECT_REQUESTS = 'reject_requests'
+    KIND_REGENERATE_PO_PDF = 'regenerate_po_pdf'
+
+    KIND_CHOICES = [
+        (KIND_APPROVE_REQUESTS, 'Approve purchase requests'),
+        (KIND_REJECT_REQUESTS, 'Reject purchase requests'),
+        (KIND_REGENERATE_PO_PDF, 'Regenerate PO PDFs'),
+    ]
+
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_DONE = 'DONE'
+    STATUS_FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    object_ids = models.JSONField(default=list)
+    params = models.JSONField(default=dict, blank=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='p2p_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} x{len(self.object_ids)} ({self.status})"
+
+
+class ArchivedPurchaseRequest(models.Model):
+    """Cold copy of a closed PurchaseRequest together with its items, approvals,
+    receipts and PO, stored as zlib-compressed JSON (see `manage.py archive_requests`)."""
+    id = models.BigIntegerField(primary_key=True)  # original PurchaseRequest id
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_requests')
+    status = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload = models.BinaryField()
+
+    def __str__(self):
+        return f"Archived PR#{self.pk} ({self.status})"
+
+    @property
+    def data(self):
+        return json.loads(zlib.decompress(bytes(self.payload)))
+
+
+class AuditEvent(models.Model):
+    """Append-only change log, written by `p2p.audit` in the transaction of the change.
+
+    `changes` holds only what changed, as `{field: [old, new]}` (see `p2p.audit`).
+    The subject is stored by type and id rather than by foreign key, so the
+    history outlives archived or deleted requests. Monthly partitions on
+    `created_at` (PostgreSQL, see `p2p.partitions`).
+    """
+    SUBJECT_REQUEST = 'pr'
+    SUBJECT_USER = 'user'
+
+    ACTION_CREATED = 'created'
+    ACTION_UPDATED = 'updated'
+    ACTION_APPROVED = 'approved'
+    ACTION_REJECTED = 'rejected'
+    ACTION_RECEIPT_SUBMITTED = 'receipt_submitted'
+    ACTION_ROLE_ASSIGNED = 'role_assigned'
+
+    subject_type = models.CharField(max_length=8)
+    subject_id = models.BigIntegerField()
+    action = models.CharField(max_length=32)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name='+')
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # history of one subject, newest first, paged by id (keyset)
+            models.Index(fields=['subject_type', 'subject_id', 'id'], name='p2p_audit_subject_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject_type}#{self.subject_id} {self.action} by {self.actor_id}"
+
+
+class Upload(models.Model):
+    """A resumable chunked upload (see `p2p.uploads`).
+
+    `file` names the final location from the start; chunks are written there
+    and attaching the upload points a FileField at the same name.
+    """
+    STATUS_IN_PROGRESS = 'IN_PROGRESS'
+    STATUS_COMPLETE = 'COMPLETE'
+    STATUS_ATTACHED = 'ATTACHED'
+
+    STATUS_CHOICES = [
+        (STATUS_IN_PROGRESS, 'In progress'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_ATTACHED, 'Attached'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    file = models.FileField(upload_to='uploads/')
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    # SHA-256 of each completed HASH_BLOCK_SIZE block, concatenated
+    block_digests = models.BinaryField(default=bytes)
+    content_hash = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_IN_PROGRESS)
+    attached_to = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='p2p_upload_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}, {self.status})"
+
+
+class Preview(models.Model):
+    """Thumbnails of a stored file, cached on disk by content hash (see `p2p.previews`)."""
+    STATUS_READY = 'READY'
+    STATUS_FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    source = models.CharField(max_length=255, unique=True)  # storage name of the file
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    pages = models.PositiveSmallIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES)
+    error = models.CharField(max_length=255, blank=True)
+    rendered_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.status}, {self.pages} page(s))"
+
+
+class LatencyBin(models.Model):
+    """One bin of a daily approval-latency sketch (see `p2p.latency`).
+
+    A sketch is the set of rows sharing (metric, dimension, key, action, day);
+    sketches merge by adding the counts of equal bins.
+    """
+    METRIC_WAIT = 'wait'
+    METRIC_TOTAL = 'total'
+
+    METRIC_CHOICES = [
+        (METRIC_WAIT, 'Wait at the decided level'),
+        (METRIC_TOTAL, 'Creation to final decision'),
+    ]
+
+    DIMENSION_LEVEL = 'level'
+    DIMENSION_APPROVER = 'approver'
+    DIMENSION_BAND = 'band'
+    DIMENSION_ALL = 'all'
+
+    DIMENSION_CHOICES = [
+        (DIMENSION_LEVEL, 'Approval level'),
+        (DIMENSION_APPROVER, 'Approver'),
+        (DIMENSION_BAND, 'Amount band'),
+        (DIMENSION_ALL, 'All decisions'),
+    ]
+
+    pk = models.CompositePrimaryKey('metric', 'dimension', 'day', 'key', 'action', 'bin')
+    metric = models.CharField(max_length=8, choices=METRIC_CHOICES)
+    dimension = models.CharField(max_length=16, choices=DIMENSION_CHOICES)
+    day = models.DateField()  # UTC day of the decision
+    key = models.CharField(max_length=64, blank=True)  # level, approver id or band label
+    action = models.CharField(max_length=20)
+    bin = models.SmallIntegerField()
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.metric}/{self.dimension}={self.key} {self.action} {self.day} bin {self.bin}: {self.count}"
+
+
+class RequestFingerprint(models.Model):
+    """MinHash signature of a purchase request, for near-duplicate detection (see `p2p.duplicates`)."""
+    purchase_request = models.OneToOneField(PurchaseRequest, primary_key=True, related_name='fingerprint', on_delete=models.CASCADE)
+    signature = models.BinaryField()
+    proforma_hash = models.CharField(max_length=64, blank=True)
+
+    def __str__(self):
+        return f"Fingerprint of PR#{self.purchase_request_id}"
+
+
+class FingerprintBand(models.Model):
+    """One LSH key of a request's fingerprint: requests sharing a (band, hash) are duplicate candidates."""
+    pk = models.CompositePrimaryKey('band', 'hash', 'purchase_request')
+    band = models.PositiveSmallIntegerField()
+    hash = models.BigIntegerField()
+    purchase_request = models.ForeignKey(PurchaseRequest, related_name='fingerprint_bands', on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        indexes = [
+            # replacing a request's keys on update
+            models.Index(fields=['purchase_request'], name='p2p_fpband_request_idx'),
+        ]
+
+    def __str__(self):
+        return f"PR#{self.purchase_request_id} band {self.band}: {self.hash}"
@@ -0,0 +1,147 @@
+"""Transactional outbox for workflow notifications.
+
+``enqueue_*`` helpers are called inside the request transaction that changes
+a PurchaseRequest, so the event commits (or rolls back) together with the
+status change. ``dispatch_batch`` is run by the ``dispatch_outbox`` command:
+it claims due events, coalesces them into one digest email per recipient and
+reschedules failures with exponential backoff.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# claimed events are not due again for this long (a dispatcher killed
+# mid-send leaves them to be retried after it)
+CLAIM_SECONDS = 300
+
+
+def enqueue(event_type, recipient, payload):
+    """Record an event; no-op when the recipient has no email address."""
+    if not recipient:
+        return None
+    return OutboxEvent.objects.create(event_type=event_type, recipient=recipient, payload=payload)
+
+
+def enqueue_decision(pr, event_type, actor, comment=''):
+    """Notify the requester that ``actor`` approved or rejected ``pr``."""
+    return enqueue(event_type, pr.created_by.email, {
+        'purchase_request_id': pr.pk,
+        'title': pr.title,
+        'status': pr.status,
+        'actor': actor.get_username(),
+        'comment': comment,
+    })
+
+
+def _describe(event):
+    p = event.payload
+    line = f"PR#{p.get('purchase_request_id')} \"{p.get('title', '')}\" is now {p.get('status')} (by {p.get('actor')})"
+    if p.get('comment'):
+        line += f": {p['comment']}"
+    return line
+
+
+def build_digest(recipient, events):
+    if len(events) == 1:
+        p = events[0].payload
+        subject = f"Purchase request PR#{p.get('purchase_request_id')} {str(p.get('status', '')).lower()}"
+    else:
+        subject = f"{len(events)} purchase request updates"
+    body = '\n'.join(f'- {_describe(e)}' for e in events)
+    return mail.EmailMessage(
+        subject=subject,
+        body=f"The following purchase requests changed:\n\n{body}\n",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient],
+    )
+
+
+def backoff(attempts):
+    base = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(cap, base * (2 ** (attempts - 1))))
+
+
+def _record_failure(events, exc, now, max_attempts):
+    for event in events:
+        event.attempts += 1
+        event.last_error = str(exc)[:1000]
+        if event.attempts >= max_attempts:
+            event.status = OutboxEvent.STATUS_FAILED
+        else:
+            event.next_attempt_at = now + backoff(event.attempts)
+
+
+def _claim(due, batch_size, until):
+    """Lock up to ``batch_size`` due events and push them out of the due set
+    until ``until``, so other dispatchers skip them once the locks are gone."""
+    with transaction.atomic():
+        events = list(due.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(next_attempt_at=until)
+    return events
+
+
+def dispatch_batch(batch_size=100, connection=None):
+    """Send one batch of due events; returns the number of events handled.
+
+    The mail connection is opened first: if that fails, a batch of due
+    events is charged one attempt and rescheduled, so a dead mail server
+    ends in ``OUTBOX_MAX_ATTEMPTS`` like any other failure. Rows are claimed
+    with ``SKIP LOCKED`` in a short transaction that marks them as not due
+    for ``CLAIM_SECONDS``; digests are sent after it commits, so no row lock
+    is held while talking to the mail server. Events of a dispatcher killed
+    mid-send are retried once the claim runs out.
+    """
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+    now = timezone.now()
+    due = OutboxEvent.objects.filter(status=OutboxEvent.STATUS_PENDING, next_attempt_at__lte=now)
+    if not due.exists():
+        return 0
+
+    connection = connection or mail.get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.warning('outbox mail connection failed: %s', exc)
+        with transaction.atomic():
+            events = list(due.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+            _record_failure(events, exc, now, max_attempts)
+            OutboxEvent.objects.bulk_update(events, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+        return len(events)
+
+    try:
+        events = _claim(due, batch_size, now + timedelta(seconds=CLAIM_SECONDS))
+        by_recipient = defaultdict(list)
+        for event in events:
+            by_recipient[event.recipient].append(event)
+
+        for recipient, group in by_recipient.items():
+            message = build_digest(recipient, group)
+            message.connection = connection
+            try:
+                message.send()
+            except Exception as exc:
+                logger.warning('outbox delivery to %s failed: %s', recipient, exc)
+                _record_failure(group, exc, now, max_attempts)
+                continue
+            for event in group:
+                event.attempts += 1
+                event.status = OutboxEvent.STATUS_SENT
+                event.sent_at = timezone.now()
+                event.last_error = ''
+    finally:
+        connection.close()
+
+    OutboxEvent.objects.bulk_update(
+        events, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    )
+    return len(events)
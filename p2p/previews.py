@@ -0,0 +1,298 @@
+"""Page thumbnails of proformas, receipts and PO documents.
+
+When a file is stored, ``schedule`` queues it for rendering once the
+transaction commits. The first ``PREVIEW_PAGES`` pages are rendered in a
+process pool (``PREVIEW_WORKERS``), so the request that stored the file does
+not wait. PDFs are rendered with pypdfium2, the renderer pdfplumber already
+depends on; PNG, JPEG and TIFF with PIL. The result is JPEGs
+``PREVIEW_WIDTH`` pixels wide.
+
+Images are cached on disk by content hash (``uploads.content_hash``), so the
+same file attached twice is rendered once. A ``Preview`` row maps each stored
+file name to its hash and page count. The cache is capped at
+``PREVIEW_CACHE_MAX_BYTES``: serving a page touches its mtime, and eviction
+removes the least recently served files first. A preview that was evicted,
+or never rendered, is queued again on its next request, which answers 202
+until it is ready.
+
+Preview URLs carry ``?v=<hash prefix>``. A URL with the current hash always
+returns the same bytes, so it is served as immutable for a year.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import OuterRef, Subquery
+
+logger = logging.getLogger(__name__)
+
+VERSION_LENGTH = 16
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# a name queued less than this many seconds ago is not queued again
+RESUBMIT_AFTER = 30
+
+_pool = None
+_in_worker = False
+_submitted = {}
+_written = 0
+
+
+def cache_path(content_hash, page, width=None):
+    width = width or settings.PREVIEW_WIDTH
+    return os.path.join(settings.PREVIEW_CACHE_DIR, content_hash[:2], f'{content_hash}-{width}-{page}.jpg')
+
+
+def is_cached(content_hash, pages):
+    return pages > 0 and all(os.path.exists(cache_path(content_hash, page)) for page in range(1, pages + 1))
+
+
+def hash_subquery(field):
+    """Annotation: content hash of the preview of the file in ``field``."""
+    from .models import Preview
+
+    return Subquery(Preview.objects.filter(source=OuterRef(field)).values('content_hash')[:1])
+
+
+def _pages_pdf(path, pages, width):
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        for index in range(min(pages, len(pdf))):
+            page = pdf[index]
+            try:
+                yield page.render(scale=width / page.get_width()).to_pil()
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+
+
+def _pages_image(path, pages, width):
+    from PIL import Image, ImageSequence
+
+    with Image.open(path) as image:
+        # multi-page TIFF scans yield one frame per page
+        for frame in islice(ImageSequence.Iterator(image), pages):
+            frame = frame.copy()
+            frame.thumbnail((width, width * 4))
+            yield frame
+
+
+RENDERERS = {
+    'application/pdf': _pages_pdf,
+    'image/png': _pages_image,
+    'image/jpeg': _pages_image,
+    'image/tiff': _pages_image,
+}
+
+
+class UnsupportedFile(Exception):
+    pass
+
+
+def render_file(path, content_hash, pages=None, width=None):
+    """Render the first pages of ``path`` into the cache; returns the page count."""
+    from .uploads import SNIFF_BYTES, sniff
+
+    pages = pages or settings.PREVIEW_PAGES
+    width = width or settings.PREVIEW_WIDTH
+    with open(path, 'rb') as f:
+        renderer = RENDERERS.get(sniff(f.read(SNIFF_BYTES)))
+    if renderer is None:
+        raise UnsupportedFile('No preview for this file type.')
+    os.makedirs(os.path.dirname(cache_path(content_hash, 1, width)), exist_ok=True)
+    count = written = 0
+    for count, image in enumerate(renderer(path, pages, width), 1):
+        target = cache_path(content_hash, count, width)
+        # write then rename, so a reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as out:
+            image.convert('RGB').save(out, 'JPEG', quality=settings.PREVIEW_QUALITY, optimize=True)
+            written += out.tell()
+        os.replace(tmp, target)
+    _note_written(written)
+    return count
+
+
+def _note_written(size):
+    # evict after every 5% of the cap written by this process
+    global _written
+    _written += size
+    if _written >= settings.PREVIEW_CACHE_MAX_BYTES // 20:
+        _written = 0
+        evict()
+
+
+def render(source, content_hash=''):
+    """Pool task: cache the preview of the stored file ``source`` and record it."""
+    from django.core.files.storage import default_storage
+
+    from .models import Preview
+    from .uploads import content_hash as hash_file
+
+    close_old_connections()
+    values = {'content_hash': content_hash, 'status': Preview.STATUS_READY, 'pages': 0, 'error': ''}
+    try:
+        path = default_storage.path(source)
+        if not content_hash:
+            with open(path, 'rb') as f:
+                values['content_hash'] = content_hash = hash_file(f)
+        done = Preview.objects.filter(content_hash=content_hash, status=Preview.STATUS_READY).order_by('-pages').first()
+        if done is not None and is_cached(content_hash, done.pages):
+            values['pages'] = done.pages
+        else:
+            values['pages'] = render_file(path, content_hash)
+    except UnsupportedFile as exc:
+        values.update(status=Preview.STATUS_FAILED, error=str(exc))
+    except Exception:
+        # corrupt or missing file: record it, so requests stop queueing it again
+        logger.exception('could not render a preview of %s', source)
+        values.update(status=Preview.STATUS_FAILED, error='Could not render this file.')
+    try:
+        Preview.objects.update_or_create(source=source, defaults=values)
+        if values['content_hash']:
+            from .duplicates import index_proforma
+
+            index_proforma(source, values['content_hash'])
+    finally:
+        close_old_connections()
+
+
+def render_po(po_id):
+    """Pool task for a PO whose PDF was never generated."""
+    from .models import PurchaseOrder
+
+    close_old_connections()
+    po = PurchaseOrder.objects.filter(pk=po_id).first()
+    if po is None:
+        return
+    if po.po_document:
+        render(po.po_document.name)
+    else:
+        # generate_pdf schedules the preview, which runs inline in a pool worker
+        po.generate_pdf()
+
+
+def _init_worker():
+    global _in_worker
+    django.setup()
+    _in_worker = True
+
+
+def make_pool(workers=None):
+    """A process pool for preview tasks.
+
+    Workers are spawned and run ``django.setup`` first, like the
+    password-hashing pool in ``p2p.provisioning``.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers or settings.PREVIEW_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+    )
+
+
+def pool():
+    """This process's preview pool, started on first use."""
+    global _pool
+    if _pool is None:
+        _pool = make_pool()
+    return _pool
+
+
+def _log_failure(future):
+    exc = future.exception()
+    if exc is not None:
+        logger.error('preview rendering failed', exc_info=exc)
+
+
+def submit(task, *args):
+    """Run ``task`` in the pool (inline when ``PREVIEW_WORKERS`` is 0)."""
+    global _pool
+    if settings.PREVIEW_WORKERS <= 0 or _in_worker:
+        task(*args)
+        return
+    try:
+        future = pool().submit(task, *args)
+    except BrokenProcessPool:
+        # a worker died (e.g. killed while rendering); start a fresh pool
+        _pool = None
+        future = pool().submit(task, *args)
+    future.add_done_callback(_log_failure)
+
+
+def request_render(key, task, *args):
+    """Queue ``task`` unless ``key`` was queued in the last RESUBMIT_AFTER seconds."""
+    now = time.monotonic()
+    if now - _submitted.get(key, -RESUBMIT_AFTER) < RESUBMIT_AFTER:
+        return
+    _submitted[key] = now
+    if len(_submitted) > 10000:
+        _submitted.clear()
+    submit(task, *args)
+
+
+def schedule(field_file, content_hash=''):
+    """Queue the preview of a just-stored file once the transaction commits.
+
+    ``content_hash`` saves reading the file again when it is already known
+    (finalized uploads).
+    """
+    if not field_file:
+        return
+    name = field_file.name
+    transaction.on_commit(lambda: request_render(name, render, name, content_hash))
+
+
+def evict(max_bytes=None):
+    """Delete the least recently served previews until the cache fits ``max_bytes``.
+
+    Removes down to 90% of the cap, so that eviction does not run again at the
+    next write. Returns the number of files removed.
+    """
+    max_bytes = settings.PREVIEW_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries, total = [], 0
+    try:
+        shards = list(os.scandir(settings.PREVIEW_CACHE_DIR))
+    except FileNotFoundError:
+        return 0
+    for shard in shards:
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0
+    removed, target = 0, max_bytes * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def touch(path):
+    """Mark a cached page as recently served (LRU order is by mtime)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
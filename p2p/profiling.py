@@ -0,0 +1,79 @@
+"""Low-overhead sampling profiler for live requests.
+
+A daemon thread snapshots the request thread's stack every
+``PROFILER_INTERVAL`` seconds via ``sys._current_frames()`` and aggregates
+the samples as folded stacks (``frame;frame;frame count``), which
+flamegraph.pl, speedscope and inferno read directly.
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+SIGNING_SALT = 'p2p.profiler'
+HEADER = 'HTTP_X_DEBUG_PROFILE'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+
+class StackSampler:
+
+    def __init__(self, thread_id=None, interval=None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval or getattr(settings, 'PROFILER_INTERVAL', 0.005)
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='p2p-profiler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common())
+
+
+def make_debug_token(user):
+    """Signed value for the ``X-Debug-Profile`` header, bound to ``user``."""
+    return signing.dumps({'uid': user.pk}, salt=SIGNING_SALT)
+
+
+def header_user_id(request):
+    """User id from a valid ``X-Debug-Profile`` header, else None."""
+    value = request.META.get(HEADER)
+    if not value:
+        return None
+    max_age = getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 3600)
+    try:
+        return signing.loads(value, salt=SIGNING_SALT, max_age=max_age).get('uid')
+    except signing.BadSignature:
+        return None
+
+
+def should_sample():
+    rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
@@ -0,0 +1,111 @@
+"""Bulk user provisioning (``POST /api/users/bulk/``, ``manage.py provision_users``).
+
+Password hashing dominates the cost of creating a user (PBKDF2 with Django's
+default iteration count takes a few hundred ms), so passwords are hashed in a
+process pool: the caller's, or this process's own, started on first use and
+kept for the life of the process. Users and their ``UserProfile`` rows are
+then written with two ``bulk_create`` calls in one transaction.
+``bulk_create`` sends no ``post_save``, so the per-user profile signals are
+bypassed on purpose.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import models
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+# below this many passwords the pool start-up costs more than it saves
+POOL_THRESHOLD = 4
+
+_pool = None
+
+
+def hash_workers():
+    return getattr(settings, 'PROVISIONING_HASH_WORKERS', 0) or os.cpu_count() or 1
+
+
+def hash_pool(workers=None):
+    """A process pool for ``hash_passwords``; reuse it across batches.
+
+    Workers are spawned, not forked, so they never inherit the parent's
+    database sockets. The initializer is ``django.setup`` itself: importing
+    this module in the child would load models before the app registry.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers or hash_workers(),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def pool():
+    """This process's hashing pool, started on first use."""
+    global _pool
+    if _pool is None:
+        _pool = hash_pool()
+    return _pool
+
+
+def hash_passwords(passwords, executor=None):
+    """``make_password`` for each entry; blank entries get an unusable password.
+
+    Hashes in ``executor``, or in this process's pool when none is given.
+    """
+    global _pool
+    passwords = [password or None for password in passwords]
+    if sum(1 for password in passwords if password) < POOL_THRESHOLD:
+        return [make_password(password) for password in passwords]
+    if executor is not None:
+        return list(executor.map(make_password, passwords, chunksize=16))
+    try:
+        return list(pool().map(make_password, passwords, chunksize=16))
+    except BrokenProcessPool:
+        # a worker died (e.g. killed by the OOM killer); start a fresh pool
+        _pool = None
+        return list(pool().map(make_password, passwords, chunksize=16))
+
+
+def provision_users(rows, default_role=models.UserProfile.ROLE_STAFF, executor=None):
+    """Create users from ``rows`` (dicts with ``username`` and optionally
+    email, first_name, last_name, role, password).
+
+    Usernames that already exist are skipped and reported; the rest are
+    created all-or-nothing. Returns ``{'created': [{'id', 'username',
+    'role'}, ...], 'skipped': [username, ...]}``.
+    """
+    User = get_user_model()
+    existing = set(
+        User.objects.filter(username__in=[row['username'] for row in rows]).values_list('username', flat=True)
+    )
+    seen, fresh, skipped = set(), [], []
+    for row in rows:
+        if row['username'] in existing or row['username'] in seen:
+            skipped.append(row['username'])
+            continue
+        seen.add(row['username'])
+        fresh.append(row)
+
+    hashes = hash_passwords([row.get('password') for row in fresh], executor)
+    users = [
+        User(password=hashed, **{field: row.get(field) or '' for field in USER_FIELDS})
+        for row, hashed in zip(fresh, hashes)
+    ]
+    with transaction.atomic():
+        users = User.objects.bulk_create(users, batch_size=1000)
+        profiles = models.UserProfile.objects.bulk_create(
+            [models.UserProfile(user=user, role=row.get('role') or default_role) for user, row in zip(users, fresh)],
+            batch_size=1000,
+        )
+    return {
+        'created': [{'id': user.pk, 'username': user.username, 'role': profile.role} for user, profile in zip(users, profiles)],
+        'skipped': skipped,
+    }
@@ -0,0 +1,194 @@
+"""Slow-query log with origin attribution and EXPLAIN capture.
+
+``install()`` adds an execute wrapper to every new DB connection. Queries
+slower than ``SLOW_QUERY_THRESHOLD_MS`` are fingerprinted (literals and IN
+lists normalised), attributed to the view method that issued them (e.g.
+``PurchaseOrderViewSet.get_queryset``) and handed to a background thread.
+That thread aggregates them into ``SlowQuery`` rows and, the first time a
+fingerprint/origin pair is seen, stores ``EXPLAIN (ANALYZE, BUFFERS)`` for it
+(plain ``EXPLAIN`` for statements that write). Nothing is written from
+inside the request's own connection or transaction.
+"""
+import hashlib
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_queue = queue.Queue(maxsize=10000)
+_worker = None
+_worker_lock = threading.Lock()
+
+_re_string = re.compile(r"'(?:[^']|'')*'")
+_re_number = re.compile(r'\b\d+(?:\.\d+)?\b')
+_re_in_list = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_re_space = re.compile(r'\s+')
+
+
+def normalize(sql):
+    sql = _re_string.sub('?', sql)
+    sql = _re_number.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _re_in_list.sub('IN (...)', sql)
+    return _re_space.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()
+
+
+def find_origin():
+    """Name the innermost view method (``Class.method``) on the current stack."""
+    from rest_framework.views import APIView
+
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        obj = frame.f_locals.get('self')
+        if isinstance(obj, APIView):
+            return f'{type(obj).__name__}.{frame.f_code.co_name}'
+        module = frame.f_globals.get('__name__', '')
+        if fallback is None and module.startswith('p2p.') and module != __name__:
+            fallback = f'{module}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    if getattr(_local, 'suppressed', False):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+            record(sql, params, many, elapsed_ms, context['connection'].alias)
+
+
+def record(sql, params, many, elapsed_ms, alias):
+    normalized = normalize(sql)
+    event = {
+        'fingerprint': fingerprint(normalized),
+        'sql': normalized,
+        'raw_sql': sql,
+        'params': None if many else params,
+        'origin': find_origin()[:255],
+        'ms': elapsed_ms,
+        'alias': alias,
+    }
+    logger.warning('slow query %.1fms from %s: %s', elapsed_ms, event['origin'], normalized[:200])
+    _ensure_worker()
+    try:
+        _queue.put_nowait(event)
+    except queue.Full:
+        pass
+
+
+def install(sender=None, connection=None, **kwargs):
+    """``connection_created`` receiver; idempotent."""
+    if not getattr(settings, 'SLOW_QUERY_LOG_ENABLED', False):
+        return
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='p2p-slow-query-log', daemon=True)
+            _worker.start()
+
+
+def _reset_after_fork():
+    """The flush thread does not survive ``fork()`` (gunicorn ``--preload``);
+    give the child a fresh queue and lock so it starts its own."""
+    global _queue, _worker, _worker_lock
+    _queue = queue.Queue(maxsize=10000)
+    _worker = None
+    _worker_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _run():
+    _local.suppressed = True
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + 1.0
+        while len(batch) < 500 and time.monotonic() < deadline:
+            try:
+                batch.append(_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        try:
+            flush(batch)
+        except Exception:
+            logger.exception('could not store slow queries')
+        finally:
+            from django.db import close_old_connections
+
+            close_old_connections()
+
+
+def flush(events):
+    """Merge ``events`` into the ``SlowQuery`` aggregates."""
+    from django.db.models import F
+    from django.db.models.functions import Greatest
+    from django.utils import timezone
+
+    from .models import SlowQuery
+
+    grouped = defaultdict(list)
+    for event in events:
+        grouped[(event['fingerprint'], event['origin'])].append(event)
+
+    now = timezone.now()
+    for (fp, origin), group in grouped.items():
+        sample = max(group, key=lambda e: e['ms'])
+        row, created = SlowQuery.objects.get_or_create(
+            fingerprint=fp, origin=origin, defaults={'sql': sample['sql']},
+        )
+        SlowQuery.objects.filter(pk=row.pk).update(
+            calls=F('calls') + len(group),
+            total_ms=F('total_ms') + sum(e['ms'] for e in group),
+            max_ms=Greatest(F('max_ms'), sample['ms']),
+            last_seen=now,
+        )
+        if created:
+            plan = explain(sample)
+            if plan:
+                SlowQuery.objects.filter(pk=row.pk).update(explain=plan, explained_at=timezone.now())
+
+
+def explain(event):
+    """EXPLAIN the sampled statement; ANALYZE only runs for read-only statements."""
+    from django.db import connections, transaction
+
+    connection = connections[event['alias']]
+    if connection.vendor != 'postgresql':
+        return ''
+    is_read = event['raw_sql'].lstrip().upper().startswith(('SELECT', 'WITH'))
+    prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if is_read else 'EXPLAIN '
+    try:
+        with transaction.atomic(using=event['alias']):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + event['raw_sql'], event['params'])
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            transaction.set_rollback(True, using=event['alias'])
+        return plan
+    except Exception as exc:
+        return f'EXPLAIN failed: {exc}'
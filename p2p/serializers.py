@@ -1,5 +1,13 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
-from . import models
+from rest_framework.reverse import reverse
+from . import audit, duplicates, models, previews, uploads, workflow
+from .items import MESSAGES as ITEM_MESSAGES, ItemsParseError, ParsedItems
+from .fieldsets import SparseFieldsetSerializerMixin
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -13,23 +21,81 @@ class RequestItemSerializer(serializers.ModelSerializer):
     def validate_quantity(self, value):
         if value is None:
             return value
-        if int(value) <= 0:
-            raise serializers.ValidationError('quantity must be positive')
+        if value <= 0:
+            raise serializers.ValidationError(ITEM_MESSAGES['quantity_positive'])
         return value
 
     def validate_unit_price(self, value):
-        try:
-            if float(value) < 0:
-                raise serializers.ValidationError('unit_price must be non-negative')
-        except Exception:
-            raise serializers.ValidationError('unit_price must be a number')
+        # DecimalField has already parsed the value exactly
+        if value < 0:
+            raise serializers.ValidationError(ITEM_MESSAGES['unit_price_negative'])
         return value
 
 
-class PurchaseOrderSerializer(serializers.ModelSerializer):
+@extend_schema_field(RequestItemSerializer(many=True))
+class ItemsField(serializers.Field):
+    """PR line items as a list (JSON body), a JSON string or a JSON file part
+    (multipart). Validated batch by batch by ``p2p.items``; the validated
+    value is a ``ParsedItems`` that writes the items on save."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and not data.strip():
+            data = []
+        if not isinstance(data, (list, tuple, str, bytes)) and not hasattr(data, 'read'):
+            raise serializers.ValidationError('items must be a JSON array')
+        parsed = ParsedItems(data)
+        try:
+            errors = parsed.validate()
+        except ItemsParseError as exc:
+            raise serializers.ValidationError(str(exc))
+        if errors:
+            # same shape as a `many=True` nested serializer: one entry per item
+            raise serializers.ValidationError([errors.get(i, {}) for i in range(parsed.count)])
+        return parsed
+
+    def to_representation(self, value):
+        return RequestItemSerializer(many=True).to_representation(value)
+
+
+@extend_schema_field({'type': 'string', 'format': 'uri', 'nullable': True, 'readOnly': True})
+class PreviewURLField(serializers.Field):
+    """URL of the thumbnail endpoint for the file in ``source``, or null.
+
+    The URL carries ``?v=`` with the file's content hash when the queryset
+    annotated it as ``hash_attr`` (``previews.hash_subquery``); such URLs are
+    served with year-long cache headers.
+    """
+
+    def __init__(self, view_name, hash_attr, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.view_name = view_name
+        self.hash_attr = hash_attr
+
+    def get_attribute(self, instance):
+        return instance if super().get_attribute(instance) else None
+
+    def to_representation(self, instance):
+        url = reverse(self.view_name, kwargs={'pk': instance.pk}, request=self.context.get('request'))
+        content_hash = getattr(instance, self.hash_attr, None)
+        if content_hash:
+            url += f'?v={content_hash[:previews.VERSION_LENGTH]}'
+        return url
+
+
+class PurchaseOrderSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    po_preview = PreviewURLField('purchaseorders-preview', 'po_document_hash', source='po_document')
+
     class Meta:
         model = models.PurchaseOrder
-        fields = ('id', 'po_number', 'vendor_name', 'items', 'total_amount', 'generated_at', 'po_document')
+        fields = ('id', 'po_number', 'vendor_name', 'items', 'total_amount', 'generated_at', 'po_document', 'po_preview')
+
+
+class PurchaseOrderSummarySerializer(PurchaseOrderSerializer):
+    """Compact list representation; `items` only via `?expand=items`."""
+
+    class Meta(PurchaseOrderSerializer.Meta):
+        fields = ('id', 'po_number', 'vendor_name', 'total_amount', 'generated_at', 'po_preview')
 
 
 class PurchaseRequestMultipartSerializer(serializers.Serializer):
@@ -37,70 +103,160 @@ class PurchaseRequestMultipartSerializer(serializers.Serializer):
     description = serializers.CharField(required=False, allow_blank=True)
     amount = serializers.CharField(required=False)
     currency = serializers.CharField(required=False)
-    items = serializers.CharField(required=False, allow_blank=True, help_text='JSON array string of items')
+    items = serializers.CharField(
+        required=False, allow_blank=True, help_text='JSON array of items, as a string or as a JSON file part for large lists'
+    )
     proforma = serializers.FileField(required=False)
+    proforma_upload = serializers.UUIDField(required=False, help_text='Finalized upload to use as the proforma, instead of `proforma`')
 
-    def to_internal_value(self, data):
-        # reuse PurchaseRequestSerializer logic by converting items JSON string into list
-        data = data.copy()
-        if 'items' in data and isinstance(data['items'], str):
-            try:
-                import json
-                data['items'] = json.loads(data['items'])
-            except Exception:
-                # leave as string to allow validation to catch
-                pass
-        return super().to_internal_value(data)
-
-
-class PurchaseRequestSerializer(serializers.ModelSerializer):
-    items = RequestItemSerializer(many=True, required=False)
+
+class DuplicateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=models.PurchaseRequest.STATUS_CHOICES)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    currency = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    similarity = serializers.FloatField(help_text='Estimated share of title words, items and amount in common (0-1).')
+    same_proforma = serializers.BooleanField()
+
+
+class PurchaseRequestSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    items = ItemsField(required=False)
     created_by = serializers.ReadOnlyField(source='created_by.username')
+    proforma_upload = serializers.UUIDField(
+        write_only=True, required=False, help_text='Id of a finalized upload (`/api/uploads/`) to attach as the proforma.'
+    )
+    proforma_preview = PreviewURLField('requests-preview', 'proforma_hash', source='proforma')
+    likely_duplicates = serializers.SerializerMethodField()
 
     class Meta:
         model = models.PurchaseRequest
-        fields = ('id', 'title', 'description', 'amount', 'currency', 'status', 'created_by', 'items', 'proforma', 'created_at')
-        read_only_fields = ('status', 'created_at')
+        fields = ('id', 'title', 'description', 'amount', 'currency', 'status', 'current_level', 'required_approval_levels', 'created_by', 'items', 'proforma', 'proforma_upload', 'proforma_preview', 'likely_duplicates', 'created_at')
+        read_only_fields = ('status', 'current_level', 'required_approval_levels', 'created_at')
+
+    AUDITED_FIELDS = ('title', 'description', 'amount', 'currency', 'proforma', 'required_approval_levels')
+    # changes to these re-fingerprint the request (p2p.duplicates)
+    FINGERPRINTED_FIELDS = ('title', 'amount', 'currency', 'proforma')
+
+    @extend_schema_field(DuplicateSerializer(many=True, allow_null=True))
+    def get_likely_duplicates(self, obj):
+        """Set by create/update only; other reads use the `duplicates` action."""
+        found = getattr(obj, 'likely_duplicates', None)
+        return None if found is None else DuplicateSerializer(found, many=True).data
+
+    def _actor(self):
+        request = self.context.get('request')
+        return getattr(request, 'user', None)
+
+    def _visible(self):
+        """Requests the caller may read; likely duplicates are limited to them."""
+        actor = self._actor()
+        return workflow.visible_requests(actor) if actor is not None else models.PurchaseRequest.objects.none()
+
+    def _save_items(self, parsed, pr, audit_rows):
+        """Insert the items into ``pr``, yielding their rows for the fingerprint;
+        also collects them into ``audit_rows`` when the audit diff keeps rows."""
+        keep = parsed.count <= audit.ITEMS_DIFF_LIMIT
+        for clean in parsed.save_to(pr):
+            if keep:
+                audit_rows.extend(clean)
+            yield from clean
+
+    def _claim_proforma(self, upload_id):
+        try:
+            return uploads.claim(upload_id, self._actor())
+        except uploads.UploadError as exc:
+            raise serializers.ValidationError({'proforma_upload': [exc.detail]})
+
+    def _proforma_hash(self, pr, upload):
+        # never read the file here: the preview task hashes it after commit and re-indexes
+        if upload:
+            return upload.content_hash
+        return duplicates.proforma_hash_of(pr, read=False)
 
     def create(self, validated_data):
-        items_data = validated_data.pop('items', [])
-        pr = models.PurchaseRequest.objects.create(**validated_data)
-        for item in items_data:
-            models.RequestItem.objects.create(purchase_request=pr, **item)
+        parsed = validated_data.pop('items', None)
+        upload_id = validated_data.pop('proforma_upload', None)
+        with transaction.atomic():
+            upload = self._claim_proforma(upload_id) if upload_id else None
+            if upload:
+                # the FileField points at the uploaded file; nothing is copied
+                validated_data['proforma'] = upload.file.name
+            pr = models.PurchaseRequest.objects.create(**validated_data)
+            if upload:
+                uploads.mark_attached(upload, pr)
+            previews.schedule(pr.proforma, upload.content_hash if upload else '')
+            changes = audit.diff({}, audit.snapshot(pr, ('title', 'amount', 'currency', 'proforma')))
+            # the items are inserted while fingerprinting: one pass over the payload
+            audit_rows = []
+            rows = self._save_items(parsed, pr, audit_rows) if parsed is not None else ()
+            pr.likely_duplicates = duplicates.index(pr, rows, self._proforma_hash(pr, upload), new=True, visible=self._visible())
+            if parsed is not None:
+                changes['items'] = audit.items_diff([], 0, audit_rows, parsed.count)
+            audit.record_request(pr, models.AuditEvent.ACTION_CREATED, self._actor(), changes)
         return pr
 
     def update(self, instance, validated_data):
         # allow updating fields and items; when items present, replace existing items
-        items_data = validated_data.pop('items', None)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        if items_data is not None:
-            instance.items.all().delete()
-            for item in items_data:
-                models.RequestItem.objects.create(purchase_request=instance, **item)
+        parsed = validated_data.pop('items', None)
+        upload_id = validated_data.pop('proforma_upload', None)
+        with transaction.atomic():
+            upload = self._claim_proforma(upload_id) if upload_id else None
+            if upload:
+                validated_data['proforma'] = upload.file.name
+            before = audit.snapshot(instance, self.AUDITED_FIELDS)
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            if upload:
+                uploads.mark_attached(upload, instance)
+            if 'proforma' in validated_data:
+                previews.schedule(instance.proforma, upload.content_hash if upload else '')
+            changes = audit.diff(before, audit.snapshot(instance, self.AUDITED_FIELDS))
+            audit_rows = []
+            if parsed is not None:
+                old_rows, old_count = audit.item_rows(instance.items.all())
+                instance.items.all().delete()
+            # new items are inserted while fingerprinting: one pass over the payload
+            if parsed is not None or any(field in validated_data for field in self.FINGERPRINTED_FIELDS):
+                rows = self._save_items(parsed, instance, audit_rows) if parsed is not None else duplicates.item_rows(instance)
+                if 'proforma' in validated_data:
+                    proforma_hash = self._proforma_hash(instance, upload)
+                else:
+                    proforma_hash = models.RequestFingerprint.objects.filter(purchase_request=instance).values_list('proforma_hash', flat=True).first()
+                    if proforma_hash is None:
+                        proforma_hash = self._proforma_hash(instance, None)
+                        if not proforma_hash:
+                            previews.schedule(instance.proforma)
+                instance.likely_duplicates = duplicates.index(instance, rows, proforma_hash, visible=self._visible())
+            if parsed is not None:
+                items_changes = audit.items_diff(old_rows, old_count, audit_rows, parsed.count)
+                if items_changes:
+                    changes['items'] = items_changes
+            if changes:
+                audit.record_request(instance, models.AuditEvent.ACTION_UPDATED, self._actor(), changes)
         return instance
 
-    def to_internal_value(self, data):
-        # Support multipart form where `items` may be a JSON string
-        if 'items' in data and isinstance(data['items'], str):
-            try:
-                import json
-                data = data.copy()
-                data['items'] = json.loads(data['items'])
-            except Exception:
-                # leave as-is and let validation report error
-                pass
-        return super().to_internal_value(data)
-
     def validate_amount(self, value):
-        try:
-            if float(value) < 0:
-                raise serializers.ValidationError('amount must be non-negative')
-        except Exception:
-            raise serializers.ValidationError('amount must be a number')
+        if value < 0:
+            raise serializers.ValidationError('amount must be non-negative')
         return value
 
+    def validate(self, attrs):
+        if attrs.get('proforma') and attrs.get('proforma_upload'):
+            raise serializers.ValidationError({'proforma_upload': ['Send either `proforma` or `proforma_upload`, not both.']})
+        return attrs
+
+
+class PurchaseRequestSummarySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """Compact list representation; `items` only via `?expand=items`."""
+    proforma_preview = PreviewURLField('requests-preview', 'proforma_hash', source='proforma')
+
+    class Meta:
+        model = models.PurchaseRequest
+        fields = ('id', 'title', 'amount', 'currency', 'status', 'current_level', 'proforma_preview', 'created_at')
+        read_only_fields = fields
+
 
 class ApprovalSerializer(serializers.ModelSerializer):
     approver = serializers.ReadOnlyField(source='approver.username')
@@ -111,7 +267,38 @@ class ApprovalSerializer(serializers.ModelSerializer):
         read_only_fields = ('approver', 'created_at')
 
 
-class UserSerializer(serializers.ModelSerializer):
+class AuditEventSerializer(serializers.ModelSerializer):
+    actor = serializers.ReadOnlyField(source='actor.username', default=None)
+
+    class Meta:
+        model = models.AuditEvent
+        fields = ('id', 'action', 'actor', 'changes', 'created_at')
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(min_value=1, help_text='Total size in bytes.')
+
+    class Meta:
+        model = models.Upload
+        fields = ('id', 'filename', 'size', 'offset', 'content_type', 'content_hash', 'status', 'attached_to', 'created_at', 'expires_at')
+        read_only_fields = ('offset', 'content_type', 'content_hash', 'status', 'attached_to', 'created_at', 'expires_at')
+
+
+class UploadFinalizeSerializer(serializers.Serializer):
+    content_hash = serializers.CharField(
+        required=False, max_length=64, help_text='Optional client-side block hash to verify (see README).'
+    )
+
+
+class UploadDocumentSerializer(serializers.Serializer):
+    type = serializers.CharField(max_length=32)
+
+
+class UploadDocumentResponseSerializer(serializers.Serializer):
+    document_id = serializers.IntegerField()
+
+
+class UserSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     role = serializers.CharField(source='profile.role', read_only=True)
     password = serializers.CharField(write_only=True, required=False, allow_null=True)
 
@@ -140,6 +327,42 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
+class UserSummarySerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        fields = ('id', 'username', 'role')
+
+
+class ArchivedPurchaseRequestSerializer(serializers.ModelSerializer):
+    created_by = serializers.ReadOnlyField(source='created_by.username')
+
+    class Meta:
+        model = models.ArchivedPurchaseRequest
+        fields = ('id', 'status', 'amount', 'created_by', 'created_at', 'archived_at')
+
+
+class ProfileCaptureSerializer(serializers.ModelSerializer):
+    user = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = models.ProfileCapture
+        fields = ('id', 'created_at', 'trigger', 'method', 'path', 'route', 'view_name', 'status_code', 'user', 'user_role', 'duration_ms', 'sample_count', 'queries', 'folded_stacks')
+
+
+class ProfileCaptureSummarySerializer(ProfileCaptureSerializer):
+    query_count = serializers.SerializerMethodField()
+
+    class Meta(ProfileCaptureSerializer.Meta):
+        fields = ('id', 'created_at', 'trigger', 'method', 'path', 'route', 'status_code', 'user', 'user_role', 'duration_ms', 'sample_count', 'query_count')
+
+    def get_query_count(self, obj) -> int:
+        return len(obj.queries)
+
+
+class ProfileTokenSerializer(serializers.Serializer):
+    header = serializers.CharField()
+    token = serializers.CharField()
+
+
 class RoleAssignSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
     role = serializers.ChoiceField(choices=[r[0] for r in models.UserProfile.ROLE_CHOICES])
@@ -151,18 +374,39 @@ class RoleAssignResponseSerializer(serializers.Serializer):
     role = serializers.CharField()
 
 
+class BulkUserRowSerializer(serializers.Serializer):
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField(required=False, allow_blank=True)
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    role = serializers.ChoiceField(choices=[r[0] for r in models.UserProfile.ROLE_CHOICES], required=False)
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True, help_text='Omit for an unusable password.')
+
+
+class BulkUserProvisionSerializer(serializers.Serializer):
+    users = BulkUserRowSerializer(many=True, allow_empty=False)
+    default_role = serializers.ChoiceField(
+        choices=[r[0] for r in models.UserProfile.ROLE_CHOICES], default=models.UserProfile.ROLE_STAFF
+    )
+
+
+class BulkUserProvisionResponseSerializer(serializers.Serializer):
+    created = UserSummarySerializer(many=True)
+    skipped = serializers.ListField(child=serializers.CharField())
+
+
 class HealthSerializer(serializers.Serializer):
     status = serializers.CharField()
     service = serializers.CharField()
 
 
 class ApproveActionSerializer(serializers.Serializer):
-    level = serializers.IntegerField(required=False, default=1)
+    level = serializers.IntegerField(required=False, help_text="Optional; must match the request's current_level")
     comment = serializers.CharField(required=False, allow_blank=True)
 
 
 class RejectActionSerializer(serializers.Serializer):
-    level = serializers.IntegerField(required=False, default=1)
+    level = serializers.IntegerField(required=False, help_text="Optional; must match the request's current_level")
     reason = serializers.CharField()
 
 
@@ -175,3 +419,49 @@ class SubmitReceiptSerializer(serializers.Serializer):
     # Represented as metadata for the file upload in docs. Actual endpoint uses multipart file upload.
     note = serializers.CharField(required=False, allow_blank=True)
 
+
+
+class ApprovalLatencyQuerySerializer(serializers.Serializer):
+    metric = serializers.ChoiceField(choices=models.LatencyBin.METRIC_CHOICES, default=models.LatencyBin.METRIC_WAIT)
+    dimension = serializers.ChoiceField(choices=models.LatencyBin.DIMENSION_CHOICES, default=models.LatencyBin.DIMENSION_LEVEL)
+    action = serializers.ChoiceField(
+        choices=[models.Approval.ACTION_APPROVED, models.Approval.ACTION_REJECTED], default=models.Approval.ACTION_APPROVED,
+        allow_blank=True, help_text='Empty for approvals and rejections together.',
+    )
+    since = serializers.DateField(required=False, help_text='First UTC day (default: 29 days before `until`).')
+    until = serializers.DateField(required=False, help_text='Last UTC day, inclusive (default: today).')
+
+    def validate(self, attrs):
+        attrs.setdefault('until', timezone.now().date())
+        attrs.setdefault('since', attrs['until'] - timedelta(days=29))
+        if attrs['since'] > attrs['until']:
+            raise serializers.ValidationError('since must not be after until')
+        return attrs
+
+
+class LatencyQuantilesSerializer(serializers.Serializer):
+    key = serializers.CharField(help_text='Level, approver id or amount band; empty for `all`.')
+    label = serializers.CharField()
+    count = serializers.IntegerField()
+    mean = serializers.FloatField(help_text='Seconds; like the quantiles, within LATENCY_SKETCH_ACCURACY.')
+    p50 = serializers.FloatField()
+    p90 = serializers.FloatField()
+    p99 = serializers.FloatField()
+    max = serializers.FloatField()
+
+
+class ApprovalLatencyReportSerializer(ApprovalLatencyQuerySerializer):
+    results = LatencyQuantilesSerializer(many=True)
+
+
+class PendingAgingLevelSerializer(serializers.Serializer):
+    level = serializers.IntegerField()
+    count = serializers.IntegerField()
+    oldest = serializers.DateTimeField()
+    histogram = serializers.DictField(child=serializers.IntegerField(), help_text='Pending requests per age bucket.')
+
+
+class PendingAgingSerializer(serializers.Serializer):
+    as_of = serializers.DateTimeField()
+    buckets = serializers.ListField(child=serializers.CharField())
+    levels = PendingAgingLevelSerializer(many=True)
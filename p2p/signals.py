@@ -15,5 +15,10 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
+    # only a profile already loaded through this user (and changed since) needs
+    # writing; checking hasattr() here would cost a SELECT on every User.save()
+    if not User.profile.is_cached(instance):
+        return
+    profile = getattr(instance, 'profile', None)
+    if profile is not None and profile.is_dirty():
+        profile.save()
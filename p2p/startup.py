@@ -0,0 +1,119 @@
+"""Worker boot: phase timings and a gunicorn ``--preload`` safe warm-up.
+
+``python -X importtime -m p2p.startup`` boots the project in a fresh
+interpreter and prints the time spent in each phase (settings, app registry,
+URL resolver, WSGI handler, first request) as JSON. ``manage.py
+startup_profile`` runs it repeatedly and compares the result against the
+budget tracked in ``docs/startup_benchmark.json``.
+
+``warm_up`` is called from ``gunicorn.conf.py`` in the master when
+``preload_app`` is on: it does the lazy work of a first request once, drops
+every socket that must not be shared with the forked workers and freezes the
+heap so that the workers share it copy-on-write.
+"""
+import gc
+import io
+import json
+import os
+import sys
+import time
+
+# document-processing and schema-generation stacks: imported on first use
+# only. (yaml and drf_spectacular.openapi are not listed: DRF's compat module
+# and @extend_schema import them at boot regardless.)
+LAZY_MODULES = (
+    'reportlab',
+    'pdfplumber',
+    'pytesseract',
+    'PIL',
+    'drf_spectacular.generators',
+    'drf_spectacular.views',
+)
+
+
+def _populate_urls():
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    resolver.url_patterns
+    resolver.reverse_dict
+    return resolver
+
+
+def _request(app, path):
+    from django.conf import settings
+
+    host = next((h for h in settings.ALLOWED_HOSTS if h and h[0] not in '.*'), 'localhost')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host,
+        'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+    }
+    status = []
+    body = app(environ, lambda s, headers, exc_info=None: status.append(s))
+    b''.join(body)
+    getattr(body, 'close', lambda: None)()
+    return status[0]
+
+
+def measure(path='/api/health/'):
+    """Boot phases of the current (fresh) interpreter, in milliseconds."""
+    phases = {}
+    mark = time.perf_counter()
+
+    def lap(name):
+        nonlocal mark
+        now = time.perf_counter()
+        phases[name] = round((now - mark) * 1000, 2)
+        mark = now
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'procure_to_pay.settings')
+    from django.conf import settings
+
+    settings.INSTALLED_APPS
+    lap('settings')
+
+    import django
+
+    django.setup(set_prefix=False)
+    lap('setup')
+
+    _populate_urls()
+    lap('urls')
+
+    from django.core.wsgi import get_wsgi_application
+
+    app = get_wsgi_application()
+    lap('wsgi')
+
+    status = _request(app, path)
+    lap('first_request')
+
+    return {
+        'phases': phases,
+        'total_ms': round(sum(phases.values()), 2),
+        'modules': len(sys.modules),
+        'eager_lazy_modules': [name for name in LAZY_MODULES if name in sys.modules],
+        'status': status,
+    }
+
+
+def warm_up():
+    """Preload-safe init for the gunicorn master (``preload_app = True``)."""
+    _populate_urls()
+    # handlers imported lazily inside views/serializers
+    from . import admin, serializers, views  # noqa: F401
+    from django.core.cache import caches
+    from django.db import connections
+
+    # sockets opened while importing must not leak into the workers
+    connections.close_all()
+    caches.close_all()
+    # move everything loaded so far into a permanent generation, so the
+    # workers' collector never writes to (and un-shares) those pages
+    gc.collect()
+    gc.freeze()
+
+
+if __name__ == '__main__':
+    print(json.dumps(measure(*sys.argv[1:2])))
@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import PurchaseRequest
+
+
+class ApproverAccessTests(TestCase):
+    """Approvers see the requests waiting at their level but cannot edit them."""
+
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', 'c@example.com', 'pw')
+        self.approver = User.objects.create_user('approver', 'a@example.com', 'pw')
+        self.approver.profile.role = 'approver_level_1'
+        self.approver.profile.save()
+        self.pr = PurchaseRequest.objects.create(title='Laptops', amount='5000.00', created_by=self.creator)
+        self.client = APIClient()
+        self.client.force_authenticate(self.approver)
+
+    def test_approver_can_read_pending_request_at_their_level(self):
+        self.assertEqual(self.client.get(f'/api/requests/{self.pr.pk}/').status_code, 200)
+
+    def test_approver_cannot_edit_or_delete_pending_request(self):
+        url = f'/api/requests/{self.pr.pk}/'
+        self.assertEqual(self.client.patch(url, {'amount': '10.00'}, format='json').status_code, 404)
+        self.assertEqual(self.client.put(url, {'title': 'x', 'amount': '10.00'}, format='json').status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.pr.refresh_from_db()
+        self.assertEqual(str(self.pr.amount), '5000.00')
+        self.assertEqual(self.pr.required_approval_levels, 2)
@@ -0,0 +1,236 @@
+"""Admission control for the API.
+
+Two mechanisms, both backed by the shared Django cache so that every gunicorn
+worker on a node sees the same state (Redis when ``REDIS_URL`` is set, the
+file-based cache otherwise):
+
+- ``TokenBucketThrottle``: a per-user (or per-IP for anonymous clients) token
+  bucket for each endpoint class (``throttle_scope`` on the view). Expensive
+  actions consume more tokens via ``throttle_costs`` on the view.
+- ``concurrency_limited``: a global cap on concurrently running CPU-heavy
+  actions, one expiring cache key per slot. Excess calls are shed
+  immediately with 429 and ``Retry-After`` instead of queueing until the
+  worker times out.
+"""
+import functools
+import inspect
+import math
+import random
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+
+# Atomic refill-and-take for Redis. Returns {allowed, tokens_left}; the token
+# count is returned as a string because Lua numbers are truncated to integers.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local ttl = tonumber(ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ttl)
+return {allowed, tostring(tokens)}
+"""
+
+# Delete a concurrency slot only if it still holds the caller's token (it may
+# have expired and been claimed by another worker meanwhile).
+RELEASE_SLOT_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_throttle_cache():
+    return caches[getattr(settings, 'P2P_THROTTLE_CACHE', 'default')]
+
+
+def _redis_client(cache, key):
+    """Return the raw redis client behind Django's RedisCache, or None."""
+    backend = getattr(cache, '_cache', None)
+    get_client = getattr(backend, 'get_client', None)
+    if get_client is None:
+        return None
+    return get_client(key, write=True)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket keyed by (endpoint class, user).
+
+    The bucket capacity and refill rate come from ``DEFAULT_THROTTLE_RATES``
+    using the usual DRF ``'<n>/<period>'`` format: the bucket holds ``n``
+    tokens and refills completely over one period. The endpoint class is the
+    view's ``throttle_scope`` (``'default'`` when unset) and each call costs
+    ``view.throttle_costs[view.action]`` tokens (1 when unset).
+    """
+
+    default_scope = 'default'
+    anon_scope = 'anon'
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_scope(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return self.anon_scope
+        return getattr(view, 'throttle_scope', None) or self.default_scope
+
+    def get_cost(self, request, view):
+        costs = getattr(view, 'throttle_costs', None) or {}
+        return costs.get(getattr(view, 'action', None), 1)
+
+    def get_ident_for(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def get_rate(self, scope):
+        rates = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+        rate = rates.get(scope) or rates.get(self.default_scope)
+        if not rate:
+            return None, None
+        num, duration = SimpleRateThrottle.parse_rate(None, rate)
+        return num, num / float(duration)
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        capacity, refill = self.get_rate(scope)
+        if capacity is None:
+            return True
+        cost = min(self.get_cost(request, view), capacity)
+        key = f'throttle:bucket:{scope}:{self.get_ident_for(request)}'
+        allowed, tokens = self.take(key, capacity, refill, cost)
+        if not allowed:
+            self.wait_seconds = (cost - tokens) / refill
+        return allowed
+
+    def take(self, key, capacity, refill, cost):
+        cache = get_throttle_cache()
+        now = time.time()
+        ttl = int(math.ceil(capacity / refill)) + 1
+        client = _redis_client(cache, key)
+        if client is not None:
+            allowed, tokens = client.eval(
+                TOKEN_BUCKET_LUA, 1, cache.make_and_validate_key(key),
+                capacity, refill, now, cost, ttl,
+            )
+            return bool(int(allowed)), float(tokens)
+
+        # Non-Redis caches: read-modify-write is not atomic across workers, so
+        # the bucket may admit a few extra calls under heavy contention.
+        tokens, ts = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * refill)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        cache.set(key, (tokens, now), ttl)
+        return allowed, tokens
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ConcurrencyLimiter:
+    """Node-wide counting semaphore on top of the shared cache.
+
+    Each of the ``limit`` slots is its own cache key, claimed with ``add`` and
+    expiring after ``ttl`` seconds, so a slot leaked by a worker killed
+    mid-request frees itself without touching the others. A slot holds a
+    random token and is only deleted by its holder. With Redis claims and
+    releases are atomic; the file-based cache checks and writes a slot in two
+    steps, so under contention two workers may claim the same slot and a few
+    extra calls get through.
+    """
+
+    def __init__(self, pool):
+        limits = getattr(settings, 'P2P_CONCURRENCY_LIMITS', {})
+        conf = limits.get(pool, {})
+        self.pool = pool
+        self.limit = conf.get('limit')
+        self.retry_after = conf.get('retry_after', 5)
+        self.ttl = conf.get('ttl', 300)
+        self.key = f'throttle:concurrency:{pool}'
+        self.slot = None
+        self.token = None
+
+    def acquire(self):
+        if not self.limit:
+            return True
+        cache = get_throttle_cache()
+        token = uuid.uuid4().hex
+        # start at a random slot so that concurrent callers rarely race for the same key
+        start = random.randrange(self.limit)
+        for offset in range(self.limit):
+            slot = f'{self.key}:{(start + offset) % self.limit}'
+            client = _redis_client(cache, slot)
+            if client is not None:
+                claimed = client.set(cache.make_and_validate_key(slot), token, nx=True, ex=self.ttl)
+            else:
+                claimed = cache.add(slot, token, self.ttl)
+            if claimed:
+                self.slot, self.token = slot, token
+                return True
+        return False
+
+    def release(self):
+        if self.slot is None:
+            return
+        cache = get_throttle_cache()
+        client = _redis_client(cache, self.slot)
+        if client is not None:
+            client.eval(RELEASE_SLOT_LUA, 1, cache.make_and_validate_key(self.slot), self.token)
+        elif cache.get(self.slot) == self.token:
+            cache.delete(self.slot)
+        self.slot = self.token = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise Throttled(wait=self.retry_after, detail='Server busy, retry later.')
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    async def __aenter__(self):
+        return await sync_to_async(self.__enter__)()
+
+    async def __aexit__(self, *exc):
+        return await sync_to_async(self.__exit__)(*exc)
+
+
+def concurrency_limited(pool):
+    """Decorator for view methods that must run under the ``pool`` cap."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                async with ConcurrencyLimiter(pool):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with ConcurrencyLimiter(pool):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
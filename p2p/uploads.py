@@ -0,0 +1,283 @@
+"""Resumable chunked uploads for large proformas and receipts (tus-style).
+
+A client creates an upload with the file name and total size, then sends the
+bytes in any number of ``PATCH`` requests, each starting at the
+``Upload-Offset`` the server has confirmed. Chunks are streamed from the
+request straight into the upload's final file in ``MEDIA_ROOT``. After a
+dropped connection, ``HEAD`` returns the offset to resume from. Bytes that
+arrived before the drop are kept unless the chunk carried a checksum.
+``finalize`` checks the size and fixes the content hash. The file can then be
+attached to ``PurchaseRequest.proforma``, ``Receipt.file`` or
+``Document.file`` by name: the FileField points at the uploaded file and no
+bytes are copied.
+
+Validation happens while bytes arrive:
+
+- the declared size is capped at create (``UPLOAD_MAX_BYTES``), and so is
+  each chunk (``UPLOAD_MAX_CHUNK_BYTES``);
+- the first bytes must match an allowed file type (``UPLOAD_ALLOWED_TYPES``),
+  recognised by magic number rather than the client's Content-Type;
+- a chunk may carry ``Upload-Checksum: sha256 <base64>``, and it is only
+  accepted if the digest matches.
+
+Consecutive chunks may land on different workers, so no hash object is kept
+between requests. The file is hashed in blocks of ``HASH_BLOCK_SIZE``. The
+digests of completed blocks are stored on the row, and only the tail of an
+unfinished block is re-read when the next chunk arrives. ``content_hash`` is
+the SHA-256 of the concatenated block digests. ``content_hash(file)``
+computes the same value for any file.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import Upload
+
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+READ_SIZE = 256 * 1024
+MAX_NAME_LENGTH = Upload._meta.get_field('file').max_length
+
+# (content type, magic prefixes); the first SNIFF_BYTES bytes decide
+FILE_TYPES = (
+    ('application/pdf', (b'%PDF-',)),
+    ('image/png', (b'\x89PNG\r\n\x1a\n',)),
+    ('image/jpeg', (b'\xff\xd8\xff',)),
+    ('image/tiff', (b'II*\x00', b'MM\x00*')),
+)
+SNIFF_BYTES = max(len(magic) for _, prefixes in FILE_TYPES for magic in prefixes)
+
+# tus checksum extension: the status for a chunk whose digest does not match
+CHECKSUM_MISMATCH = 460
+
+
+class UploadError(Exception):
+    """Rejected upload request; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def sniff(head):
+    """Content type of a file starting with ``head``, or None if not recognised."""
+    for content_type, prefixes in FILE_TYPES:
+        if head.startswith(prefixes):
+            return content_type
+    return None
+
+
+def content_hash(file):
+    """Block hash of a binary file object, as stored in ``Upload.content_hash``."""
+    digests = []
+    file.seek(0)
+    while True:
+        block = file.read(HASH_BLOCK_SIZE)
+        if not block:
+            break
+        digests.append(hashlib.sha256(block).digest())
+    return hashlib.sha256(b''.join(digests)).hexdigest()
+
+
+def _storage_name(upload_id, filename):
+    base, ext = os.path.splitext(get_valid_filename(os.path.basename(filename)) or 'upload')
+    prefix = f'uploads/{upload_id.hex}/'
+    ext = ext[:10]
+    return prefix + base[:MAX_NAME_LENGTH - len(prefix) - len(ext)] + ext
+
+
+def create(owner, filename, size):
+    """Reserve an upload of ``size`` bytes; the (empty) file is created in storage."""
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise UploadError(413, f'Upload exceeds the maximum size of {settings.UPLOAD_MAX_BYTES} bytes.')
+    upload_id = uuid.uuid4()
+    name = default_storage.save(_storage_name(upload_id, filename), ContentFile(b''))
+    return Upload.objects.create(
+        id=upload_id, owner=owner, filename=filename, file=name, size=size,
+        expires_at=timezone.now() + timedelta(hours=settings.UPLOAD_EXPIRY_HOURS),
+    )
+
+
+def _parse_checksum(header):
+    algorithm, _, value = header.strip().partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError(400, 'Upload-Checksum must be "sha256 <base64 digest>".')
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        raise UploadError(400, 'Upload-Checksum digest is not valid base64.')
+
+
+class _BlockHasher:
+    """SHA-256 per HASH_BLOCK_SIZE block of a file being written at ``position``."""
+
+    def __init__(self, position, partial):
+        self.position = position
+        self.digests = []
+        self.block = hashlib.sha256(partial)
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            room = HASH_BLOCK_SIZE - self.position % HASH_BLOCK_SIZE
+            self.block.update(view[:room])
+            self.position += min(room, len(view))
+            if self.position % HASH_BLOCK_SIZE == 0:
+                self.digests.append(self.block.digest())
+                self.block = hashlib.sha256()
+            view = view[room:]
+
+
+def write_chunk(upload, stream, length, checksum=None):
+    """Write ``length`` bytes from ``stream`` at ``upload.offset`` and save the new offset.
+
+    The caller holds the row lock. On a rejected chunk, the file is cut back to
+    the old offset and UploadError is raised.
+    """
+    if upload.status != Upload.STATUS_IN_PROGRESS:
+        raise UploadError(409, 'Upload is already finalized.')
+    if length > settings.UPLOAD_MAX_CHUNK_BYTES:
+        raise UploadError(413, f'Chunks may be at most {settings.UPLOAD_MAX_CHUNK_BYTES} bytes.')
+    if upload.offset + length > upload.size:
+        raise UploadError(413, f'Chunk ends at {upload.offset + length}, past the declared size of {upload.size} bytes.')
+    expected_digest = _parse_checksum(checksum) if checksum else None
+
+    start, content_type = upload.offset, upload.content_type
+    sniff_at = min(SNIFF_BYTES, upload.size)
+    with open(upload.file.path, 'r+b') as f:
+        block_start = start - start % HASH_BLOCK_SIZE
+        f.seek(block_start)
+        partial = f.read(start - block_start)
+        head = partial[:sniff_at] if block_start == 0 else b''
+        # drop the bytes of an earlier attempt that was never confirmed
+        f.truncate(start)
+        f.seek(start)
+
+        hasher = _BlockHasher(start, partial)
+        chunk_hash = hashlib.sha256() if expected_digest is not None else None
+        received = 0
+        try:
+            while received < length:
+                try:
+                    data = stream.read(min(READ_SIZE, length - received))
+                except OSError:
+                    # client went away mid-chunk; keep what arrived so it can resume
+                    data = b''
+                if not data:
+                    break
+                if not upload.content_type and len(head) < sniff_at:
+                    head += data[:sniff_at - len(head)]
+                    if len(head) == sniff_at:
+                        _check_type(upload, head)
+                hasher.update(data)
+                if chunk_hash is not None:
+                    chunk_hash.update(data)
+                f.write(data)
+                received += len(data)
+            if chunk_hash is not None:
+                if received < length:
+                    raise UploadError(400, f'Chunk ended after {received} of {length} bytes.')
+                if chunk_hash.digest() != expected_digest:
+                    raise UploadError(CHECKSUM_MISMATCH, 'Checksum mismatch.')
+        except Exception:
+            f.truncate(start)
+            upload.content_type = content_type
+            raise
+        f.flush()
+        os.fsync(f.fileno())
+
+    upload.offset = start + received
+    upload.block_digests = bytes(upload.block_digests) + b''.join(hasher.digests)
+    upload.save(update_fields=['offset', 'block_digests', 'content_type'])
+    return received
+
+
+def _check_type(upload, head):
+    content_type = sniff(head)
+    if content_type not in settings.UPLOAD_ALLOWED_TYPES:
+        allowed = ', '.join(settings.UPLOAD_ALLOWED_TYPES)
+        raise UploadError(415, f'Unsupported file type; allowed: {allowed}.')
+    upload.content_type = content_type
+
+
+def finalize(upload, expected_hash=None):
+    """Check that every byte arrived and fix ``content_hash``. Idempotent."""
+    if upload.status != Upload.STATUS_IN_PROGRESS:
+        if expected_hash and expected_hash != upload.content_hash:
+            raise UploadError(CHECKSUM_MISMATCH, 'content_hash does not match the uploaded file.')
+        return upload
+    if upload.offset != upload.size:
+        raise UploadError(409, f'Upload is incomplete: {upload.offset} of {upload.size} bytes received.')
+    if upload.file.size != upload.size:
+        raise UploadError(409, 'Stored file does not match the confirmed offset; delete the upload and start again.')
+    # only the last, incomplete block has no stored digest yet
+    digests = bytes(upload.block_digests)
+    with upload.file.open('rb') as f:
+        f.seek(len(digests) // 32 * HASH_BLOCK_SIZE)
+        tail = f.read()
+    if tail:
+        digests += hashlib.sha256(tail).digest()
+    digest = hashlib.sha256(digests).hexdigest()
+    if expected_hash and expected_hash != digest:
+        raise UploadError(CHECKSUM_MISMATCH, 'content_hash does not match the uploaded file.')
+    upload.content_hash = digest
+    upload.status = Upload.STATUS_COMPLETE
+    upload.save(update_fields=['content_hash', 'status'])
+    return upload
+
+
+def claim(upload_id, owner):
+    """Lock ``owner``'s finalized upload for attaching. Call inside the
+    transaction that saves the record it is attached to."""
+    try:
+        upload_id = uuid.UUID(str(upload_id))
+    except ValueError:
+        raise UploadError(400, 'Not a valid upload id.')
+    upload = Upload.objects.select_for_update().filter(pk=upload_id, owner=owner).first()
+    if upload is None:
+        raise UploadError(404, 'Upload not found.')
+    if upload.status == Upload.STATUS_IN_PROGRESS:
+        raise UploadError(409, 'Upload is not finalized.')
+    if upload.status == Upload.STATUS_ATTACHED:
+        raise UploadError(409, f'Upload is already attached to {upload.attached_to}.')
+    return upload
+
+
+def mark_attached(upload, instance):
+    upload.status = Upload.STATUS_ATTACHED
+    upload.attached_to = f'{instance._meta.model_name}:{instance.pk}'
+    upload.save(update_fields=['status', 'attached_to'])
+
+
+def delete(upload):
+    """Remove an upload that is not attached, together with its file."""
+    if upload.status == Upload.STATUS_ATTACHED:
+        raise UploadError(409, 'Attached uploads cannot be deleted.')
+    name = upload.file.name
+    upload.delete()
+    default_storage.delete(name)
+    try:
+        os.rmdir(os.path.dirname(default_storage.path(name)))
+    except OSError:
+        pass
+
+
+def purge_expired(now=None):
+    """Delete uploads that were never attached and whose expiry has passed."""
+    expired = Upload.objects.filter(
+        status__in=(Upload.STATUS_IN_PROGRESS, Upload.STATUS_COMPLETE), expires_at__lt=now or timezone.now()
+    )
+    count = 0
+    for upload in expired.iterator():
+        delete(upload)
+        count += 1
+    return count
@@ -1,12 +1,21 @@
 from rest_framework.routers import DefaultRouter
+from django.conf import settings
 from django.urls import path, include
-from .views import PurchaseRequestViewSet, health_check, UserViewSet, PurchaseOrderViewSet
-from .views import TokenObtainPairViewCustom, TokenRefreshView, me, assign_role
+from .views import PurchaseRequestViewSet, health_check, UserViewSet, PurchaseOrderViewSet, ProfileCaptureViewSet
+from .views import ArchivedPurchaseRequestViewSet, UploadViewSet
+from .views import TokenObtainPairViewCustom, TokenRefreshView, me, assign_role, approval_latency, pending_aging
+
+if settings.ASYNC_VIEWS:
+    # ASGI deployment: coroutine read/file endpoints, same URLs and output
+    from .async_views import PurchaseRequestViewSet, PurchaseOrderViewSet, health_check, me  # noqa: F811
 
 router = DefaultRouter()
 router.register(r'requests', PurchaseRequestViewSet, basename='requests')
 router.register(r'users', UserViewSet, basename='users')
 router.register(r'purchase-orders', PurchaseOrderViewSet, basename='purchaseorders')
+router.register(r'uploads', UploadViewSet, basename='uploads')
+router.register(r'archived-requests', ArchivedPurchaseRequestViewSet, basename='archived-requests')
+router.register(r'debug/profiles', ProfileCaptureViewSet, basename='profiles')
 
 urlpatterns = [
     path('health/', health_check, name='health'),
@@ -14,5 +23,7 @@ urlpatterns = [
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/me/', me, name='auth_me'),
     path('auth/assign-role/', assign_role, name='auth_assign_role'),
+    path('reports/approval-latency/', approval_latency, name='report_approval_latency'),
+    path('reports/pending-aging/', pending_aging, name='report_pending_aging'),
     path('', include(router.urls)),
 ]
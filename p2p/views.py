@@ -1,18 +1,27 @@
-from django.db import transaction
-from rest_framework import viewsets, status
-from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.response import Response
+import os
 
-from . import models, serializers
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiExample, OpenApiParameter
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
-from drf_spectacular.utils import extend_schema, OpenApiExample
-from . import serializers as local_serializers
+from . import audit, duplicates, latency, models, previews, provisioning, serializers, uploads, workflow
+from .fieldsets import FIELDSET_PARAMETERS, SparseFieldsetMixin
+from .filters import IndexedFilterBackend
+from .pagination import EstimatedCountPagination, HistoryPagination
+from .profiling import make_debug_token
+from .throttling import concurrency_limited
 
 
-@extend_schema(responses=local_serializers.HealthSerializer, description='Public health check')
+@extend_schema(responses=serializers.HealthSerializer, description='Public health check')
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
@@ -24,31 +33,23 @@ def health_check(request):
     return Response(data)
 
 
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework.decorators import permission_classes
-from rest_framework.permissions import IsAuthenticated
-from django.contrib.auth import get_user_model
-
-
 class TokenObtainPairViewCustom(TokenObtainPairView):
     """Wrapper in case we want to customize later (keeps import path stable)."""
     pass
 
 
-@extend_schema(responses=local_serializers.UserSerializer)
+@extend_schema(responses=serializers.UserSerializer)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def me(request):
     """Return authenticated user info including role."""
-    from .serializers import UserSerializer
-
-    serializer = UserSerializer(request.user)
+    serializer = serializers.UserSerializer(request.user)
     return Response(serializer.data)
 
 
 @extend_schema(
-    request=local_serializers.RoleAssignSerializer,
-    responses={200: local_serializers.RoleAssignResponseSerializer},
+    request=serializers.RoleAssignSerializer,
+    responses={200: serializers.RoleAssignResponseSerializer},
     description='Admin endpoint to assign role to a user. Staff only.'
 )
 @api_view(['POST'])
@@ -57,31 +58,155 @@ def assign_role(request):
     """Admin endpoint to assign role to a user. Only accessible by staff/superuser."""
     if not request.user.is_staff:
         return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
-    from .serializers import RoleAssignSerializer
-    serializer = RoleAssignSerializer(data=request.data)
+    serializer = serializers.RoleAssignSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
     user_id = serializer.validated_data['user_id']
     role = serializer.validated_data['role']
-    from django.contrib.auth import get_user_model
     User = get_user_model()
     try:
         user = User.objects.get(pk=user_id)
     except User.DoesNotExist:
         return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     profile = getattr(user, 'profile', None)
-    if not profile:
-        from .models import UserProfile
-        profile = UserProfile.objects.create(user=user, role=role)
-    else:
-        profile.role = role
-        profile.save()
+    with transaction.atomic():
+        if not profile:
+            old_role = None
+            profile = models.UserProfile.objects.create(user=user, role=role)
+        else:
+            old_role = profile.role
+            profile.role = role
+            profile.save()
+        if old_role != role:
+            audit.record(models.AuditEvent.SUBJECT_USER, user.pk, models.AuditEvent.ACTION_ROLE_ASSIGNED, request.user, {'role': [old_role, role]})
     return Response({'detail': 'role assigned', 'user_id': user_id, 'role': role})
 
 
-class PurchaseRequestViewSet(viewsets.ModelViewSet):
+@extend_schema(
+    parameters=[serializers.ApprovalLatencyQuerySerializer],
+    responses=serializers.ApprovalLatencyReportSerializer,
+    description='p50/p90/p99 decision latency in seconds per level, approver or amount band, merged from the daily '
+                'sketches of the requested days. Staff only.',
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def approval_latency(request):
+    query = serializers.ApprovalLatencyQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    params = query.validated_data
+    results = latency.report(params['metric'], params['dimension'], params['since'], params['until'], params['action'])
+    return Response({**query.data, 'results': results})
+
+
+@extend_schema(responses=serializers.PendingAgingSerializer, description='Live age histogram of PENDING requests per current level. Staff only.')
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def pending_aging(request):
+    return Response(serializers.PendingAgingSerializer(latency.pending_aging()).data)
+
+
+def _create_receipt(pr, user, file_obj=None, upload_id=None):
+    """Receipt from a multipart file or, by reference, from a finalized upload."""
+    with transaction.atomic():
+        upload = uploads.claim(upload_id, user) if upload_id else None
+        if upload:
+            file_obj = upload.file.name
+        receipt = models.Receipt.objects.create(purchase_request=pr, uploaded_by=user, file=file_obj, validation_result='UNVALIDATED')
+        if upload:
+            uploads.mark_attached(upload, receipt)
+        previews.schedule(receipt.file, upload.content_hash if upload else '')
+        audit.record_request(pr, models.AuditEvent.ACTION_RECEIPT_SUBMITTED, user, {'receipt_id': receipt.pk, 'file': receipt.file.name})
+    return receipt
+
+
+PREVIEW_PARAMETERS = [
+    OpenApiParameter('page', int, description='Page number, from 1 (default 1; only the first PREVIEW_PAGES pages are rendered).'),
+    OpenApiParameter('v', str, description='Content version from the `*_preview` URL; makes the response cacheable for a year.'),
+]
+PREVIEW_RESPONSES = {(200, 'image/jpeg'): OpenApiTypes.BINARY, 202: None, 304: None, 404: None}
+
+
+def _preview_response(request, field_file, render=None):
+    """Cached thumbnail of ``field_file``; 202 while it is (re)rendered.
+
+    ``render`` is ``(key, task, *args)`` for ``previews.request_render`` when
+    the file does not exist yet (PO documents are generated on demand).
+    """
+    try:
+        page = int(request.query_params.get('page', 1))
+    except ValueError:
+        return Response({'detail': 'page must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if not field_file:
+        if render is None:
+            raise Http404
+        previews.request_render(*render)
+        return Response({'detail': 'Preview is being rendered'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '2'})
+    preview = models.Preview.objects.filter(source=field_file.name).first()
+    if preview is not None:
+        if preview.status == models.Preview.STATUS_FAILED:
+            return Response({'detail': preview.error}, status=status.HTTP_404_NOT_FOUND)
+        if not 1 <= page <= preview.pages:
+            return Response({'detail': f'No preview for page {page}'}, status=status.HTTP_404_NOT_FOUND)
+        path = previews.cache_path(preview.content_hash, page)
+    if preview is None or not os.path.exists(path):
+        # not rendered yet, or evicted from the cache since
+        previews.request_render(field_file.name, previews.render, field_file.name, preview.content_hash if preview else '')
+        return Response({'detail': 'Preview is being rendered'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '2'})
+
+    version = preview.content_hash[:previews.VERSION_LENGTH]
+    if request.query_params.get('v') == version:
+        cache_control = f'private, max-age={previews.IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = f'private, max-age={settings.PREVIEW_MAX_AGE}'
+    etag = f'"{version}-{settings.PREVIEW_WIDTH}-{page}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        previews.touch(path)
+        response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _archived_requests(user, pk=None):
+    """Archived requests visible to ``user``; only the one with ``pk`` if given
+    (none when ``pk`` is not an integer, as it comes straight from the URL)."""
+    qs = models.ArchivedPurchaseRequest.objects.all()
+    if not user.is_staff:
+        qs = qs.filter(created_by=user)
+    if pk is not None:
+        try:
+            qs = qs.filter(pk=int(pk))
+        except (TypeError, ValueError):
+            return qs.none()
+    return qs
+
+
+@extend_schema_view(
+    list=extend_schema(parameters=FIELDSET_PARAMETERS),
+    retrieve=extend_schema(parameters=FIELDSET_PARAMETERS),
+)
+class PurchaseRequestViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.PurchaseRequest.objects.all().order_by('-created_at')
     serializer_class = serializers.PurchaseRequestSerializer
+    summary_serializer_class = serializers.PurchaseRequestSummarySerializer
+    expandable_fields = ('items',)
     permission_classes = (IsAuthenticated,)
+    throttle_scope = 'requests'
+    filter_backends = (IndexedFilterBackend,)
+    pagination_class = EstimatedCountPagination
+    filter_fields = {
+        'status': ('status', 'exact'),
+        'currency': ('currency', 'exact'),
+        'created_after': ('created_at', 'gte'),
+        'created_before': ('created_at', 'lt'),
+        'amount_min': ('amount', 'gte'),
+        'amount_max': ('amount', 'lte'),
+    }
+    ordering_fields = ('created_at', 'amount')
+    throttle_costs = {'create': 2, 'submit_receipt': 10}
+    # read-only actions plus approve/reject: where approvers get the requests waiting at their level
+    approver_actions = ('list', 'retrieve', 'history', 'preview', 'receipt_preview', 'duplicates', 'approve', 'reject')
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -109,20 +234,111 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # closed requests moved out by `archive_requests` are still served, read-only
+            archived = _archived_requests(request.user, kwargs.get('pk')).first()
+            if archived is None:
+                raise
+            return Response(archived.data)
+
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            return super().get_queryset()
-        return super().get_queryset().filter(created_by=user)
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.annotate(proforma_hash=previews.hash_subquery('proforma'))
+        # approvers also see the requests waiting at their level; editing stays with the creator
+        return workflow.visible_requests(user, queryset, pending_at_level=self.action in self.approver_actions)
 
     @extend_schema(
-        request=local_serializers.ApproveActionSerializer,
+        parameters=[OpenApiParameter('level', int, description='Approval level (staff only; approvers get their own level).')],
+        responses=serializers.PurchaseRequestSummarySerializer(many=True),
+        description='Pending requests waiting for the caller\'s approval level, oldest first (summary fields).',
+    )
+    @action(detail=False, methods=['get'], url_path='pending-approvals')
+    def pending_approvals(self, request):
+        level = workflow.approval_level(request.user)
+        if request.user.is_staff and request.query_params.get('level'):
+            try:
+                level = int(request.query_params['level'])
+            except ValueError:
+                return Response({'detail': 'level must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not level:
+            return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+        # served from p2p_pr_approval_queue_idx, no join against Approval
+        qs = models.PurchaseRequest.objects.filter(
+            status=models.PurchaseRequest.STATUS_PENDING, current_level=level
+        ).annotate(proforma_hash=previews.hash_subquery('proforma')).order_by('created_at')
+        # summary rows: no per-row items or created_by queries
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            return self.get_paginated_response(serializers.PurchaseRequestSummarySerializer(page, many=True, context=context).data)
+        return Response(serializers.PurchaseRequestSummarySerializer(qs, many=True, context=context).data)
+
+    @extend_schema(
+        responses=serializers.DuplicateSerializer(many=True),
+        description='Likely duplicates of this request (same proforma, or similar title, items and amount), most similar first.',
+    )
+    @action(detail=True, methods=['get'], url_path='duplicates')
+    def duplicates(self, request, pk=None):
+        pr = self.get_object()
+        found = duplicates.find(pr, visible=workflow.visible_requests(request.user))
+        return Response(serializers.DuplicateSerializer(found, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('cursor', str, description='Opaque cursor from `next`/`previous`.'),
+            OpenApiParameter('page_size', int, description='Events per page (default 50, max 500).'),
+        ],
+        responses=serializers.AuditEventSerializer(many=True),
+        description='Audit timeline of a purchase request, newest first: creation, edits, item changes, '
+                    'approvals, rejections and receipts. Also available for archived requests.',
+    )
+    @action(detail=True, methods=['get'], url_path='history', pagination_class=HistoryPagination)
+    def history(self, request, pk=None):
+        try:
+            pr_id = self.get_object().pk
+        except Http404:
+            archived = _archived_requests(request.user, pk).values_list('pk', flat=True).first()
+            if archived is None:
+                raise
+            pr_id = archived
+        events = models.AuditEvent.objects.filter(
+            subject_type=models.AuditEvent.SUBJECT_REQUEST, subject_id=pr_id
+        ).select_related('actor')
+        page = self.paginate_queryset(events)
+        return self.get_paginated_response(serializers.AuditEventSerializer(page, many=True).data)
+
+    @extend_schema(
+        parameters=PREVIEW_PARAMETERS,
+        responses=PREVIEW_RESPONSES,
+        description='Thumbnail of a page of the proforma (JPEG). Answers 202 with Retry-After while it is rendered.',
+    )
+    @action(detail=True, methods=['get'], url_path='preview')
+    def preview(self, request, pk=None):
+        return _preview_response(request, self.get_object().proforma)
+
+    @extend_schema(
+        parameters=PREVIEW_PARAMETERS,
+        responses=PREVIEW_RESPONSES,
+        description='Thumbnail of a page of one of the request\'s receipts (JPEG).',
+    )
+    @action(detail=True, methods=['get'], url_path=r'receipts/(?P<receipt_id>[0-9]+)/preview')
+    def receipt_preview(self, request, pk=None, receipt_id=None):
+        receipt = get_object_or_404(models.Receipt.objects.only('file'), purchase_request=self.get_object(), pk=receipt_id)
+        return _preview_response(request, receipt.file)
+
+    @extend_schema(
+        request=serializers.ApproveActionSerializer,
         responses={200: OpenApiExample('ApproveResponse', value={'status': 'APPROVED'})},
         examples=[
             OpenApiExample(
                 'ApproveExample',
-                summary='Approve PR level 2',
-                value={'level': 2, 'comment': 'Approved for procurement'},
+                summary='Approve PR at its current level',
+                value={'comment': 'Approved for procurement'},
                 request_only=True,
             )
         ],
@@ -131,68 +347,56 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['patch'], url_path='approve')
     def approve(self, request, pk=None):
         pr = self.get_object()
-        # simple role check: only staff users can approve in this scaffold
-        if not request.user.is_staff:
+        # staff may approve at any level; approvers only at their own level
+        if not workflow.can_act(request.user):
             return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
-
-        with transaction.atomic():
-            pr = models.PurchaseRequest.objects.select_for_update().get(pk=pr.pk)
-            if pr.status != models.PurchaseRequest.STATUS_PENDING:
-                return Response({'detail': 'PurchaseRequest already processed'}, status=status.HTTP_409_CONFLICT)
-            # create Approval record
-            level = int(request.data.get('level', 1))
-            comment = request.data.get('comment', '')
-            models.Approval.objects.create(purchase_request=pr, approver=request.user, level=level, action=models.Approval.ACTION_APPROVED, comment=comment)
-            # For scaffold: if level >=2 mark approved (simulate multi-level)
-            if level >= 2:
-                pr.status = models.PurchaseRequest.STATUS_APPROVED
-                # create PO placeholder
-                po = models.PurchaseOrder.objects.create(purchase_request=pr, po_number=f'PO-{pr.pk}-{level}', total_amount=pr.amount)
-                pr.save()
-            else:
-                # leave pending for next approver
-                pr.save()
-        return Response({'status': pr.status})
+        try:
+            pr = workflow.approve(pr.pk, request.user, request.data.get('comment', ''), request.data.get('level'))
+        except workflow.WorkflowConflict as exc:
+            return Response(exc.as_data(), status=status.HTTP_409_CONFLICT)
+        return Response({'status': pr.status, 'current_level': pr.current_level})
 
     @action(detail=True, methods=['patch'], url_path='reject')
     def reject(self, request, pk=None):
         pr = self.get_object()
-        if not request.user.is_staff:
+        if not workflow.can_act(request.user):
             return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
         reason = request.data.get('reason')
         if not reason:
             return Response({'detail': 'reason required'}, status=status.HTTP_400_BAD_REQUEST)
-
-        with transaction.atomic():
-            pr = models.PurchaseRequest.objects.select_for_update().get(pk=pr.pk)
-            if pr.status != models.PurchaseRequest.STATUS_PENDING:
-                return Response({'detail': 'PurchaseRequest already processed'}, status=status.HTTP_409_CONFLICT)
-            models.Approval.objects.create(purchase_request=pr, approver=request.user, level=int(request.data.get('level', 1)), action=models.Approval.ACTION_REJECTED, comment=reason)
-            pr.status = models.PurchaseRequest.STATUS_REJECTED
-            pr.save()
-
+        try:
+            pr = workflow.reject(pr.pk, request.user, reason, request.data.get('level'))
+        except workflow.WorkflowConflict as exc:
+            return Response(exc.as_data(), status=status.HTTP_409_CONFLICT)
         return Response({'status': pr.status})
 
     @action(detail=True, methods=['post'], url_path='submit-receipt')
+    @concurrency_limited('cpu')
     def submit_receipt(self, request, pk=None):
         pr = self.get_object()
         # Only staff (uploader) can submit receipt for approved PRs — document this
-        # Actual file is provided as multipart/form-data under 'receipt'.
+        # Actual file is provided as multipart/form-data under 'receipt', or as
+        # `upload` (id of a finalized resumable upload) in a JSON body.
         if pr.status != models.PurchaseRequest.STATUS_APPROVED:
             return Response({'detail': 'Receipt can only be submitted for approved requests'}, status=status.HTTP_400_BAD_REQUEST)
         file_obj = request.FILES.get('receipt')
-        if not file_obj:
+        upload_id = request.data.get('upload')
+        if not file_obj and not upload_id:
             return Response({'detail': 'No receipt file provided'}, status=status.HTTP_400_BAD_REQUEST)
-        receipt = models.Receipt.objects.create(purchase_request=pr, uploaded_by=request.user, file=file_obj)
-        # In scaffold, set validation_result to UNVALIDATED
-        receipt.validation_result = 'UNVALIDATED'
-        receipt.save()
+        try:
+            receipt = _create_receipt(pr, request.user, file_obj, upload_id)
+        except uploads.UploadError as exc:
+            return Response({'detail': exc.detail}, status=exc.status)
         return Response({'detail': 'Receipt submitted', 'receipt_id': receipt.pk}, status=status.HTTP_201_CREATED)
 
 
 
 
-class UserViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(parameters=FIELDSET_PARAMETERS),
+    retrieve=extend_schema(parameters=FIELDSET_PARAMETERS),
+)
+class UserViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """Admin/manageable User API. Staff can list/create/delete; ordinary users can view/update themselves.
 
     Endpoints:
@@ -207,7 +411,16 @@ class UserViewSet(viewsets.ModelViewSet):
     User = get_user_model()
     queryset = User.objects.all().order_by('id')
     serializer_class = serializers.UserSerializer
+    summary_serializer_class = serializers.UserSummarySerializer
     permission_classes = (IsAuthenticated,)
+    throttle_scope = 'users'
+    filter_backends = (IndexedFilterBackend,)
+    pagination_class = EstimatedCountPagination
+    filter_fields = {
+        'role': ('profile__role', 'exact'),
+    }
+    ordering_fields = ('id', 'username')
+    throttle_costs = {'bulk': 20}
 
     def get_queryset(self):
         user = self.request.user
@@ -243,9 +456,25 @@ class UserViewSet(viewsets.ModelViewSet):
     def partial_update(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
+    @extend_schema(
+        request=serializers.BulkUserProvisionSerializer,
+        responses={201: serializers.BulkUserProvisionResponseSerializer},
+        description='Create many users with roles in one call (staff only). Passwords are hashed in parallel; '
+                    'usernames that already exist are skipped and listed in `skipped`.',
+    )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @concurrency_limited('cpu')
+    def bulk(self, request):
+        if not request.user.is_staff:
+            return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+        serializer = serializers.BulkUserProvisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = provisioning.provision_users(serializer.validated_data['users'], serializer.validated_data['default_role'])
+        return Response(result, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'], url_path='change_password')
     @extend_schema(
-        request=local_serializers.ChangePasswordSerializer,
+        request=serializers.ChangePasswordSerializer,
         responses={200: OpenApiExample('ChangePasswordResponse', value={'detail': 'password updated'})},
         description='Change a user password. Users must provide old_password; staff may change without old_password.'
     )
@@ -274,22 +503,54 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response({'detail': 'password updated by staff'})
 
 
-class PurchaseOrderViewSet(viewsets.ReadOnlyModelViewSet):
+@extend_schema_view(
+    list=extend_schema(parameters=FIELDSET_PARAMETERS),
+    retrieve=extend_schema(parameters=FIELDSET_PARAMETERS),
+)
+class PurchaseOrderViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """Read-only endpoints for Purchase Orders with a PDF download action."""
 
     queryset = models.PurchaseOrder.objects.all().order_by('-generated_at')
     serializer_class = serializers.PurchaseOrderSerializer
+    summary_serializer_class = serializers.PurchaseOrderSummarySerializer
+    expandable_fields = ('items',)
     permission_classes = (IsAuthenticated,)
+    throttle_scope = 'purchase-orders'
+    filter_backends = (IndexedFilterBackend,)
+    pagination_class = EstimatedCountPagination
+    filter_fields = {
+        'vendor': ('vendor_name', 'exact'),
+        'generated_after': ('generated_at', 'gte'),
+        'generated_before': ('generated_at', 'lt'),
+        'amount_min': ('total_amount', 'gte'),
+        'amount_max': ('total_amount', 'lte'),
+    }
+    ordering_fields = ('generated_at', 'total_amount')
+    throttle_costs = {'download': 10}
 
     def get_queryset(self):
         # finance and staff can see POs; staff sees related ones, finance sees all
         user = self.request.user
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.annotate(po_document_hash=previews.hash_subquery('po_document'))
         if getattr(user, 'profile', None) and user.profile.role == models.UserProfile.ROLE_FINANCE:
-            return super().get_queryset()
+            return queryset
         # non-finance: restrict to POs for PRs created by the user
-        return super().get_queryset().filter(purchase_request__created_by=user)
+        return queryset.filter(purchase_request__created_by=user)
+
+    @extend_schema(
+        parameters=PREVIEW_PARAMETERS,
+        responses=PREVIEW_RESPONSES,
+        description='Thumbnail of a page of the PO PDF (JPEG); the PDF is generated in the background if needed.',
+    )
+    @action(detail=True, methods=['get'], url_path='preview')
+    def preview(self, request, pk=None):
+        po = self.get_object()
+        return _preview_response(request, po.po_document, (f'po:{po.pk}', previews.render_po, po.pk))
 
     @action(detail=True, methods=['get'], url_path='download')
+    @concurrency_limited('cpu')
     def download(self, request, pk=None):
         """Return the PO PDF; generate it if not present."""
         po = self.get_object()
@@ -298,11 +559,173 @@ class PurchaseOrderViewSet(viewsets.ReadOnlyModelViewSet):
             po.generate_pdf()
 
         # stream file
-        from django.http import FileResponse
-        import os
-
         fpath = po.po_document.path
         filename = os.path.basename(fpath)
         return FileResponse(open(fpath, 'rb'), as_attachment=True, filename=filename)
 
 
+
+def _upload_headers(upload):
+    return {'Upload-Offset': str(upload.offset), 'Upload-Length': str(upload.size), 'Cache-Control': 'no-store'}
+
+
+class UploadViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Resumable chunked uploads (tus-style, see `p2p.uploads`).
+
+    - create: POST {filename, size}
+    - HEAD/GET: current `Upload-Offset`
+    - PATCH: append the body (application/offset+octet-stream) at `Upload-Offset`
+    - finalize: POST, once every byte has arrived
+    - document: POST {type}, attach a finalized upload as a new Document
+    - DELETE: abandon an upload that is not attached
+    """
+
+    queryset = models.Upload.objects.all()
+    serializer_class = serializers.UploadSerializer
+    permission_classes = (IsAuthenticated,)
+    throttle_scope = 'uploads'
+
+    def get_queryset(self):
+        return super().get_queryset().filter(owner=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        upload = self.get_object()
+        return Response(self.get_serializer(upload).data, headers=_upload_headers(upload))
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = uploads.create(request.user, serializer.validated_data['filename'], serializer.validated_data['size'])
+        except uploads.UploadError as exc:
+            return Response({'detail': exc.detail}, status=exc.status)
+        headers = dict(_upload_headers(upload), Location=request.build_absolute_uri(f'{upload.pk}/'))
+        return Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED, headers=headers)
+
+    @extend_schema(
+        request={'application/offset+octet-stream': OpenApiTypes.BINARY},
+        parameters=[
+            OpenApiParameter('Upload-Offset', int, OpenApiParameter.HEADER, required=True, description='Offset this chunk starts at; must equal the current offset.'),
+            OpenApiParameter('Upload-Checksum', str, OpenApiParameter.HEADER, description='Optional `sha256 <base64 digest>` of the chunk.'),
+        ],
+        responses={204: None},
+        description='Append a chunk. On 409 the response carries the current `Upload-Offset` to resume from.',
+    )
+    def partial_update(self, request, pk=None):
+        # the body is read straight from the request stream, never through request.data
+        if request.content_type != 'application/offset+octet-stream':
+            return Response({'detail': 'Content-Type must be application/offset+octet-stream'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'detail': 'Upload-Offset header required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or '')
+        except ValueError:
+            return Response({'detail': 'Content-Length required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        with transaction.atomic():
+            try:
+                # one writer per upload; a second concurrent PATCH gets a 409 instead of waiting
+                with transaction.atomic():
+                    upload = get_object_or_404(self.get_queryset().select_for_update(nowait=True), pk=pk)
+            except DatabaseError:
+                return Response({'detail': 'Another request is writing to this upload'}, status=status.HTTP_409_CONFLICT)
+            if offset != upload.offset:
+                return Response(
+                    {'detail': f'Upload-Offset must be {upload.offset}'}, status=status.HTTP_409_CONFLICT, headers=_upload_headers(upload)
+                )
+            try:
+                uploads.write_chunk(upload, request.stream, length, request.headers.get('Upload-Checksum'))
+            except uploads.UploadError as exc:
+                return Response({'detail': exc.detail}, status=exc.status, headers=_upload_headers(upload))
+        return Response(status=status.HTTP_204_NO_CONTENT, headers=_upload_headers(upload))
+
+    @extend_schema(request=serializers.UploadFinalizeSerializer, responses=serializers.UploadSerializer)
+    @action(detail=True, methods=['post'], url_path='finalize')
+    def finalize(self, request, pk=None):
+        serializer = serializers.UploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            try:
+                uploads.finalize(upload, serializer.validated_data.get('content_hash'))
+            except uploads.UploadError as exc:
+                return Response({'detail': exc.detail}, status=exc.status, headers=_upload_headers(upload))
+        return Response(self.get_serializer(upload).data)
+
+    @extend_schema(
+        request=serializers.UploadDocumentSerializer,
+        responses={201: serializers.UploadDocumentResponseSerializer},
+        description='Attach a finalized upload as a new Document owned by the caller.',
+    )
+    @action(detail=True, methods=['post'], url_path='document')
+    def document(self, request, pk=None):
+        serializer = serializers.UploadDocumentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                upload = uploads.claim(pk, request.user)
+                document = models.Document.objects.create(owner=request.user, type=serializer.validated_data['type'], file=upload.file.name)
+                uploads.mark_attached(upload, document)
+        except uploads.UploadError as exc:
+            return Response({'detail': exc.detail}, status=exc.status)
+        return Response({'document_id': document.pk}, status=status.HTTP_201_CREATED)
+
+    def destroy(self, request, pk=None):
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            try:
+                uploads.delete(upload)
+            except uploads.UploadError as exc:
+                return Response({'detail': exc.detail}, status=exc.status)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfileCaptureViewSet(viewsets.ReadOnlyModelViewSet):
+    """Admin-only access to request profiles captured by SamplingProfilerMiddleware."""
+
+    queryset = models.ProfileCapture.objects.select_related('user').order_by('-created_at')
+    serializer_class = serializers.ProfileCaptureSerializer
+    permission_classes = (IsAdminUser,)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return serializers.ProfileCaptureSummarySerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == 'list':
+            qs = qs.defer('folded_stacks')
+        return qs
+
+    @extend_schema(responses={(200, 'text/plain'): str}, description='Folded stacks for flamegraph.pl / speedscope.')
+    @action(detail=True, methods=['get'], url_path='folded')
+    def folded(self, request, pk=None):
+        capture = self.get_object()
+        response = HttpResponse(capture.folded_stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{capture.pk}.folded"'
+        return response
+
+    @extend_schema(request=None, responses=serializers.ProfileTokenSerializer, description='Issue a signed X-Debug-Profile header value for the calling staff user.')
+    @action(detail=False, methods=['post'], url_path='token')
+    def token(self, request):
+        return Response({'header': 'X-Debug-Profile', 'token': make_debug_token(request.user)})
+
+
+class ArchivedPurchaseRequestViewSet(viewsets.ReadOnlyModelViewSet):
+    """Closed purchase requests moved to the archive; the detail view returns the
+    full archived document (items, approvals, receipts, PO)."""
+
+    queryset = models.ArchivedPurchaseRequest.objects.order_by('-created_at')
+    serializer_class = serializers.ArchivedPurchaseRequestSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        qs = _archived_requests(self.request.user).order_by('-created_at')
+        if self.action == 'list':
+            qs = qs.defer('payload')
+        return qs
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_object().data)
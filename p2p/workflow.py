@@ -0,0 +1,123 @@
+"""Approval workflow transitions shared by the API and admin batch jobs.
+
+Each transition locks the PurchaseRequest row (``select_for_update``), checks
+its state and the actor's level, and writes the Approval row, the new
+status/level, the PO (on final approval), the outbox notification, the audit
+event and the latency sketch bins (``p2p.latency``) in one transaction.
+Refusals are raised as DRF exceptions so views can let them propagate as
+400/403/409 responses.
+"""
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.exceptions import APIException, PermissionDenied
+
+from . import audit, latency, models, outbox
+
+
+class WorkflowConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'PurchaseRequest already processed'
+    default_code = 'conflict'
+
+    def __init__(self, detail=None, state=None):
+        super().__init__(detail)
+        # current resource state, returned alongside the detail (SRS: 409 + current state)
+        self.state = state or {}
+
+    def as_data(self):
+        return {'detail': str(self.detail), **self.state}
+
+
+class InvalidAction(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Invalid action'
+    default_code = 'invalid'
+
+
+def approval_level(user):
+    profile = getattr(user, 'profile', None)
+    return profile.approval_level if profile else None
+
+
+def visible_requests(user, queryset=None, pending_at_level=True):
+    """The purchase requests ``user`` may read: all for staff, their own
+    otherwise, plus (``pending_at_level``) the pending ones waiting at their
+    approval level."""
+    if queryset is None:
+        queryset = models.PurchaseRequest.objects.all()
+    if user.is_staff:
+        return queryset
+    level = approval_level(user)
+    if level and pending_at_level:
+        return queryset.filter(
+            Q(created_by=user) | Q(status=models.PurchaseRequest.STATUS_PENDING, current_level=level)
+        )
+    return queryset.filter(created_by=user)
+
+
+def can_act(user):
+    """Staff may act at any level; approvers only at their own."""
+    return user.is_staff or bool(approval_level(user))
+
+
+def _parse_level(level):
+    try:
+        return int(level) if level not in (None, '') else None
+    except (TypeError, ValueError):
+        raise InvalidAction('level must be an integer')
+
+
+def _lock_pending(pr_id, user, level):
+    pr = models.PurchaseRequest.objects.select_for_update().get(pk=pr_id)
+    if pr.status != models.PurchaseRequest.STATUS_PENDING:
+        raise WorkflowConflict()
+    if not user.is_staff and approval_level(user) != pr.current_level:
+        raise PermissionDenied('Forbidden')
+    level = _parse_level(level)
+    if level is not None and level != pr.current_level:
+        raise WorkflowConflict(
+            f'PurchaseRequest is awaiting level {pr.current_level} approval',
+            state={'status': pr.status, 'current_level': pr.current_level},
+        )
+    return pr
+
+
+def approve(pr_id, user, comment='', level=None):
+    """Approve at the request's current level; the last level creates the PO."""
+    with transaction.atomic():
+        pr = _lock_pending(pr_id, user, level)
+        level = pr.current_level
+        approval = models.Approval.objects.create(purchase_request=pr, approver=user, level=level, action=models.Approval.ACTION_APPROVED, comment=comment)
+        final = pr.is_final_level
+        if final:
+            pr.status = models.PurchaseRequest.STATUS_APPROVED
+            # create PO placeholder
+            models.PurchaseOrder.objects.create(purchase_request=pr, po_number=f'PO-{pr.pk}-{level}', total_amount=pr.amount)
+            pr.save(update_fields=['status', 'updated_at'])
+            outbox.enqueue_decision(pr, models.OutboxEvent.EVENT_PR_APPROVED, user, comment)
+            changes = {'status': [models.PurchaseRequest.STATUS_PENDING, pr.status]}
+        else:
+            # leave pending for next approver
+            pr.current_level = level + 1
+            pr.save(update_fields=['current_level', 'updated_at'])
+            changes = {'current_level': [level, pr.current_level]}
+        audit.record_request(pr, models.AuditEvent.ACTION_APPROVED, user, {**changes, 'level': level, 'comment': comment})
+        latency.record(pr, approval, final)
+    return pr
+
+
+def reject(pr_id, user, reason, level=None):
+    if not reason:
+        raise InvalidAction('reason required')
+    with transaction.atomic():
+        pr = _lock_pending(pr_id, user, level)
+        approval = models.Approval.objects.create(purchase_request=pr, approver=user, level=pr.current_level, action=models.Approval.ACTION_REJECTED, comment=reason)
+        pr.status = models.PurchaseRequest.STATUS_REJECTED
+        pr.save(update_fields=['status', 'updated_at'])
+        outbox.enqueue_decision(pr, models.OutboxEvent.EVENT_PR_REJECTED, user, reason)
+        audit.record_request(pr, models.AuditEvent.ACTION_REJECTED, user, {
+            'status': [models.PurchaseRequest.STATUS_PENDING, pr.status], 'level': pr.current_level, 'comment': reason,
+        })
+        latency.record(pr, approval, final=True)
+    return pr
@@ -16,11 +16,29 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from django.views.decorators.csrf import csrf_exempt
+
+
+def lazy_schema_view(name, **initkwargs):
+    """drf_spectacular's views pull in the schema generator, yaml and friends;
+    import them on the first docs request instead of at worker boot."""
+    view = None
+
+    @csrf_exempt
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            from drf_spectacular import views
+
+            view = getattr(views, name).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('api/schema/', lazy_schema_view('SpectacularAPIView'), name='schema'),
+    path('api/docs/', lazy_schema_view('SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
     path('api/', include('p2p.urls')),
 ]